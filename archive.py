@@ -0,0 +1,247 @@
+import datetime
+import gzip
+import json
+import os
+import time
+import zlib
+
+import numpy as np
+
+from loader import CsvSession, parse_block
+from samples import sample_row
+from storage import CSV_HEADER, SAMPLE_DTYPE, write_json
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = ".manifest.json"
+
+# Segment file suffix per compression
+COMPRESSIONS = {"gzip": ".csv.gz", "zstd": ".csv.zst"}
+DEFAULT_COMPRESSION = "gzip"
+
+# A segment is closed after this much CSV text (uncompressed, so a range
+# read never decompresses more than this per segment) or this many seconds
+SEGMENT_BYTES = 4 * 1024 * 1024
+SEGMENT_SECONDS = 3600
+
+# Buffered rows are compressed and flushed through to disk this often, and
+# the manifest rewritten; a crash loses at most the last interval
+FLUSH_INTERVAL = 5.0
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def manifest_path(directory, prefix):
+    return os.path.join(directory, prefix + MANIFEST_SUFFIX)
+
+
+def open_compressed(path, compression, level=None):
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package (pip install zstandard)")
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        return compressor.stream_writer(open(path, 'wb'))
+    if compression == "gzip":
+        return gzip.open(path, 'wb', compresslevel=6 if level is None else level)
+    raise ValueError(f"Unknown compression {compression}")
+
+
+def flush_compressed(file):
+    # Ends the current compressed block so everything written so far can
+    # be decompressed from disk
+    if zstandard is not None and isinstance(file, zstandard.ZstdCompressionWriter):
+        file.flush(zstandard.FLUSH_BLOCK)
+    else:
+        file.flush()
+
+
+def read_compressed(path, compression):
+    # Whole decompressed content. A segment cut short by a crash (no end of
+    # stream yet) yields what was flushed; a torn last line is dropped.
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package (pip install zstandard)")
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        errors = zstandard.ZstdError
+    else:
+        decompressor = zlib.decompressobj(wbits=31)
+        errors = zlib.error
+    parts = []
+    with open(path, 'rb') as file:
+        while True:
+            chunk = file.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            try:
+                parts.append(decompressor.decompress(chunk))
+            except errors:
+                break
+    data = b"".join(parts)
+    return data[:data.rfind(b"\n") + 1]
+
+
+class ArchiveWriter:
+    # Streams samples into compressed CSV segments
+    # (<prefix>_<part>.csv.gz or .csv.zst, readable with zcat / zstdcat),
+    # starting a new segment after max_bytes of CSV text or max_seconds.
+    # <prefix>.manifest.json lists every segment with its row count, Index
+    # range and time span, so a time range is read by decompressing only the
+    # segments it overlaps. Same interface as RotatingSessionWriter.
+    def __init__(self, directory, prefix=None, max_bytes=SEGMENT_BYTES, max_seconds=SEGMENT_SECONDS,
+                 compression=DEFAULT_COMPRESSION, level=None, flush_interval=FLUSH_INTERVAL, metrics=None):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package (pip install zstandard)")
+        os.makedirs(directory, exist_ok=True)
+        if prefix is None:
+            prefix = f"archive_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        self.directory = directory
+        self.prefix = prefix
+        self.manifest_path = manifest_path(directory, prefix)
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.compression = compression
+        self.level = level
+        self.flush_interval = flush_interval
+        self.metrics = metrics
+        self.segments = []
+        self.file = None
+        self.filename = None
+        self.data_count = 0
+        self.open_next()
+
+    def open_next(self):
+        self.close_segment()
+        name = f"{self.prefix}_{len(self.segments) + 1:04d}{COMPRESSIONS[self.compression]}"
+        self.filename = os.path.join(self.directory, name)
+        self.file = open_compressed(self.filename, self.compression, self.level)
+        self.pending = [",".join(CSV_HEADER)]
+        self.segment = {"file": name, "rows": 0, "first_index": None, "last_index": None,
+                        "start_time": None, "end_time": None, "bytes": 0, "raw_bytes": 0, "closed": False}
+        self.segments.append(self.segment)
+        self.opened_at = self.last_flush = time.monotonic()
+
+    def should_rotate(self):
+        if self.max_bytes and self.segment["raw_bytes"] >= self.max_bytes:
+            return True
+        return bool(self.max_seconds) and time.monotonic() - self.opened_at >= self.max_seconds
+
+    def add_sample(self, sample):
+        if self.segment["rows"] and self.should_rotate():
+            self.open_next()
+        start = time.perf_counter()
+        line = ",".join(sample_row(sample))
+        self.pending.append(line)
+        segment = self.segment
+        segment["raw_bytes"] += len(line) + 1
+        sample_time = float(sample.time)
+        if not segment["rows"]:
+            segment["first_index"] = int(sample.index)
+            segment["start_time"] = segment["end_time"] = sample_time
+        segment["rows"] += 1
+        segment["last_index"] = int(sample.index)
+        # Start and end are the span of the segment's times: a board reset
+        # starts its clock again within a segment
+        if sample_time < segment["start_time"]:
+            segment["start_time"] = sample_time
+        elif sample_time > segment["end_time"]:
+            segment["end_time"] = sample_time
+        self.data_count += 1
+        self.flush_if_due()
+        if self.metrics:
+            self.metrics.stages["write"].observe(time.perf_counter() - start)
+
+    def write_pending(self):
+        if self.pending:
+            self.pending.append("")
+            self.file.write("\n".join(self.pending).encode('utf-8'))
+            self.pending = []
+
+    def flush_if_due(self):
+        # Called on every sample and, when the board goes quiet, by the owner
+        # on its own clock (ThreadedSink, capture loop)
+        if self.pending and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.file:
+            self.write_pending()
+            flush_compressed(self.file)
+            self.segment["bytes"] = os.path.getsize(self.filename)
+            self.last_flush = time.monotonic()
+            self.write_manifest()
+
+    def close_segment(self):
+        if self.file:
+            self.write_pending()
+            self.file.close()
+            self.file = None
+            self.segment["bytes"] = os.path.getsize(self.filename)
+            self.segment["closed"] = True
+            self.write_manifest()
+
+    def write_manifest(self):
+        write_json(self.manifest_path, {"version": MANIFEST_VERSION, "compression": self.compression,
+                                        "header": CSV_HEADER, "segments": self.segments})
+
+    def close(self):
+        self.close_segment()
+
+
+class ArchiveSession:
+    # Reads an archive through its manifest; same interface as CsvSession
+    def __init__(self, path):
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path))
+        with open(path) as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"{path}: unsupported archive manifest version {manifest.get('version')}")
+        self.compression = manifest["compression"]
+        self.segments = [segment for segment in manifest["segments"] if segment["rows"]]
+        self.rows = sum(segment["rows"] for segment in self.segments)
+
+    def time_span(self):
+        if not self.segments:
+            return None
+        return (min(segment["start_time"] for segment in self.segments),
+                max(segment["end_time"] for segment in self.segments))
+
+    def read_segment(self, segment):
+        return parse_block(read_compressed(os.path.join(self.directory, segment["file"]), self.compression))
+
+    def load(self, start_time=None, end_time=None, progress=None):
+        # Records with start_time <= time <= end_time (None: open-ended)
+        low = -np.inf if start_time is None else start_time
+        high = np.inf if end_time is None else end_time
+        selected = [segment for segment in self.segments
+                    if segment["end_time"] >= low and segment["start_time"] <= high]
+        total = sum(segment["raw_bytes"] for segment in selected)
+        done = 0
+        parts = []
+        for segment in selected:
+            records = self.read_segment(segment)
+            if start_time is not None or end_time is not None:
+                times = records["time"]
+                records = records[(times >= low) & (times <= high)]
+            if len(records):
+                parts.append(records)
+            done += segment["raw_bytes"]
+            if progress:
+                progress(done / total if total else 1.0)
+        if not parts:
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+        return np.concatenate(parts)
+
+
+def open_recording(path):
+    # An archive manifest or a plain session CSV
+    if path.endswith(MANIFEST_SUFFIX):
+        return ArchiveSession(path)
+    return CsvSession(path)
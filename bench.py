@@ -0,0 +1,854 @@
+import argparse
+import csv
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import serial
+
+import archive
+from loader import CsvSession
+from rawlog import RawLogWriter, read_raw_log, replay_url
+from samples import Sample, SampleParser
+from serial_io import FrameDecoder, LineReader, PortMultiplexer, encode_sample_frame
+from storage import DEFAULT_WRITE_POLICY, SAMPLE_DTYPE, WRITE_POLICIES, DataManager, RotatingSessionWriter, RowWriter, SessionStore
+
+
+SAMPLE_BLOCK = (
+    "Index:         {index}\r\n"
+    "Relative time: {time:.2f} s\r\n"
+    "Bus Voltage:   5.02 V\r\n"
+    "Shunt Voltage: 1.27 mV\r\n"
+    "Load Voltage:  5.02 V\r\n"
+    "Current:       12.70 mA\r\n"
+    "Power:         63.00 mW\r\n"
+    "Data -> {index},{time:6.2f}, 5.02, 1.27, 5.02,12.70,63.00\r\n"
+    "Write successful\r\n"
+    "------------------------------\r\n"
+)
+
+
+def sample_block(index, rate):
+    return SAMPLE_BLOCK.format(index=index, time=index / rate if rate else 0.0).encode()
+
+
+def open_pty_pair():
+    master, slave = os.openpty()
+    port = serial.Serial(os.ttyname(slave), 115200, timeout=0.1)
+    return master, slave, port
+
+
+def feed_pty(master, rate, stop_event):
+    # rate == 0 leaves the line idle, rate < 0 writes as fast as the pty allows
+    index = 1
+    next_time = time.perf_counter()
+    while not stop_event.is_set():
+        if rate == 0:
+            stop_event.wait(0.1)
+            continue
+        os.write(master, sample_block(index, abs(rate)))
+        index += 1
+        if rate > 0:
+            next_time += 1.0 / rate
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                stop_event.wait(delay)
+
+
+def legacy_read_loop(port, stop_event, on_line):
+    while not stop_event.is_set():
+        if port.in_waiting > 0:
+            line = port.readline().decode('utf-8', errors='ignore').strip()
+            on_line(line)
+
+
+def line_reader_loop(port, stop_event, on_line):
+    reader = LineReader(port)
+    while not stop_event.is_set():
+        for line in reader.read_lines():
+            on_line(line)
+
+
+def run_reader(loop, rate, duration):
+    master, slave, port = open_pty_pair()
+    stop_reading = threading.Event()
+    stop_writing = threading.Event()
+    count = [0]
+
+    def on_line(line):
+        count[0] += 1
+
+    reader = threading.Thread(target=loop, args=(port, stop_reading, on_line))
+    writer = threading.Thread(target=feed_pty, args=(master, rate, stop_writing))
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    reader.start()
+    writer.start()
+    time.sleep(duration)
+    # Stop the writer first so it never blocks on a full pty nobody drains
+    stop_writing.set()
+    writer.join()
+    stop_reading.set()
+    reader.join()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    port.close()
+    os.close(master)
+    os.close(slave)
+    return count[0] / wall, 100.0 * cpu / wall
+
+
+def bench_reader(args):
+    loops = [("legacy in_waiting loop", legacy_read_loop), ("LineReader", line_reader_loop)]
+    print(f"{'engine':<24}{'rate (samples/s)':>18}{'lines/s':>12}{'CPU %':>9}")
+    for rate in args.rates:
+        for name, loop in loops:
+            lines_per_s, cpu = run_reader(loop, rate, args.duration)
+            label = "max" if rate < 0 else str(rate)
+            print(f"{name:<24}{label:>18}{lines_per_s:>12.0f}{cpu:>9.1f}")
+
+
+def feed_ptys(masters, rate, stop_event):
+    # rate samples/s per board; the boards are out of phase, like real ones
+    step = 1.0 / (rate * len(masters))
+    start = time.perf_counter()
+    event = 0
+    while not stop_event.is_set():
+        os.write(masters[event % len(masters)], sample_block(event // len(masters) + 1, rate))
+        event += 1
+        delay = start + event * step - time.perf_counter()
+        if delay > 0:
+            stop_event.wait(delay)
+
+
+def threads_read(ports, stop_event, counts, cpu):
+    def loop(position, port):
+        reader = LineReader(port)
+        while not stop_event.is_set():
+            counts[position] += len(reader.read_lines())
+        cpu.append(time.thread_time())
+
+    threads = [threading.Thread(target=loop, args=(position, port)) for position, port in enumerate(ports)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def multiplexer_read(ports, stop_event, counts, cpu):
+    def loop():
+        multiplexer = PortMultiplexer()
+        for position, port in enumerate(ports):
+            port.timeout = 0
+            multiplexer.add(position, port)
+        while not stop_event.is_set():
+            for position, items in multiplexer.read(0.1).items():
+                counts[position] += len(items)
+        cpu.append(time.thread_time())
+
+    thread = threading.Thread(target=loop)
+    thread.start()
+    return [thread]
+
+
+def run_multi(engine, devices, rate, duration):
+    pairs = [open_pty_pair() for _ in range(devices)]
+    stop_reading = threading.Event()
+    stop_writing = threading.Event()
+    counts = [0] * devices
+    cpu = []
+    readers = engine([port for _, _, port in pairs], stop_reading, counts, cpu)
+    writer = threading.Thread(target=feed_ptys, args=([master for master, _, _ in pairs], rate, stop_writing))
+    wall_start = time.perf_counter()
+    writer.start()
+    time.sleep(duration)
+    stop_writing.set()
+    writer.join()
+    time.sleep(0.2)
+    stop_reading.set()
+    for reader in readers:
+        reader.join()
+    wall = time.perf_counter() - wall_start
+    for master, slave, port in pairs:
+        port.close()
+        os.close(master)
+        os.close(slave)
+    return sum(counts) / wall, 100.0 * sum(cpu) / wall
+
+
+def bench_multi(args):
+    # CPU is the reader threads' own time (time.thread_time), so the feeder
+    # running in the same process does not count.
+    engines = [("thread per port", threads_read), ("PortMultiplexer", multiplexer_read)]
+    print(f"{'engine':<18}{'devices':>8}{'rate/dev':>10}{'lines/s':>10}{'reader CPU %':>14}")
+    for devices in args.devices:
+        for name, engine in engines:
+            lines_per_s, cpu = run_multi(engine, devices, args.rate, args.duration)
+            print(f"{name:<18}{devices:>8}{args.rate:>10}{lines_per_s:>10.0f}{cpu:>14.1f}")
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def bench_writer(args):
+    # The CSV writer alone, as the pipeline calls it: the write policy is
+    # all that differs between the rows
+    sample = Sample(1, 0.10, 5.02, 1.27, 5.02, 12.70, 63.00)
+    print(f"{'policy':<18}{'rows/s':>12}{'p50 us':>10}{'p99 us':>10}{'max us':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, policy in WRITE_POLICIES.items():
+            with open(os.path.join(directory, "session.csv"), "w", newline="", encoding="utf-8") as csv_file:
+                writer = RowWriter(csv_file, policy)
+                latencies = []
+                start = time.perf_counter()
+                for _ in range(args.rows):
+                    t0 = time.perf_counter()
+                    writer.add_sample(sample)
+                    latencies.append((time.perf_counter() - t0) * 1e6)
+                writer.flush()
+                elapsed = time.perf_counter() - start
+                writer.close()
+            print(f"{name:<18}{args.rows / elapsed:>12.0f}{percentile(latencies, 0.5):>10.1f}"
+                  f"{percentile(latencies, 0.99):>10.1f}{max(latencies):>10.0f}")
+
+
+def bench_store(args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "session.ina")
+        rows = np.zeros(args.records, dtype=SAMPLE_DTYPE)
+        rows["index"] = np.arange(1, args.records + 1)
+        rows["time"] = rows["index"] * 0.01
+        rows["bus_voltage"] = 5.0
+        rows["current"] = np.random.random(args.records) * 100
+
+        start = time.perf_counter()
+        store = SessionStore(path)
+        store.extend(rows)
+        store.close()
+        print(f"write {args.records} records: {time.perf_counter() - start:.3f} s")
+
+        start = time.perf_counter()
+        store = SessionStore(path, mode="r")
+        opened = time.perf_counter() - start
+        # Board resets come from the runs file, not from a scan of the store
+        start = time.perf_counter()
+        store.runs()
+        scanned = time.perf_counter() - start
+        start = time.perf_counter()
+        window = store.time_range(args.records * 0.005, args.records * 0.005 + 60)
+        mean_current = float(window["current"].mean())
+        queried = time.perf_counter() - start
+        print(f"reopen: {opened * 1000:.2f} ms, board resets: {scanned * 1000:.2f} ms, 60 s time range "
+              f"({len(window)} records, mean current {mean_current:.1f} mA): {queried * 1000:.2f} ms")
+
+        csv_path = os.path.join(directory, "session.csv")
+        csv_records = min(args.records, args.csv_records)
+        store.export_csv(csv_path, 0, csv_records)
+        store.close()
+        start = time.perf_counter()
+        with open(csv_path, newline="") as csv_file:
+            reader = csv.reader(csv_file)
+            next(reader)
+            parsed = [[float(value) for value in row] for row in reader]
+        parse_time = time.perf_counter() - start
+        print(f"CSV re-parse of {len(parsed)} rows: {parse_time:.3f} s "
+              f"(~{parse_time * args.records / len(parsed):.1f} s for {args.records})")
+
+
+def bench_load(args):
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "session.csv")
+        rows = np.zeros(args.records, dtype=SAMPLE_DTYPE)
+        rows["index"] = np.arange(1, args.records + 1)
+        rows["time"] = rows["index"] * 0.01
+        rows["bus_voltage"] = 5.0
+        rows["current"] = np.random.random(args.records) * 100
+        store = SessionStore(os.path.join(directory, "session.ina"))
+        store.extend(rows)
+        store.export_csv(csv_path)
+        store.close()
+        size = os.path.getsize(csv_path) / 1e6
+
+        start = time.perf_counter()
+        with open(csv_path, newline="") as csv_file:
+            reader = csv.reader(csv_file)
+            next(reader)
+            parsed = [[float(value) for value in row] for row in reader]
+        print(f"csv.reader, {len(parsed)} rows ({size:.0f} MB): {time.perf_counter() - start:.3f} s")
+        del parsed
+
+        start = time.perf_counter()
+        records = CsvSession(csv_path).load()
+        print(f"first open (parse + build index): {time.perf_counter() - start:.3f} s, {len(records)} rows")
+        start = time.perf_counter()
+        session = CsvSession(csv_path)
+        records = session.load()
+        print(f"reopen, whole session: {time.perf_counter() - start:.3f} s ({len(session.blocks)} index blocks)")
+        middle = args.records * 0.005
+        start = time.perf_counter()
+        window = CsvSession(csv_path).load(middle, middle + 60)
+        print(f"reopen, 60 s time range ({len(window)} rows): {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+def bench_sinks(args):
+    # Cost per sample on the producer's thread of DataManager's pipeline
+    # (CSV, store, stats) as sinks are attached to it
+    from pipeline import ThreadedSink
+    from simulator import VirtualINA219
+    device = VirtualINA219(seed=1)
+    samples = [Sample(index, index / 100, *device.measure()) for index in range(1, args.records + 1)]
+
+    class NullSink:
+        def add_sample(self, sample):
+            pass
+
+    with tempfile.TemporaryDirectory() as directory:
+        setups = [
+            ("csv + store + stats", lambda manager: None),
+            ("+ null sink", lambda manager: manager.pipeline.attach("null", NullSink())),
+            ("+ threaded archive", lambda manager: manager.pipeline.attach(
+                "archive", ThreadedSink(archive.ArchiveWriter(directory, f"sinks_{len(os.listdir(directory))}")))),
+        ]
+        print(f"{'sinks':<22}{'us/sample':>10}{'total us':>10}")
+        for name, attach in setups:
+            manager = DataManager(WRITE_POLICIES[args.policy])
+            attach(manager)
+            start = time.perf_counter()
+            for sample in samples:
+                manager.add_sample(sample)
+            produced = time.perf_counter() - start
+            for sink in manager.pipeline.sinks.values():
+                if isinstance(sink, ThreadedSink):
+                    sink.close()
+            manager.writer.flush()
+            total = time.perf_counter() - start
+            print(f"{name:<22}{produced / args.records * 1e6:>10.2f}{total / args.records * 1e6:>10.2f}")
+            del manager
+
+
+def bench_archive(args):
+    from simulator import VirtualINA219
+    device = VirtualINA219(rate=args.rate, seed=1)
+    samples = []
+    for index in range(1, args.records + 1):
+        # Two decimals, as the firmware prints them
+        values = [round(value, 2) for value in device.measure()]
+        samples.append(Sample(index, round(index / args.rate, 2), *values))
+    duration = args.records / args.rate
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        writer = RotatingSessionWriter(os.path.join(directory, "csv"))
+        for sample in samples:
+            writer.add_sample(sample)
+        writer.close()
+        csv_size = os.path.getsize(writer.filename)
+        print(f"{args.records} samples ({duration / 3600:.1f} h at {args.rate:g} Hz)")
+        print(f"{'format':>8}  {'MB':>7}  {'ratio':>5}  {'us/sample':>9}  {'segments':>8}  {'60 s range ms':>13}")
+        print(f"{'csv':>8}  {csv_size / 1e6:7.2f}  {1:5.1f}  "
+              f"{(time.perf_counter() - start) / args.records * 1e6:9.2f}  {1:8d}  {'-':>13}")
+
+        for compression in args.compressions:
+            if compression == "zstd" and archive.zstandard is None:
+                print(f"{compression:>8}  skipped: zstandard is not installed")
+                continue
+            target = os.path.join(directory, compression)
+            start = time.perf_counter()
+            writer = archive.ArchiveWriter(target, "bench", max_seconds=None, compression=compression,
+                                           max_bytes=int(args.segment_mb * 1024 * 1024))
+            for sample in samples:
+                writer.add_sample(sample)
+            writer.close()
+            elapsed = time.perf_counter() - start
+            size = sum(segment["bytes"] for segment in writer.segments)
+            middle = duration / 2
+            start = time.perf_counter()
+            window = archive.ArchiveSession(writer.manifest_path).load(middle, middle + 60)
+            range_ms = (time.perf_counter() - start) * 1000
+            print(f"{compression:>8}  {size / 1e6:7.2f}  {csv_size / size:5.1f}  "
+                  f"{elapsed / args.records * 1e6:9.2f}  {len(writer.segments):8d}  {range_ms:13.1f}  "
+                  f"({len(window)} rows)")
+
+
+def synthetic_lines(samples):
+    text = b"".join(sample_block(index, 100) for index in range(1, samples + 1))
+    return text.decode().splitlines()
+
+
+def legacy_parse(lines):
+    count = 0
+    for line in lines:
+        if "Data ->" in line:
+            values = line.split("Data ->")[-1].strip().split(",")
+            if len(values) >= 5:
+                float(values[0]), float(values[1])
+                count += 1
+    return count
+
+
+def sample_parse(lines):
+    parser = SampleParser()
+    count = 0
+    for line in lines:
+        if parser.feed(line):
+            count += 1
+    return count
+
+
+def bench_parser(args):
+    lines = synthetic_lines(args.samples)
+    print(f"{'parser':<16}{'lines/s':>12}{'samples/s':>12}")
+    for name, parse in (("legacy split", legacy_parse), ("SampleParser", sample_parse)):
+        start = time.perf_counter()
+        samples = parse(lines)
+        elapsed = time.perf_counter() - start
+        assert samples == args.samples, f"{name} parsed {samples} of {args.samples} samples"
+        print(f"{name:<16}{len(lines) / elapsed:>12.0f}{samples / elapsed:>12.0f}")
+
+
+def bench_decoder(args):
+    # Mixed stream as the firmware sends it after "B": a few text lines, then
+    # frames, with every 97th frame corrupted to exercise resync.
+    expected = []
+    chunks = [b"Starting up!\r\nINA219 initialized.\r\nBinary mode\r\n"]
+    for index in range(1, args.samples + 1):
+        sample = Sample(float(index), index * 0.01, 5.02, 1.27, 5.02, 12.7, 63.0)
+        frame = encode_sample_frame(sample)
+        if index % 97 == 0:
+            frame = frame[:8] + bytes([frame[8] ^ 0xFF]) + frame[9:]
+        else:
+            expected.append(index)
+        chunks.append(frame)
+        if index % 1000 == 0:
+            chunks.append(b"New delay: 5\r\n")
+    stream = b"".join(chunks)
+
+    decoder = FrameDecoder()
+    start = time.perf_counter()
+    items = []
+    for offset in range(0, len(stream), 512):
+        items.extend(decoder.feed(stream[offset:offset + 512]))
+    elapsed = time.perf_counter() - start
+    decoded = [int(item.index) for item in items if isinstance(item, Sample)]
+    assert decoded == expected, "decoder lost or reordered frames"
+    assert "Starting up!" in items and "New delay: 5" in items
+
+    text_size = len(sample_block(1, 100))
+    frame_size = len(encode_sample_frame(Sample(1.0, 0.01, 5.02, 1.27, 5.02, 12.7, 63.0)))
+    print(f"decoded {len(decoded)} frames ({decoder.errors} corrupt skipped) at {len(decoded) / elapsed:.0f} samples/s")
+    bytes_per_second = args.baudrate / 10
+    print(f"text block: {text_size} B/sample -> {bytes_per_second / text_size:.0f} samples/s max at {args.baudrate} baud")
+    print(f"binary frame: {frame_size} B/sample -> {bytes_per_second / frame_size:.0f} samples/s max "
+          f"({text_size / frame_size:.1f}x)")
+
+
+def run_e2e(app, rate, binary, args):
+    import gui
+    from PyQt5.QtCore import QTimer
+    from simulator import PtyTransport, Simulator, SocketTransport, VirtualINA219
+
+    transport = PtyTransport() if args.transport == "pty" else SocketTransport()
+    simulator = Simulator(VirtualINA219(rate=rate, binary=binary, seed=1), transport).start()
+
+    window = gui.SerialMonitor(lazy_plot=False)
+    window.port_scanner.wait()
+    app.processEvents()
+    window.auto_save_checkbox.setChecked(False)
+    window.batch_rate_combo.setCurrentText(args.batch)
+    window.port_combo.addItem(simulator.port, simulator.port)
+    window.port_combo.setCurrentIndex(window.port_combo.count() - 1)
+
+    # Latency is measured from the moment the simulator wrote a sample's
+    # bytes to the moment the GUI thread stored it (disk) and to the first
+    # rendered frame that includes it (plot).
+    lines = [0]
+    disk_latency = []
+    plot_latency = []
+    pending = []
+    handle_lines = window.handle_lines
+    record_sample = window.record_sample
+    canvas = window.plot_canvas
+    render_frame = canvas.render_frame
+
+    def timed_handle_lines(batch, *args, **kwargs):
+        lines[0] += len(batch)
+        handle_lines(batch, *args, **kwargs)
+
+    def timed_record_sample(sample, *args, **kwargs):
+        record_sample(sample, *args, **kwargs)
+        sent = simulator.sent_times.get(int(sample.index))
+        if sent is not None:
+            disk_latency.append(time.perf_counter() - sent)
+            pending.append(sent)
+
+    def timed_render_frame():
+        dirty = canvas.dirty
+        render_frame()
+        if dirty and pending:
+            now = time.perf_counter()
+            plot_latency.extend(now - sent for sent in pending)
+            pending.clear()
+
+    window.handle_data = lambda line: timed_handle_lines([line])
+    window.handle_lines = timed_handle_lines
+    window.record_sample = timed_record_sample
+    canvas.render_timer.timeout.disconnect()
+    canvas.render_timer.timeout.connect(timed_render_frame)
+
+    window.start_reading()
+    start = time.perf_counter()
+    QTimer.singleShot(int(args.duration * 1000), app.quit)
+    app.exec_()
+    elapsed = time.perf_counter() - start
+    window.stop_reading()
+    simulator.stop()
+    window.deleteLater()
+    return lines[0] / elapsed, len(disk_latency) / elapsed, disk_latency, plot_latency
+
+
+def write_synthetic_raw_log(path, samples, rate, binary):
+    # One chunk per sample, arriving at `rate` samples per second
+    writer = RawLogWriter(path)
+    for index in range(1, samples + 1):
+        if binary:
+            chunk = encode_sample_frame(Sample(index, index / rate, 5.02, 1.27, 5.02, 12.70, 63.00))
+        else:
+            chunk = sample_block(index, rate)
+        writer.write(chunk, arrival=(index - 1) / rate)
+    writer.close()
+
+
+def run_replay(app, url, args):
+    import cProfile
+    import gui
+
+    window = gui.SerialMonitor(lazy_plot=False)
+    window.port_scanner.wait()
+    app.processEvents()
+    window.auto_save_checkbox.setChecked(False)
+    window.batch_rate_combo.setCurrentText(args.batch)
+    window.port_combo.setEditText(url)
+
+    profiler = cProfile.Profile() if args.profile else None
+    start = time.perf_counter()
+    window.start_reading()
+    window.serial_thread.finished.connect(app.quit)
+    if profiler:
+        profiler.enable()
+    if not window.serial_thread.isFinished():
+        app.exec_()
+    app.processEvents()
+    # Handles whatever the reader queued after its last wake-up
+    window.stop_reading()
+    if profiler:
+        profiler.disable()
+    elapsed = time.perf_counter() - start
+    samples = window.data_manager.data_count
+    window.deleteLater()
+    return elapsed, samples, profiler
+
+
+def bench_replay(args):
+    import pstats
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.log
+        if not path:
+            path = os.path.join(directory, "synthetic.rawlog")
+            write_synthetic_raw_log(path, args.samples, args.rate, args.binary)
+        recorded = 0.0
+        size = 0
+        for arrival, chunk in read_raw_log(path):
+            recorded = arrival
+            size += len(chunk)
+        print(f"{path}: {size / 1e6:.2f} MB over {recorded:.1f} s")
+
+        print(f"{'speed':>7}{'wall s':>9}{'expected s':>12}{'samples':>9}{'samples/s':>11}")
+        for speed in args.speeds:
+            factor = None if speed == "max" else float(speed)
+            elapsed, samples, profiler = run_replay(app, replay_url(path, factor), args)
+            expected = f"{recorded / factor:.2f}" if factor else "-"
+            print(f"{speed:>7}{elapsed:>9.2f}{expected:>12}{samples:>9}{samples / elapsed:>11.0f}")
+            if profiler:
+                # GUI thread only: parsing, storage, console and plot
+                pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+
+
+def bench_e2e(args):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+
+    def ms(values, fraction):
+        return percentile(values, fraction) * 1000 if values else float("nan")
+
+    print(f"{'rate':>7}{'mode':>8}{'lines/s':>10}{'samples/s':>11}"
+          f"{'disk p50':>10}{'disk p99':>10}{'plot p50':>10}{'plot p99':>10}  (ms)")
+    for rate in args.rates:
+        for mode in args.modes:
+            lines_per_s, samples_per_s, disk, plot = run_e2e(app, rate, mode == "binary", args)
+            print(f"{rate:>7g}{mode:>8}{lines_per_s:>10.0f}{samples_per_s:>11.0f}"
+                  f"{ms(disk, 0.5):>10.2f}{ms(disk, 0.99):>10.2f}{ms(plot, 0.5):>10.2f}{ms(plot, 0.99):>10.2f}")
+
+
+def startup_probe(args):
+    # Runs in a fresh interpreter: times the gui import, window construction,
+    # the first paint of the main window and the moment the plot is usable.
+    start = time.perf_counter()
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    import gui
+    from PyQt5.QtCore import QEvent, QObject, QTimer
+    from PyQt5.QtWidgets import QApplication
+    imported = time.perf_counter()
+
+    app = QApplication(sys.argv[:1])
+    window = gui.SerialMonitor(lazy_plot=not args.eager)
+    constructed = time.perf_counter()
+    times = {"import": imported - start, "construct": constructed - imported}
+
+    class PaintWatcher(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and "first_paint" not in times:
+                times["first_paint"] = time.perf_counter() - start
+            return False
+
+    watcher = PaintWatcher()
+    window.installEventFilter(watcher)
+    window.show()
+
+    def check_ready():
+        if "first_paint" in times and window.plot_canvas is not None:
+            times["plot_ready"] = time.perf_counter() - start
+            app.quit()
+        else:
+            QTimer.singleShot(1, check_ready)
+
+    QTimer.singleShot(0, check_ready)
+    app.exec_()
+    if window.port_scanner:
+        window.port_scanner.wait()
+    print(json.dumps(times))
+
+
+def bench_startup(args):
+    print(f"{'mode':<8}{'process':>10}{'import':>10}{'construct':>11}{'1st paint':>11}{'plot ready':>12}  (ms, median of {args.runs})")
+    for mode in ("eager", "lazy"):
+        runs = []
+        for _ in range(args.runs):
+            command = [sys.executable, os.path.abspath(__file__), "startup-probe"] + (["--eager"] if mode == "eager" else [])
+            start = time.perf_counter()
+            output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            result["process"] = time.perf_counter() - start
+            runs.append(result)
+
+        def median(key):
+            return statistics.median(run[key] for run in runs) * 1000
+
+        print(f"{mode:<8}{median('process'):>10.0f}{median('import'):>10.0f}{median('construct'):>11.0f}"
+              f"{median('first_paint'):>11.0f}{median('plot_ready'):>12.0f}")
+
+
+def bench_console(args):
+    # Lines arrive at a fixed rate, args.batch per handle_lines() call; the
+    # Qt event loop runs in between. Reports the line rate the console kept
+    # up with and the main-thread CPU it took.
+    from PyQt5.QtGui import QTextCursor
+    from PyQt5.QtWidgets import QApplication, QTextEdit
+    app = QApplication.instance() or QApplication([])
+    import gui
+
+    def legacy_append(box, lines):
+        # The QTextEdit console before ConsoleView: trim 100 lines past the limit
+        if box.document().lineCount() > args.max_lines:
+            cursor = box.textCursor()
+            cursor.movePosition(QTextCursor.Start)
+            cursor.movePosition(QTextCursor.Down, QTextCursor.KeepAnchor, 100)
+            cursor.removeSelectedText()
+        box.append("\n".join(lines))
+        box.moveCursor(QTextCursor.End)
+
+    consoles = (("QTextEdit", QTextEdit, legacy_append),
+                ("ConsoleView", lambda: gui.ConsoleView(args.max_lines), lambda box, lines: box.append_lines(lines)))
+    print(f"{'console':<14}{'rate':>8}{'achieved':>10}{'CPU %':>8}")
+    for rate in args.rates:
+        for name, make, append in consoles:
+            box = make()
+            box.resize(600, 400)
+            box.show()
+            index = 0
+            start = time.perf_counter()
+            cpu_start = time.process_time()
+            while time.perf_counter() - start < args.duration:
+                lines = [f"Data -> {index + offset},{(index + offset) * 0.01:6.2f}, 5.02, 1.27, 5.02,12.70,63.00"
+                         for offset in range(args.batch)]
+                append(box, lines)
+                index += args.batch
+                app.processEvents()
+                delay = start + index / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            elapsed = time.perf_counter() - start
+            cpu = (time.process_time() - cpu_start) / elapsed * 100
+            print(f"{name:<14}{rate:>8}{index / elapsed:>10.0f}{cpu:>8.1f}")
+            box.close()
+
+
+def bench_plot(args):
+    # Samples arrive at a fixed rate, one batch per frame (the GUI's 60 Hz
+    # batch rate) while the canvas renders on its own timer. Reports the frame rate
+    # reached, the mean cost of a frame and the main-thread CPU.
+    from PyQt5.QtWidgets import QApplication
+    from simulator import VirtualINA219
+    app = QApplication.instance() or QApplication([])
+    from metrics import PipelineMetrics
+    from plotcanvas import LivePlotCanvas
+    from plotpainter import StackedPlotCanvas
+
+    engines = {"matplotlib": LivePlotCanvas, "qpainter": StackedPlotCanvas}
+    device = VirtualINA219(seed=1)
+    print(f"{'engine':<12}{'rate':>8}{'points':>9}{'FPS':>6}{'frame ms':>10}{'CPU %':>8}")
+    for rate in args.rates:
+        for points in args.points:
+            for name in args.engines:
+                canvas = engines[name](max_points=None if points == "All" else int(points), max_fps=args.fps)
+                canvas.metrics = PipelineMetrics()
+                canvas.resize(900, 600)
+                canvas.show()
+                app.processEvents()
+                index = 0
+                start = time.perf_counter()
+                cpu_start = time.process_time()
+                while time.perf_counter() - start < args.duration:
+                    batch = max(1, int(rate / args.fps))
+                    for _ in range(batch):
+                        index += 1
+                        canvas.add_sample(Sample(index, index / rate, *device.measure()))
+                    canvas.redraw()
+                    deadline = start + index / rate
+                    while True:
+                        app.processEvents()
+                        delay = deadline - time.perf_counter()
+                        if delay <= 0:
+                            break
+                        time.sleep(min(delay, 0.002))
+                elapsed = time.perf_counter() - start
+                cpu = (time.process_time() - cpu_start) / elapsed * 100
+                render = canvas.metrics.stages["render"]
+                frame_ms = render.total / render.count * 1000 if render.count else 0.0
+                print(f"{name:<12}{rate:>8}{points:>9}{render.count / elapsed:>6.0f}{frame_ms:>10.2f}{cpu:>8.1f}")
+                canvas.render_timer.stop()
+                canvas.close()
+                canvas.deleteLater()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serial Monitor benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    reader_parser = subparsers.add_parser("reader", help="serial read engine: lines/s and CPU%% (Linux pty)")
+    reader_parser.add_argument("--rates", type=int, nargs="+", default=[0, 10, 100, -1],
+                               help="samples per second to feed; 0 = idle, -1 = unthrottled")
+    reader_parser.add_argument("--duration", type=float, default=3.0)
+    reader_parser.set_defaults(func=bench_reader)
+
+    writer_parser = subparsers.add_parser("writer", help="RowWriter: rows/s and latency per write policy")
+    writer_parser.add_argument("--rows", type=int, default=20000)
+    writer_parser.set_defaults(func=bench_writer)
+
+    store_parser = subparsers.add_parser("store", help="binary session store: reopen/query time vs CSV re-parse")
+    store_parser.add_argument("--records", type=int, default=10_000_000)
+    store_parser.add_argument("--csv-records", type=int, default=1_000_000)
+    store_parser.set_defaults(func=bench_store)
+
+    load_parser = subparsers.add_parser("load", help="recorded CSV session: indexed block loader vs csv.reader")
+    load_parser.add_argument("--records", type=int, default=1_000_000)
+    load_parser.set_defaults(func=bench_load)
+
+    sinks_parser = subparsers.add_parser("sinks", help="sample pipeline: cost per sample on the producer thread per attached sink")
+    sinks_parser.add_argument("--records", type=int, default=200_000)
+    sinks_parser.add_argument("--policy", choices=list(WRITE_POLICIES), default=DEFAULT_WRITE_POLICY)
+    sinks_parser.set_defaults(func=bench_sinks)
+
+    archive_parser = subparsers.add_parser("archive", help="compressed archive segments: size, write cost and range reads vs CSV")
+    archive_parser.add_argument("--records", type=int, default=1_000_000)
+    archive_parser.add_argument("--rate", type=float, default=100.0, help="samples per second")
+    archive_parser.add_argument("--segment-mb", type=float, default=archive.SEGMENT_BYTES / 1024 / 1024,
+                                help="CSV text per segment, MB")
+    archive_parser.add_argument("--compressions", nargs="+", choices=list(archive.COMPRESSIONS),
+                                default=list(archive.COMPRESSIONS))
+    archive_parser.set_defaults(func=bench_archive)
+
+    parser_parser = subparsers.add_parser("parser", help="sample block parser throughput on a synthetic stream")
+    parser_parser.add_argument("--samples", type=int, default=100000)
+    parser_parser.set_defaults(func=bench_parser)
+
+    decoder_parser = subparsers.add_parser("decoder", help="binary frame decoder: correctness and throughput vs text")
+    decoder_parser.add_argument("--samples", type=int, default=100000)
+    decoder_parser.add_argument("--baudrate", type=int, default=115200)
+    decoder_parser.set_defaults(func=bench_decoder)
+
+    multi_parser = subparsers.add_parser("multi", help="N boards on ptys: one PortMultiplexer thread vs a thread per port")
+    multi_parser.add_argument("--devices", type=int, nargs="+", default=[1, 4, 8, 16])
+    multi_parser.add_argument("--rate", type=int, default=50, help="samples per second per board")
+    multi_parser.add_argument("--duration", type=float, default=3.0)
+    multi_parser.set_defaults(func=bench_multi)
+
+    e2e_parser = subparsers.add_parser("e2e", help="simulated device -> SerialReader -> handle_data -> DataManager -> plot")
+    e2e_parser.add_argument("--rates", type=float, nargs="+", default=[10, 100, 500])
+    e2e_parser.add_argument("--modes", nargs="+", choices=["text", "binary"], default=["text", "binary"])
+    e2e_parser.add_argument("--transport", choices=["pty", "socket"], default="pty" if os.name == "posix" else "socket")
+    e2e_parser.add_argument("--batch", default="30 Hz", help="batch rate setting: Off, 10 Hz, 30 Hz or 60 Hz")
+    e2e_parser.add_argument("--duration", type=float, default=3.0)
+    e2e_parser.set_defaults(func=bench_e2e)
+
+    replay_parser = subparsers.add_parser("replay", help="raw capture log replayed through the GUI pipeline at N x or max speed")
+    replay_parser.add_argument("--log", help="raw capture log to replay (default: a synthetic one)")
+    replay_parser.add_argument("--samples", type=int, default=5000, help="samples in the synthetic log")
+    replay_parser.add_argument("--rate", type=float, default=100, help="samples per second in the synthetic log")
+    replay_parser.add_argument("--binary", action="store_true", help="synthetic log of binary frames instead of text")
+    replay_parser.add_argument("--speeds", nargs="+", default=["10", "max"], help="replay speed factors, or max")
+    replay_parser.add_argument("--batch", default="30 Hz", help="batch rate setting: Off, 10 Hz, 30 Hz or 60 Hz")
+    replay_parser.add_argument("--profile", action="store_true", help="cProfile the GUI thread during each replay")
+    replay_parser.set_defaults(func=bench_replay)
+
+    startup_parser = subparsers.add_parser("startup", help="cold start: import, first paint and plot-ready time")
+    startup_parser.add_argument("--runs", type=int, default=5)
+    startup_parser.set_defaults(func=bench_startup)
+
+    console_parser = subparsers.add_parser("console", help="console: line rate kept up with and CPU%% vs the QTextEdit console")
+    console_parser.add_argument("--rates", type=int, nargs="+", default=[100, 1000, 5000, 20000], help="lines per second")
+    console_parser.add_argument("--batch", type=int, default=1, help="lines per handle_lines() call (1 = batching off)")
+    console_parser.add_argument("--duration", type=float, default=3.0)
+    console_parser.add_argument("--max-lines", type=int, default=500)
+    console_parser.set_defaults(func=bench_console)
+
+    plot_parser = subparsers.add_parser("plot", help="plot engines: FPS, frame cost and CPU%% at N samples/s")
+    plot_parser.add_argument("--engines", nargs="+", choices=["matplotlib", "qpainter"], default=["matplotlib", "qpainter"])
+    plot_parser.add_argument("--rates", type=int, nargs="+", default=[1000, 5000])
+    plot_parser.add_argument("--points", nargs="+", default=["1000", "100000", "All"],
+                             help="visible points settings (a number or All)")
+    plot_parser.add_argument("--fps", type=int, default=60, help="frame rate cap")
+    plot_parser.add_argument("--duration", type=float, default=3.0)
+    plot_parser.set_defaults(func=bench_plot)
+
+    probe_parser = subparsers.add_parser("startup-probe", help="single start-up measurement (used by 'startup')")
+    probe_parser.add_argument("--eager", action="store_true")
+    probe_parser.set_defaults(func=startup_probe)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import argparse
+import os
+import signal
+import sys
+import time
+
+import serial
+
+from archive import COMPRESSIONS, SEGMENT_BYTES, SEGMENT_SECONDS, ArchiveWriter, zstandard
+from samples import Sample, SampleParser
+from metrics import PipelineMetrics, write_metrics
+from rawlog import RawLogWriter, open_port
+from serial_io import PortMultiplexer
+from storage import DEFAULT_WRITE_POLICY, WRITE_POLICIES, RotatingSessionWriter, safe_file_name
+
+
+# Last line of the firmware's start-up banner; commands sent before it are
+# lost while the Uno is still booting after the port was opened.
+READY_LINE = "INA219 initialized."
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Headless INA219 capture: serial port(s) -> rotating CSV session files")
+    parser.add_argument("ports", nargs="+", metavar="port",
+                        help="serial device (COM3, /dev/ttyUSB0), pyserial URL (socket://host:port) or "
+                             "raw capture log (replay://path[?speed=N|max]); "
+                             "several ports are captured together from one thread, one file set each")
+    parser.add_argument("--baudrate", type=int, default=115200)
+    parser.add_argument("--delay", type=int, help="sampling delay in ms to send once the board is up")
+    parser.add_argument("--binary", action="store_true", help="switch the firmware to binary frames (B command)")
+    parser.add_argument("--output", default=os.path.join(os.path.expanduser("~"), "SerialMonitor_Capture"),
+                        help="directory for the session files")
+    parser.add_argument("--prefix", default="capture")
+    parser.add_argument("--rotate-size", type=float, help="start a new file after this many MB")
+    parser.add_argument("--rotate-time", type=float, help="start a new file after this many minutes")
+    parser.add_argument("--write-policy", choices=list(WRITE_POLICIES), default=DEFAULT_WRITE_POLICY)
+    parser.add_argument("--compress", choices=list(COMPRESSIONS),
+                        help="write compressed CSV segments plus a <prefix>.manifest.json index instead of "
+                             "plain CSV files (segments rotate at 4 MB of CSV text or an hour by default)")
+    parser.add_argument("--host-time", action="store_true",
+                        help="record host seconds since the capture started instead of the board's time "
+                             "(always on with several ports, so they share one time base)")
+    parser.add_argument("--raw-log", action="store_true",
+                        help="also record the raw bytes of each port with arrival times (<prefix>.rawlog), for replay")
+    parser.add_argument("--boot-timeout", type=float, default=3.0,
+                        help="seconds to wait for the start-up banner before sending commands anyway")
+    parser.add_argument("--status", type=float, default=10.0, help="seconds between status lines (0 = off)")
+    parser.add_argument("--metrics", help="file to dump pipeline metrics to: *.prom for Prometheus text, else JSON")
+    parser.add_argument("--metrics-interval", type=float, default=5.0, help="seconds between metrics dumps")
+    parser.add_argument("--echo", action="store_true", help="print every text line received")
+    args = parser.parse_args(argv)
+    if args.compress == "zstd" and zstandard is None:
+        parser.error("--compress zstd needs the zstandard package (pip install zstandard)")
+    return args
+
+
+class DeviceCapture:
+    def __init__(self, port, writer, commands, label, raw_log=None):
+        self.port = port
+        self.writer = writer
+        self.raw_log = raw_log
+        self.commands = list(commands)
+        self.label = label
+        self.parser = SampleParser()
+        self.ready = False
+        self.current_file = writer.filename
+
+
+def capture(args):
+    stop = []
+
+    def request_stop(signum, frame):
+        stop.append(signum)
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    commands = []
+    if args.delay:
+        commands.append(str(args.delay))
+    if args.binary:
+        commands.append("B")
+
+    several = len(args.ports) > 1
+    host_time = args.host_time or several
+    multiplexer = PortMultiplexer()
+    devices = {}
+    metrics = PipelineMetrics() if args.metrics else None
+    try:
+        for port in args.ports:
+            serial_port = open_port(port, args.baudrate, timeout=0)
+            prefix = f"{args.prefix}_{safe_file_name(port)}" if several else args.prefix
+            max_bytes = int(args.rotate_size * 1024 * 1024) if args.rotate_size else None
+            max_seconds = args.rotate_time * 60 if args.rotate_time else None
+            if args.compress:
+                writer = ArchiveWriter(args.output, f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}",
+                                       max_bytes=max_bytes or SEGMENT_BYTES, max_seconds=max_seconds or SEGMENT_SECONDS,
+                                       compression=args.compress, metrics=metrics)
+            else:
+                writer = RotatingSessionWriter(args.output, prefix, max_bytes=max_bytes, max_seconds=max_seconds,
+                                               policy=WRITE_POLICIES[args.write_policy], metrics=metrics)
+            raw_log = RawLogWriter(os.path.join(args.output, f"{prefix}.rawlog")) if args.raw_log else None
+            multiplexer.add(port, serial_port, raw_log=raw_log, metrics=metrics)
+            devices[port] = DeviceCapture(port, writer, commands, f"[{port}] " if several else "", raw_log)
+            print(f"Capturing from {port} at {args.baudrate} baud into {writer.filename}", flush=True)
+            if args.compress:
+                print(f"Archive manifest: {writer.manifest_path}", flush=True)
+            if raw_log:
+                print(f"Raw capture log: {raw_log.path}", flush=True)
+
+        started = time.monotonic()
+        last_status = started
+        last_metrics = started
+        last_count = 0
+        while not stop and multiplexer.readers:
+            results = multiplexer.read(0.2)
+            now = time.monotonic()
+            handle_start = time.perf_counter()
+            for port, items in results.items():
+                device = devices[port]
+                if metrics:
+                    metrics.counters["items_emitted"] += len(items)
+                    metrics.counters["items_handled"] += len(items)
+                for item in items:
+                    if not isinstance(item, Sample):
+                        if not isinstance(item, str):
+                            # SD file download pieces; not used by the capture
+                            continue
+                        if metrics:
+                            metrics.counters["lines"] += 1
+                        if item.startswith("Error reading"):
+                            print(f"{device.label}{item}", file=sys.stderr)
+                            continue
+                        if args.echo:
+                            print(f"{device.label}{item}")
+                        if item == READY_LINE:
+                            device.ready = True
+                        item = device.parser.feed(item)
+                        if not item:
+                            continue
+                    if host_time:
+                        item = item._replace(time=now - started)
+                    device.writer.add_sample(item)
+                    if metrics:
+                        metrics.counters["samples"] += 1
+
+            if metrics and results:
+                metrics.stages["handle"].observe(time.perf_counter() - handle_start)
+
+            for device in devices.values():
+                if device.commands and device.port in multiplexer.readers and (
+                        device.ready or now - started >= args.boot_timeout):
+                    for command in device.commands:
+                        multiplexer.readers[device.port].serial.write(f"{command}\n".encode('utf-8'))
+                        print(f"{device.label}Sent: {command}", flush=True)
+                    device.commands = []
+                if args.compress:
+                    # Rows buffered for compression reach the disk on time
+                    # even while the board is quiet
+                    device.writer.flush_if_due()
+                if device.writer.filename != device.current_file:
+                    device.current_file = device.writer.filename
+                    print(f"{device.label}Rotated to {device.current_file}", flush=True)
+
+            if metrics and now - last_metrics >= args.metrics_interval:
+                try:
+                    write_metrics(args.metrics, metrics.snapshot())
+                except OSError as e:
+                    print(f"Metrics export failed: {e}", file=sys.stderr)
+                last_metrics = now
+
+            if args.status and now - last_status >= args.status:
+                count = sum(device.writer.data_count for device in devices.values())
+                rate = (count - last_count) / (now - last_status)
+                files = ", ".join(device.writer.filename for device in devices.values())
+                print(f"{count} samples ({rate:.1f}/s) -> {files}", flush=True)
+                last_status = now
+                last_count = count
+    finally:
+        for device in devices.values():
+            device.writer.close()
+            if device.raw_log:
+                device.raw_log.close()
+        multiplexer.close()
+        if metrics:
+            try:
+                write_metrics(args.metrics, metrics.snapshot())
+            except OSError as e:
+                print(f"Metrics export failed: {e}", file=sys.stderr)
+    print(f"Stopped after {sum(device.writer.data_count for device in devices.values())} samples", flush=True)
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        return capture(args)
+    except serial.SerialException as e:
+        print(f"❌ Connection failed: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -20,6 +20,12 @@ unsigned long index = 1;
 float currentTime = 0;
 
 bool SDStatus = false;
+bool binaryMode = false;
+
+// Binary sample frame: A5 5A | len | type, index, millis, bus, shunt, load, current, power | CRC-16/CCITT (LE)
+const uint8_t FRAME_SYNC1 = 0xA5;
+const uint8_t FRAME_SYNC2 = 0x5A;
+const uint8_t FRAME_SAMPLE = 0x01;
 
 void setup() 
 {
@@ -70,7 +76,8 @@ void loop()
     float current_mA = ina219.getCurrent_mA();
     float power_mW = ina219.getPower_mW();
     float loadvoltage = busvoltage + (shuntvoltage / 1000);
-    currentTime = millis() / 1000.0;
+    unsigned long nowMs = millis();
+    currentTime = nowMs / 1000.0;
 
     if (SDStatus){
         sprintf(buffer, "%lu", index);
@@ -103,7 +110,10 @@ void loop()
         writeToSD(dataStr);
     }
     
-    if (Serial) {
+    if (Serial && binaryMode) {
+        sendBinarySample(index, nowMs, busvoltage, shuntvoltage, loadvoltage, current_mA, power_mW);
+    }
+    else if (Serial) {
         Serial.print(F("Index:         ")); Serial.println(index);
         Serial.print(F("Relative time: ")); Serial.print(currentTime); Serial.println(F(" s"));
         Serial.print(F("Bus Voltage:   ")); Serial.print(busvoltage); Serial.println(F(" V"));
@@ -138,13 +148,47 @@ void writeToSD(char* data) {
     if (myFile) {
         myFile.println(data);
         myFile.close();
-        if (Serial) Serial.println(F("Write successful"));
+        if (Serial && !binaryMode) Serial.println(F("Write successful"));
     }
     else if (Serial) {
         Serial.println(F("Error opening file"));
     }
 }
 
+uint16_t crc16Update(uint16_t crc, const uint8_t* data, size_t length) {
+    for (size_t i = 0; i < length; i++) {
+        crc ^= (uint16_t)data[i] << 8;
+        for (uint8_t bit = 0; bit < 8; bit++) {
+            crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+        }
+    }
+    return crc;
+}
+
+uint16_t crc16(const uint8_t* data, uint8_t length) {
+    return crc16Update(0xFFFF, data, length);
+}
+
+void sendBinarySample(unsigned long idx, unsigned long timeMs, float bus, float shunt, float load, float current, float power) {
+    uint8_t payload[29];
+    payload[0] = FRAME_SAMPLE;
+    memcpy(payload + 1, &idx, 4);
+    memcpy(payload + 5, &timeMs, 4);
+    memcpy(payload + 9, &bus, 4);
+    memcpy(payload + 13, &shunt, 4);
+    memcpy(payload + 17, &load, 4);
+    memcpy(payload + 21, &current, 4);
+    memcpy(payload + 25, &power, 4);
+    uint16_t crc = crc16(payload, sizeof(payload));
+
+    Serial.write(FRAME_SYNC1);
+    Serial.write(FRAME_SYNC2);
+    Serial.write((uint8_t)sizeof(payload));
+    Serial.write(payload, sizeof(payload));
+    Serial.write((uint8_t)(crc & 0xFF));
+    Serial.write((uint8_t)(crc >> 8));
+}
+
 void sleepMode(unsigned long ms) {
     delay(ms);
 }
@@ -203,7 +247,15 @@ void checkSerialCommand() {
             }
         }
         else{
-            if (inputString.equals("N")) {
+            if (inputString.equals("B")) {
+                binaryMode = true;
+                if (Serial) Serial.println(F("Binary mode"));
+            }
+            else if (inputString.equals("T")) {
+                binaryMode = false;
+                if (Serial) Serial.println(F("Text mode"));
+            }
+            else if (inputString.equals("N")) {
                 lastFileNumber++;
                 // sampleNumber = 0;
                 sprintf(fileNameTxt, "data%d.txt", lastFileNumber);
@@ -226,10 +278,16 @@ void checkSerialCommand() {
                         }
                         else{
                             if (input.length() > 0) {
+                                // "<number>" or "<number>@<byte offset>" to resume
                                 int fileNumber = input.toInt();
+                                unsigned long offset = 0;
+                                int at = input.indexOf('@');
+                                if (at >= 0) {
+                                    offset = input.substring(at + 1).toInt();
+                                }
                                 char fileName[14];
                                 sprintf(fileName, "data%d.txt", fileNumber);
-                                sendFileOverSerial(fileName);
+                                sendFileOverSerial(fileName, offset);
                             }
                         }
                     }
@@ -266,7 +324,18 @@ void showAvailableDataFiles() {
     root.close();
 }
 
-void sendFileOverSerial(const char* filename) {
+unsigned int countLines(const uint8_t* data, int length) {
+    unsigned int lines = 0;
+    for (int i = 0; i < length; i++) {
+        if (data[i] == '\n') lines++;
+    }
+    return lines;
+}
+
+// File begin: <name> <size> <offset>
+// <size - offset raw bytes>
+// File end: <CRC-16/CCITT of the whole file, hex> <bytes sent> <records>
+void sendFileOverSerial(const char* filename, unsigned long offset) {
     if (!SD.exists(filename)) {
         Serial.println(F("File not found."));
         return;
@@ -278,12 +347,42 @@ void sendFileOverSerial(const char* filename) {
         return;
     }
 
+    unsigned long size = file.size();
+    if (offset > size) offset = size;
+
+    // Header before any reading: scanning a long file takes the Uno seconds,
+    // so the record count comes in the trailer
+    Serial.print(F("File begin: ")); Serial.print(filename);
+    Serial.print(' '); Serial.print(size);
+    Serial.print(' '); Serial.println(offset);
+
+    // The part the host already has: only its CRC and records
+    uint8_t chunk[64];
+    unsigned long records = 0;
+    unsigned long position = 0;
+    uint16_t crc = 0xFFFF;
+    while (position < offset) {
+        int n = file.read(chunk, (size_t)min((unsigned long)sizeof(chunk), offset - position));
+        if (n <= 0) break;
+        crc = crc16Update(crc, chunk, n);
+        records += countLines(chunk, n);
+        position += n;
+    }
+
+    file.seek(offset);
+    unsigned long sent = 0;
     while (file.available()) {
-        String line = file.readStringUntil('\n');
-        line.trim(); 
-        if (line.length() > 0) {
-            Serial.println(line);
-        }
+        int n = file.read(chunk, sizeof(chunk));
+        if (n <= 0) break;
+        crc = crc16Update(crc, chunk, n);
+        records += countLines(chunk, n);
+        Serial.write(chunk, n);
+        sent += n;
     }
     file.close();
+
+    Serial.print(F("File end: ")); Serial.print(crc, HEX);
+    Serial.print(' '); Serial.print(sent);
+    Serial.print(' '); Serial.println(records);
 }
+
@@ -1,20 +1,65 @@
 import sys
 import serial
 import serial.tools.list_ports
-import csv
 import os
 import tempfile
+import re
+import time
+from collections import deque
 from PyQt5.QtWidgets import (
-    QApplication, QWidget, QVBoxLayout, QTextEdit, QComboBox,QDialog,QTextBrowser,
+    QApplication, QWidget, QVBoxLayout, QPlainTextEdit, QComboBox,QDialog,QTextBrowser,
     QPushButton, QCheckBox, QFileDialog, QLabel, QHBoxLayout, QLineEdit,
     QGroupBox, QGridLayout, QSplitter, QMessageBox, QMainWindow, QStatusBar,
-    QToolBar, QAction,QShortcut
+    QToolBar, QAction,QShortcut, QListWidget, QListWidgetItem, QDialogButtonBox, QProgressBar,
+    QInputDialog
 )
 from PyQt5.QtCore import QThread, pyqtSignal, Qt, QTimer
-from PyQt5.QtGui import QTextCursor, QFont, QIcon, QKeySequence
+from PyQt5.QtGui import QFont, QIcon, QKeySequence
 
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
+from samples import GapDetector, Sample, SampleParser, sample_row
+from archive import MANIFEST_SUFFIX, ArchiveWriter, open_recording
+from metrics import COUNTERS, STAGES, PipelineMetrics, summary_line, write_metrics
+from rawlog import REPLAY_SCHEME, RawLogWriter, ReplayFinished, ReplayPort, open_port, replay_url
+from serial_io import FileHeader, FileTrailer, FrameDecoder, HandoffQueue, LineReader, read_overruns
+from stats import SessionStats
+from pipeline import ThreadedSink
+from storage import DEFAULT_WRITE_POLICY, WRITE_POLICIES, DataManager, TempCsvFile, stats_path
+from transfer import DownloadQueue, FileDownload
+
+
+# File names printed by the firmware after "U"
+SD_FILE_NAME = re.compile(r"data(\d+)\.txt$", re.IGNORECASE)
+
+# Statistics panel: one row per (SessionStats attribute, title)
+STATS_ROWS = [("current", "Current (mA)"), ("window_current", "Current, last 10 s"),
+              ("power", "Power (mW)"), ("window_power", "Power, last 10 s")]
+STATS_COLUMNS = ["Mean", "Min", "Max", "RMS", "Std"]
+STATS_REFRESH_INTERVAL = 0.2
+
+# Reader -> GUI hand-off: items the GUI may fall behind by (the reader then
+# waits: nothing is lost on the way to disk), items handled per drain before
+# other events get a turn, and the display's overload choices: show every
+# item, or past DISPLAY_BACKLOG items behind, store the oldest without
+# showing them (no console line, no plot point)
+HANDOFF_CAPACITY = 100000
+DRAIN_LIMIT = 20000
+DISPLAY_BACKLOG = 5000
+SHOW_ALL = "show-all"
+SHOW_NEWEST = "show-newest"
+DISPLAY_POLICIES = {"Never drop": SHOW_ALL, "Drop oldest": SHOW_NEWEST}
+OVERRUN_CHECK_INTERVAL = 1.0
+
+# Plot canvases: matplotlib (plotcanvas) or QPainter (plotpainter)
+PLOT_ENGINES = {"Matplotlib": "matplotlib", "QPainter, 5 channels": "qpainter"}
+
+# Replay speed choices: factor on the recorded pace (None: as fast as possible)
+REPLAY_SPEEDS = {"1x": 1.0, "2x": 2.0, "10x": 10.0, "100x": 100.0, "Max": None}
+
+# SD download: seconds without data before a transfer counts as ended (old
+# firmware) or stalled, and, between a resumed file's header and its first
+# bytes, while the board reads the part the host already has
+FILE_IDLE_TIMEOUT = 3
+FILE_START_TIMEOUT = 30
 
 class HelpWindow(QDialog):
     def __init__(self):
@@ -67,6 +112,16 @@ class HelpWindow(QDialog):
                 <td>خروج از حالت انتخاب فایل (بعد از U)</td>
                 <td><kbd>Q</kbd></td>
             </tr>
+            <tr>
+                <td><code>B</code></td>
+                <td>ارسال داده‌ها در قالب باینری فشرده (حدود ۳۴ بایت برای هر نمونه)</td>
+                <td><kbd>B</kbd></td>
+            </tr>
+            <tr>
+                <td><code>T</code></td>
+                <td>بازگشت به ارسال متنی داده‌ها</td>
+                <td><kbd>T</kbd></td>
+            </tr>
         </table>
 
         <h2>📄 توضیحات بیشتر</h2>
@@ -75,6 +130,7 @@ class HelpWindow(QDialog):
             <li>با ارسال دستور <code>N</code>، فایل جدیدی با شماره افزایشی ذخیره می‌شود (مثلاً data3.txt).</li>
             <li>با دستور <code>U</code>، لیست فایل‌های موجود نمایش داده شده و می‌توانید با وارد کردن شماره فایل، آن را از طریق پورت سریال دریافت کنید.</li>
             <li>در حین انتخاب فایل (پس از <code>U</code>)، برای خروج از حالت انتخاب، دستور <code>Q</code> را وارد کنید.</li>
+            <li>در حالت باینری (<code>B</code>) می‌توان با تاخیرهای بسیار کوچک‌تر نمونه‌برداری کرد؛ برنامه هر دو حالت را به‌صورت خودکار تشخیص می‌دهد.</li>
         </ul>
 
         <h2>💡 نکات</h2>
@@ -86,35 +142,352 @@ class HelpWindow(QDialog):
         """
         self.text_browser.setHtml(help_text)   
 
+class PortScanner(QThread):
+    ports_found = pyqtSignal(list)
+
+    def run(self):
+        try:
+            ports = serial.tools.list_ports.comports()
+        except Exception as e:
+            print(f"Error listing ports: {e}")
+            ports = []
+        self.ports_found.emit([(port.device, port.description) for port in ports])
+
+
+class DownloadDialog(QDialog):
+    def __init__(self, file_numbers, directory, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Download SD Card Files")
+        layout = QVBoxLayout(self)
+
+        self.file_list = QListWidget()
+        for number in file_numbers:
+            item = QListWidgetItem(f"data{number}.txt")
+            item.setData(Qt.UserRole, number)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked)
+            self.file_list.addItem(item)
+        layout.addWidget(self.file_list)
+
+        select_layout = QHBoxLayout()
+        select_all_btn = QPushButton("Select All")
+        select_all_btn.clicked.connect(lambda: self.set_all(Qt.Checked))
+        select_none_btn = QPushButton("Select None")
+        select_none_btn.clicked.connect(lambda: self.set_all(Qt.Unchecked))
+        select_layout.addWidget(select_all_btn)
+        select_layout.addWidget(select_none_btn)
+        select_layout.addStretch()
+        layout.addLayout(select_layout)
+
+        directory_layout = QHBoxLayout()
+        directory_layout.addWidget(QLabel("Save to:"))
+        self.directory_input = QLineEdit(directory)
+        directory_layout.addWidget(self.directory_input)
+        browse_btn = QPushButton("Browse...")
+        browse_btn.clicked.connect(self.browse)
+        directory_layout.addWidget(browse_btn)
+        layout.addLayout(directory_layout)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.button(QDialogButtonBox.Ok).setText("Download")
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def set_all(self, state):
+        for row in range(self.file_list.count()):
+            self.file_list.item(row).setCheckState(state)
+
+    def browse(self):
+        directory = QFileDialog.getExistingDirectory(self, "Download Folder", self.directory_input.text())
+        if directory:
+            self.directory_input.setText(directory)
+
+    def selection(self):
+        numbers = []
+        for row in range(self.file_list.count()):
+            item = self.file_list.item(row)
+            if item.checkState() == Qt.Checked:
+                numbers.append(item.data(Qt.UserRole))
+        directory = self.directory_input.text().strip()
+        os.makedirs(directory, exist_ok=True)
+        return numbers, directory
+
+
+class OpenSessionDialog(QDialog):
+    def __init__(self, directory, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Open Session")
+        self.directory = directory
+        layout = QVBoxLayout(self)
+
+        file_layout = QHBoxLayout()
+        file_layout.addWidget(QLabel("File:"))
+        self.path_input = QLineEdit()
+        self.path_input.textChanged.connect(self.show_index)
+        file_layout.addWidget(self.path_input)
+        browse_btn = QPushButton("Browse...")
+        browse_btn.clicked.connect(self.browse)
+        file_layout.addWidget(browse_btn)
+        layout.addLayout(file_layout)
+
+        self.index_label = QLabel("")
+        layout.addWidget(self.index_label)
+
+        range_layout = QHBoxLayout()
+        range_layout.addWidget(QLabel("From (s):"))
+        self.start_input = QLineEdit()
+        self.start_input.setPlaceholderText("start")
+        range_layout.addWidget(self.start_input)
+        range_layout.addWidget(QLabel("To (s):"))
+        self.end_input = QLineEdit()
+        self.end_input.setPlaceholderText("end")
+        range_layout.addWidget(self.end_input)
+        layout.addLayout(range_layout)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.button(QDialogButtonBox.Ok).setText("Open")
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def browse(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Open Session", self.directory,
+                                              f"Sessions (*.csv *.txt *{MANIFEST_SUFFIX});;"
+                                              f"Archive Manifests (*{MANIFEST_SUFFIX});;All Files (*)")
+        if path:
+            self.path_input.setText(path)
+
+    def show_index(self, path):
+        # An archive, or a file opened before, has an index: show what is in it
+        try:
+            span = open_recording(path).time_span() if os.path.isfile(path) else None
+        except (OSError, ValueError, KeyError):
+            span = None
+        if span:
+            self.index_label.setText(f"Indexed: {span[0]:.2f} s to {span[1]:.2f} s")
+        else:
+            self.index_label.setText("")
+
+    def selection(self):
+        def seconds(line_edit):
+            try:
+                return float(line_edit.text())
+            except ValueError:
+                return None
+        return self.path_input.text().strip(), seconds(self.start_input), seconds(self.end_input)
+
+
+class DiagnosticsWindow(QDialog):
+    # Pipeline counters and stage timings, refreshed by SerialMonitor once
+    # a second; optionally dumped to a JSON or Prometheus (.prom) file
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Diagnostics")
+        layout = QVBoxLayout(self)
+
+        counters_group = QGroupBox("Counters")
+        counters_layout = QGridLayout(counters_group)
+        for column, heading in enumerate(["Total", "Per second"], 1):
+            counters_layout.addWidget(QLabel(f"<b>{heading}</b>"), 0, column, Qt.AlignRight)
+        self.counter_labels = {}
+        for row, name in enumerate(COUNTERS, 1):
+            counters_layout.addWidget(QLabel(name.replace("_", " ").capitalize()), row, 0)
+            for column, key in enumerate(["total", "rate"], 1):
+                label = QLabel("-")
+                label.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                counters_layout.addWidget(label, row, column)
+                self.counter_labels[name, key] = label
+        layout.addWidget(counters_group)
+
+        stages_group = QGroupBox("Stages (last second)")
+        stages_layout = QGridLayout(stages_group)
+        stage_columns = [("count", "Calls"), ("mean_ms", "Mean ms"), ("max_ms", "Max ms"), ("busy", "Busy %")]
+        for column, (_, heading) in enumerate(stage_columns, 1):
+            stages_layout.addWidget(QLabel(f"<b>{heading}</b>"), 0, column, Qt.AlignRight)
+        self.stage_labels = {}
+        for row, name in enumerate(STAGES, 1):
+            stages_layout.addWidget(QLabel(name.capitalize()), row, 0)
+            for column, (key, _) in enumerate(stage_columns, 1):
+                label = QLabel("-")
+                label.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                stages_layout.addWidget(label, row, column)
+                self.stage_labels[name, key] = label
+        layout.addWidget(stages_group)
+
+        self.gauges_label = QLabel("")
+        layout.addWidget(self.gauges_label)
+
+        export_layout = QHBoxLayout()
+        self.export_checkbox = QCheckBox("Export every second to:")
+        export_layout.addWidget(self.export_checkbox)
+        self.export_input = QLineEdit(os.path.join(os.path.expanduser("~"), "SerialMonitor_Diagnostics", "metrics.json"))
+        self.export_input.setToolTip("*.json for JSON, *.prom for the Prometheus text format")
+        export_layout.addWidget(self.export_input)
+        browse_btn = QPushButton("Browse...")
+        browse_btn.clicked.connect(self.browse)
+        export_layout.addWidget(browse_btn)
+        layout.addLayout(export_layout)
+
+    def browse(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Metrics To", self.export_input.text(),
+                                              "JSON (*.json);;Prometheus text (*.prom)")
+        if path:
+            self.export_input.setText(path)
+
+    def export_path(self):
+        if not self.export_checkbox.isChecked():
+            return None
+        path = self.export_input.text().strip()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return path or None
+
+    def show_snapshot(self, snapshot):
+        for name, values in snapshot["counters"].items():
+            self.counter_labels[name, "total"].setText(f"{values['total']}")
+            self.counter_labels[name, "rate"].setText(f"{values['rate']:.1f}")
+        for name, values in snapshot["stages"].items():
+            self.stage_labels[name, "count"].setText(f"{values['count']}")
+            self.stage_labels[name, "mean_ms"].setText(f"{values['mean_ms']:.3f}")
+            self.stage_labels[name, "max_ms"].setText(f"{values['max_ms']:.3f}")
+            self.stage_labels[name, "busy"].setText(f"{values['busy'] * 100:.1f}")
+        self.gauges_label.setText("   ".join(f"{name.replace('_', ' ').capitalize()}: {value}"
+                                            for name, value in snapshot["gauges"].items()))
+
+
+class SessionLoader(QThread):
+    # Parses a recorded session off the GUI thread
+    progress = pyqtSignal(int)
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, path, start_time=None, end_time=None):
+        super().__init__()
+        self.path = path
+        self.start_time = start_time
+        self.end_time = end_time
+
+    def run(self):
+        try:
+            records = open_recording(self.path).load(self.start_time, self.end_time,
+                                                     progress=lambda fraction: self.progress.emit(int(fraction * 100)))
+        except (OSError, ValueError, KeyError) as e:
+            self.failed.emit(str(e))
+            return
+        self.loaded.emit(records)
+
+
 class SerialReader(QThread):
     data_received = pyqtSignal(str)
+    items_ready = pyqtSignal()
 
-    def __init__(self, port, baudrate=115200):
+    def __init__(self, port, baudrate=115200, read_timeout=0.1, batch_rate=0, raw_log_path=None, metrics=None,
+                 queue_capacity=HANDOFF_CAPACITY):
         super().__init__()
         self.port = port
         self.baudrate = baudrate
+        self.read_timeout = read_timeout
+        self.batch_rate = batch_rate
+        self.raw_log_path = raw_log_path
+        self.metrics = metrics
+        self.queue = HandoffQueue(queue_capacity)
+        # None until the port reports overruns (not every port can)
+        self.overruns = None
+        # Set by the GUI thread, applied to the decoder by the reader thread
+        self.file_cancelled = False
         self.running = False
         self.serial = None
 
     def run(self):
         self.running = True
+        # Lines and samples go into a bounded queue that the GUI drains when
+        # told to; in batched mode it is told at most once per frame
+        # (1 / batch_rate seconds) instead of once per line. While a full
+        # queue holds the reader up, nothing more is read.
+        batch_interval = 1.0 / self.batch_rate if self.batch_rate else 0
+        timeout = min(self.read_timeout, batch_interval) if batch_interval else self.read_timeout
+        pending = []
+        raw_log = None
         try:
-            self.serial = serial.Serial(self.port, self.baudrate, timeout=1)
+            self.serial = open_port(self.port, self.baudrate, timeout=timeout)
+            if self.raw_log_path:
+                raw_log = RawLogWriter(self.raw_log_path)
+            # A replay is read in one call per wake-up, whatever is due
+            chunk_size = 65536 if isinstance(self.serial, ReplayPort) else None
+            decoder = FrameDecoder()
+            reader = LineReader(self.serial, decoder, chunk_size=chunk_size, raw_log=raw_log,
+                                metrics=self.metrics)
+            first_overruns = read_overruns(self.serial)
+            if first_overruns is not None:
+                self.overruns = 0
+            last_emit = last_overrun_check = time.monotonic()
             while self.running:
-                if self.serial.in_waiting > 0:
+                if self.file_cancelled:
+                    self.file_cancelled = False
+                    decoder.cancel_file()
+                if not pending:
                     try:
-                        line = self.serial.readline().decode('utf-8', errors='ignore').strip()
-                        self.data_received.emit(line)
+                        pending = reader.read_lines()
+                    except ReplayFinished:
+                        pending.append("⏹ Replay finished.")
+                        break
                     except Exception as e:
-                        self.data_received.emit(f"Error reading: {e}")
+                        if self.running:
+                            pending.append(f"Error reading: {e}")
+                        break
+                if pending:
+                    queued = len(pending)
+                    pending = self.queue.put(pending, timeout)
+                    if self.metrics:
+                        self.metrics.counters["items_emitted"] += queued - len(pending)
+                now = time.monotonic()
+                if now - last_emit >= batch_interval and self.queue.take_notification():
+                    self.items_ready.emit()
+                    last_emit = now
+                if first_overruns is not None and now - last_overrun_check >= OVERRUN_CHECK_INTERVAL:
+                    last_overrun_check = now
+                    self.check_overruns(first_overruns)
         except Exception as e:
-            self.data_received.emit(f"❌ Connection failed: {e}")
+            pending.append(f"❌ Connection failed: {e}")
+        if raw_log:
+            raw_log.close()
+        self.flush_pending(pending)
+
+    def check_overruns(self, first_overruns):
+        overruns = read_overruns(self.serial)
+        if overruns is None:
+            return
+        overruns -= first_overruns
+        if self.metrics and overruns > self.overruns:
+            self.metrics.counters["overruns"] += overruns - self.overruns
+        self.overruns = overruns
+
+    def flush_pending(self, pending):
+        # Whatever is left when the reader stops, past the queue's capacity
+        # if need be: the GUI drains it after the thread has finished
+        if pending:
+            self.queue.put(pending, overflow=True)
+            if self.metrics:
+                self.metrics.counters["items_emitted"] += len(pending)
+        if self.queue.take_notification():
+            self.items_ready.emit()
+
+    def cancel_file(self):
+        # An abandoned SD download: the bytes still owed by the board are
+        # not coming, what arrives next is text and frames again
+        self.file_cancelled = True
 
     def stop(self):
         self.running = False
         if self.serial and self.serial.is_open:
-            self.serial.close()
+            try:
+                self.serial.cancel_read()
+            except Exception:
+                pass
         self.wait()
+        if self.serial and self.serial.is_open:
+            self.serial.close()
 
     def write_data(self, text):
         if self.serial and self.serial.is_open:
@@ -124,138 +497,71 @@ class SerialReader(QThread):
                 self.data_received.emit(f"❌ Error sending: {e}")
 
 
-class LivePlotCanvas(FigureCanvas):
-    def __init__(self, parent=None, max_points=100):
-        fig = Figure(figsize=(5, 3), dpi=100)
-        self.ax = fig.add_subplot(111)
-        super().__init__(fig)
-        self.setParent(parent)
-        
-        fig.set_facecolor('#f0f0f0')
-        self.ax.set_facecolor('#f8f8f8')
-        self.ax.grid(True, linestyle='--', alpha=0.7)
-        
-        title_font = {'fontsize': 6}
-        label_font = {'fontsize': 6}
-        tick_font = {'labelsize': 5}
-        
-        self.ax.set_title("BusVoltage and ShuntVoltage Plot", **title_font)
-        self.ax.set_ylabel("Value", **label_font)
-        self.ax.tick_params(**tick_font)
-
-        self.max_points = max_points
-        self.x_data = []
-        self.y1_data = [] 
-        self.y2_data = []  
-        self.data_count = 0  
+class ConsoleView(QPlainTextEdit):
+    # Read-only log with a fixed number of lines: QPlainTextEdit lays out
+    # only the visible blocks and drops the oldest ones past
+    # maximumBlockCount, so the cost of a line does not grow with the log.
+    # Appends are queued and written once per refresh tick; while paused
+    # they keep queueing (the newest max_lines only) until rendering resumes.
+    def __init__(self, max_lines=500, refresh_rate=30, metrics=None):
+        super().__init__()
+        self.metrics = metrics
+        self.setReadOnly(True)
+        self.setUndoRedoEnabled(False)
+        self.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.setMaximumBlockCount(max_lines)
+        self.pending = deque(maxlen=max_lines)
+        self.paused = False
+        self.auto_scroll = True
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(int(1000 / refresh_rate))
+        self.refresh_timer.timeout.connect(self.flush)
 
-        self.line1, = self.ax.plot([], [], label="BusVoltage", color='#1f77b4', linewidth=1.5)
-        self.line2, = self.ax.plot([], [], label="ShuntVoltage", color='#d62728', linewidth=1.5)
-        self.ax.legend(prop={'size': 6})
-        
-        fig.tight_layout()
+    def append(self, text):
+        self.append_lines(text.split("\n"))
 
-    def update_plot(self, new_y1, new_y2):
-        try:
-            new_y1 = float(new_y1)
-            new_y2 = float(new_y2)
-        except ValueError:
-            return 
-
-        self.data_count += 1
-        
-        if len(self.x_data) >= self.max_points:
-            self.x_data.pop(0)
-            self.y1_data.pop(0)
-            self.y2_data.pop(0)
-        
-        self.x_data.append(self.data_count)
-        self.y1_data.append(new_y1)
-        self.y2_data.append(new_y2)
+    def append_lines(self, lines):
+        if self.metrics:
+            overflow = len(self.pending) + len(lines) - self.pending.maxlen
+            if overflow > 0:
+                self.metrics.counters["console_dropped"] += overflow
+        self.pending.extend(lines)
+        if not self.paused and not self.refresh_timer.isActive():
+            self.refresh_timer.start()
 
-        self.line1.set_data(self.x_data, self.y1_data)
-        self.line2.set_data(self.x_data, self.y2_data)
-        
-        x_min = self.data_count - self.max_points if self.data_count > self.max_points else 0
-        self.ax.set_xlim(x_min, self.data_count)
-        
-        y_min = min(min(self.y1_data), min(self.y2_data)) * 0.9
-        y_max = max(max(self.y1_data), max(self.y2_data)) * 1.1
-        self.ax.set_ylim(y_min, y_max)
-        
-        self.draw()
+    def flush(self):
+        self.refresh_timer.stop()
+        if self.paused or not self.pending:
+            return
+        start = time.perf_counter()
+        text = "\n".join(self.pending)
+        self.pending.clear()
+        scroll_bar = self.verticalScrollBar()
+        position = scroll_bar.value()
+        self.appendPlainText(text)
+        if self.auto_scroll:
+            scroll_bar.setValue(scroll_bar.maximum())
+        else:
+            scroll_bar.setValue(position)
+        if self.metrics:
+            self.metrics.stages["console"].observe(time.perf_counter() - start)
 
-    def clear_plot(self):
-        self.x_data = []
-        self.y1_data = []
-        self.y2_data = []
-        self.data_count = 0
-        self.line1.set_data([], [])
-        self.line2.set_data([], [])
-        self.ax.relim()
-        self.ax.autoscale_view()
-        self.draw()
+    def set_paused(self, paused):
+        self.paused = paused
+        if not paused:
+            self.flush()
 
+    def set_auto_scroll(self, enabled):
+        self.auto_scroll = enabled
 
-class DataManager:
-    def __init__(self):
-        self.temp_file = tempfile.NamedTemporaryFile(mode='w+', delete=False, suffix='.csv', encoding='utf-8', newline='')
-        self.filename = self.temp_file.name
-        self.writer = csv.writer(self.temp_file)
-        self.writer.writerow(["Index", "Relative time", "Bus Voltage(V)", "Shunt Voltage(mV)", "Load Voltage(V)", "Current(mA)", "Power(mW)"])
-        self.data_count = 0
-        
-    def add_data(self, values):
-        if isinstance(values, list):
-            while len(values) < 5:
-                values.append("")  
-            
-            self.writer.writerow(values[:5])
-        else:
-            try:
-                if isinstance(values, str) and ',' in values:
-                    parts = values.split(',')
-                    while len(parts) < 5:
-                        parts.append("")
-                    self.writer.writerow(parts[:5])
-                else:
-                    self.writer.writerow([str(values)])
-            except Exception as e:
-                print(f"Error processing data in DataManager: {e}")
-                self.writer.writerow([str(values)])
-                
-        self.temp_file.flush()
-        self.data_count += 1
-        
-    def save_to_file(self, target_filename):
-        self.temp_file.close()
-        
-        with open(self.filename, 'r', newline='') as src_file:
-            with open(target_filename, 'w', newline='') as dst_file:
-                dst_file.write(src_file.read())
-        
-        return True
-        
-    def __del__(self):
-        if hasattr(self, 'temp_file') and self.temp_file:
-            self.temp_file.close()
-            try:
-                os.unlink(self.filename)
-            except:
-                pass
-        
-    def __del__(self):
-        if hasattr(self, 'temp_file') and self.temp_file:
-            self.temp_file.close()
-            try:
-                os.unlink(self.filename)
-            except:
-                pass
+    def clear(self):
+        self.pending.clear()
+        super().clear()
 
 
 class SerialMonitor(QMainWindow):
 
-    def __init__(self):
+    def __init__(self, lazy_plot=True):
         super().__init__()
         self.setWindowTitle("Serial Monitor")
         self.resize(800, 750)
@@ -269,9 +575,34 @@ class SerialMonitor(QMainWindow):
         self.selected_file_number = None    
         self.file_data_received = False     
         self.temp_file_manager = None       
+        self.file_download = None
+        self.file_downloads = {}
+        self.download_queue = None
+        self.sd_file_numbers = []
+        self.download_directory = os.path.join(os.path.expanduser("~"), "SerialMonitor_Downloads")
+        self.next_progress_report = 0.1
         
         self.waiting_for_new_file = False
         self.new_file_received = False
+
+        self.sample_parser = SampleParser()
+        self.gap_detector = GapDetector()
+        self.display_policy = SHOW_ALL
+        self.archive_writer = None
+        self.reported_loss = (0, 0)
+
+        self.lazy_plot = lazy_plot
+        self.plot_canvas = None
+        self.plot_pending = False
+        self.help_window = None
+        self.port_scanner = None
+        self.multi_device_window = None
+        self.session_loader = None
+        self.diagnostics_window = None
+        self.metrics = PipelineMetrics()
+        self.metrics.gauge("queue_depth", lambda: len(self.serial_thread.queue) if self.serial_thread else 0)
+        self.metrics.gauge("console_pending", lambda: len(self.output_box.pending))
+        self.metrics.gauge("writer_queue", self.writer_queue_depth)
         
         self.central_widget = QWidget()
         self.setCentralWidget(self.central_widget)
@@ -284,7 +615,6 @@ class SerialMonitor(QMainWindow):
         
         self.auto_save_timer = QTimer()
         self.auto_save_timer.timeout.connect(self.auto_save_data)
-        self.auto_save_counter = 0
         
         self.file_data_timer = QTimer()
         self.file_data_timer.timeout.connect(self.check_file_data_completion)
@@ -302,11 +632,19 @@ class SerialMonitor(QMainWindow):
         port_layout.addWidget(QLabel("Port:"), 0, 0)
         self.port_combo = QComboBox()
         self.port_combo.setMinimumWidth(200)
+        # Also accepts a typed device path or pyserial URL (socket://host:port)
+        self.port_combo.setEditable(True)
         port_layout.addWidget(self.port_combo, 0, 1)
         
+        port_buttons_layout = QHBoxLayout()
         self.refresh_btn = QPushButton("Refresh")
         self.refresh_btn.clicked.connect(self.refresh_ports)
-        port_layout.addWidget(self.refresh_btn, 0, 2)
+        port_buttons_layout.addWidget(self.refresh_btn)
+        self.replay_btn = QPushButton("Replay...")
+        self.replay_btn.setToolTip("Play a raw capture log back through the monitor")
+        self.replay_btn.clicked.connect(self.replay_raw_log)
+        port_buttons_layout.addWidget(self.replay_btn)
+        port_layout.addLayout(port_buttons_layout, 0, 2)
         
         port_layout.addWidget(QLabel("Baudrate:"), 1, 0)
         self.baudrate_combo = QComboBox()
@@ -322,6 +660,26 @@ class SerialMonitor(QMainWindow):
         connection_layout.addWidget(self.start_btn)
         connection_layout.addWidget(self.stop_btn)
         port_layout.addLayout(connection_layout, 1, 2)
+
+        port_layout.addWidget(QLabel("Batch rate:"), 2, 0)
+        self.batch_rate_combo = QComboBox()
+        self.batch_rate_combo.addItems(["Off", "10 Hz", "30 Hz", "60 Hz"])
+        self.batch_rate_combo.setCurrentText("30 Hz")
+        batch_layout = QHBoxLayout()
+        batch_layout.addWidget(self.batch_rate_combo)
+        batch_layout.addWidget(QLabel("Overload:"))
+        self.queue_policy_combo = QComboBox()
+        self.queue_policy_combo.addItems(list(DISPLAY_POLICIES))
+        self.queue_policy_combo.setToolTip("When the display falls behind: show every line (the reader waits, "
+                                           "the port buffer fills) or skip showing the oldest lines. "
+                                           "Every sample is stored either way.")
+        batch_layout.addWidget(self.queue_policy_combo)
+        port_layout.addLayout(batch_layout, 2, 1)
+
+        self.multi_device_btn = QPushButton("Multi-device...")
+        self.multi_device_btn.setToolTip("Capture from several boards at once")
+        self.multi_device_btn.clicked.connect(self.show_multi_device)
+        port_layout.addWidget(self.multi_device_btn, 2, 2)
         
         top_section.addWidget(port_group)
         
@@ -333,6 +691,18 @@ class SerialMonitor(QMainWindow):
         
         self.auto_save_checkbox = QCheckBox("Auto-save every 100 points")
         self.auto_save_checkbox.setChecked(True)
+        data_layout.addWidget(QLabel("Write policy:"))
+        self.write_policy_combo = QComboBox()
+        self.write_policy_combo.addItems(list(WRITE_POLICIES))
+        self.write_policy_combo.setCurrentText(DEFAULT_WRITE_POLICY)
+        data_layout.addWidget(self.write_policy_combo)
+        self.raw_log_checkbox = QCheckBox("Raw capture log")
+        self.raw_log_checkbox.setToolTip("Also record the raw bytes with arrival times, for replay")
+        data_layout.addWidget(self.raw_log_checkbox)
+        self.archive_checkbox = QCheckBox("Compressed archive")
+        self.archive_checkbox.setToolTip("Also stream samples into gzip segments with a manifest index "
+                                         "(~/SerialMonitor_Archive), for long captures")
+        data_layout.addWidget(self.archive_checkbox)
         save_layout.addLayout(data_layout)
         
         save_buttons_layout = QHBoxLayout()
@@ -343,6 +713,11 @@ class SerialMonitor(QMainWindow):
         self.clear_data_btn = QPushButton("Clear Data")
         self.clear_data_btn.clicked.connect(self.clear_data)
         save_buttons_layout.addWidget(self.clear_data_btn)
+
+        self.open_session_btn = QPushButton("Open session...")
+        self.open_session_btn.setToolTip("Plot a recorded CSV: auto-save, saved data or a downloaded SD file")
+        self.open_session_btn.clicked.connect(self.open_session)
+        save_buttons_layout.addWidget(self.open_session_btn)
         
         save_layout.addLayout(save_buttons_layout)
         
@@ -354,6 +729,11 @@ class SerialMonitor(QMainWindow):
         send_layout.addWidget(QLabel("Value:"))
         send_layout.addWidget(self.send_input)
         send_layout.addWidget(self.send_btn)
+        self.download_btn = QPushButton("Download files...")
+        self.download_btn.setToolTip("Download several SD card files after 'U' has listed them")
+        self.download_btn.clicked.connect(self.download_files)
+        self.download_btn.setEnabled(False)
+        send_layout.addWidget(self.download_btn)
         save_layout.addLayout(send_layout)
         
         top_section.addWidget(save_group)
@@ -375,6 +755,10 @@ class SerialMonitor(QMainWindow):
         self.auto_scroll_checkbox = QCheckBox("Auto-scroll")
         self.auto_scroll_checkbox.setChecked(True)
         scroll_layout.addWidget(self.auto_scroll_checkbox)
+
+        self.pause_console_checkbox = QCheckBox("Pause rendering")
+        self.pause_console_checkbox.setToolTip("Stop updating the console; data keeps being recorded")
+        scroll_layout.addWidget(self.pause_console_checkbox)
         
         self.clear_btn = QPushButton("Clear Console")
         self.clear_btn.clicked.connect(self.clear_console)
@@ -384,9 +768,10 @@ class SerialMonitor(QMainWindow):
         
         console_inner_layout.addLayout(scroll_layout)
         
-        self.output_box = QTextEdit()
-        self.output_box.setReadOnly(True)
+        self.output_box = ConsoleView(self.max_display_lines, metrics=self.metrics)
         self.output_box.setFont(QFont("Consolas", 10))
+        self.auto_scroll_checkbox.toggled.connect(self.output_box.set_auto_scroll)
+        self.pause_console_checkbox.toggled.connect(self.output_box.set_paused)
         console_inner_layout.addWidget(self.output_box)
         
         console_layout.addWidget(console_group)
@@ -405,17 +790,70 @@ class SerialMonitor(QMainWindow):
         plot_options.addWidget(self.plot_points_label)
         
         self.plot_points_combo = QComboBox()
-        self.plot_points_combo.addItems(["50", "100", "200", "500", "1000"])
+        self.plot_points_combo.addItems(["50", "100", "200", "500", "1000", "10000", "100000", "1000000", "All"])
         self.plot_points_combo.setCurrentText("100")
         self.plot_points_combo.currentTextChanged.connect(self.change_plot_size)
         plot_options.addWidget(self.plot_points_combo)
+
+        plot_options.addWidget(QLabel("Engine:"))
+        self.plot_engine_combo = QComboBox()
+        self.plot_engine_combo.addItems(list(PLOT_ENGINES))
+        self.plot_engine_combo.setToolTip("Matplotlib: bus and shunt voltage on one axes. QPainter: all five "
+                                          "channels stacked, lighter on the CPU at high sample rates")
+        self.plot_engine_combo.currentTextChanged.connect(self.change_plot_engine)
+        plot_options.addWidget(self.plot_engine_combo)
         
         plot_inner_layout.addLayout(plot_options)
         
-        self.plot_canvas = LivePlotCanvas(max_points=int(self.plot_points_combo.currentText()))
-        plot_inner_layout.addWidget(self.plot_canvas)
+        # The plot canvas is built right after the first paint, or on the
+        # first sample if that comes sooner, so importing matplotlib does not
+        # hold up start-up.
+        self.plot_inner_layout = plot_inner_layout
+        self.plot_placeholder = QLabel("Loading plot...")
+        self.plot_placeholder.setAlignment(Qt.AlignCenter)
+        plot_inner_layout.addWidget(self.plot_placeholder)
+
+        self.fps_label = QLabel("Plot: 0 FPS")
+        self.status_bar.addPermanentWidget(self.fps_label)
+        self.metrics_label = QLabel("")
+        self.status_bar.addPermanentWidget(self.metrics_label)
+        self.loss_label = QLabel("")
+        self.loss_label.setToolTip("Samples missing from the firmware Index sequence, lines not shown "
+                                   "by the overload policy (still stored) and serial receive overruns")
+        self.status_bar.addPermanentWidget(self.loss_label)
+        diagnostics_btn = QPushButton("Diagnostics...")
+        diagnostics_btn.setFlat(True)
+        diagnostics_btn.clicked.connect(self.show_diagnostics)
+        self.status_bar.addPermanentWidget(diagnostics_btn)
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(self.update_metrics)
+        self.metrics_timer.start(1000)
+        self.download_progress = QProgressBar()
+        self.download_progress.setMaximumWidth(150)
+        self.download_progress.hide()
+        self.status_bar.addPermanentWidget(self.download_progress)
+        if not self.lazy_plot:
+            self.ensure_plot_canvas()
         
         plot_layout.addWidget(plot_group)
+
+        stats_group = QGroupBox("Statistics")
+        stats_layout = QGridLayout()
+        stats_group.setLayout(stats_layout)
+        for column, heading in enumerate(STATS_COLUMNS, 1):
+            stats_layout.addWidget(QLabel(f"<b>{heading}</b>"), 0, column, Qt.AlignRight)
+        self.stats_labels = {}
+        for row, (key, title) in enumerate(STATS_ROWS, 1):
+            stats_layout.addWidget(QLabel(title), row, 0)
+            for column, heading in enumerate(STATS_COLUMNS, 1):
+                label = QLabel("-")
+                label.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                stats_layout.addWidget(label, row, column)
+                self.stats_labels[key, heading.lower()] = label
+        self.energy_label = QLabel("Energy: - mWh   Charge: - mAh   Duration: - s")
+        stats_layout.addWidget(self.energy_label, len(STATS_ROWS) + 1, 0, 1, len(STATS_COLUMNS) + 1)
+        self.last_stats_update = 0.0
+        plot_layout.addWidget(stats_group)
         
         splitter.addWidget(plot_widget)
         
@@ -430,15 +868,102 @@ class SerialMonitor(QMainWindow):
         help_action2 = QShortcut(QKeySequence("ctrl+h"), self)
         help_action2.activated.connect(self.show_help)
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.plot_canvas is None and not self.plot_pending:
+            self.plot_pending = True
+            QTimer.singleShot(0, self.ensure_plot_canvas)
+
+    def ensure_plot_canvas(self):
+        if self.plot_canvas is None:
+            self.plot_canvas = self.build_plot_canvas()
+            self.plot_inner_layout.replaceWidget(self.plot_placeholder, self.plot_canvas)
+            self.plot_placeholder.deleteLater()
+            self.attach_sinks()
+        return self.plot_canvas
+
+    def build_plot_canvas(self):
+        if PLOT_ENGINES[self.plot_engine_combo.currentText()] == "qpainter":
+            from plotpainter import StackedPlotCanvas as canvas_class
+        else:
+            from plotcanvas import LivePlotCanvas as canvas_class
+        value = self.plot_points_combo.currentText()
+        plot_canvas = canvas_class(max_points=None if value == "All" else int(value))
+        plot_canvas.fps_changed.connect(lambda fps: self.fps_label.setText(f"Plot: {fps:.0f} FPS"))
+        plot_canvas.metrics = self.metrics
+        return plot_canvas
+
+    def change_plot_engine(self, name):
+        if self.plot_canvas is None:
+            return
+        old_canvas = self.plot_canvas
+        self.plot_canvas = self.build_plot_canvas()
+        self.plot_inner_layout.replaceWidget(old_canvas, self.plot_canvas)
+        old_canvas.render_timer.stop()
+        old_canvas.deleteLater()
+        # The new canvas starts from the samples recorded so far
+        store = self.data_manager.store if self.data_manager else None
+        if store is not None and len(store):
+            self.plot_canvas.load_records(store.records())
+        self.attach_sinks()
+        self.output_box.append(f"✅ Plot engine: {name}")
+
     def show_help(self):
-        self.help_window = HelpWindow()
+        if self.help_window is None:
+            self.help_window = HelpWindow()
         self.help_window.show_centered(self)
-        
+        self.help_window.raise_()
+        self.help_window.activateWindow()
+        
+    def show_diagnostics(self):
+        if self.diagnostics_window is None:
+            self.diagnostics_window = DiagnosticsWindow(self)
+        self.diagnostics_window.show()
+        self.diagnostics_window.raise_()
+
+    def writer_queue_depth(self):
+        writer = self.data_manager.writer if self.data_manager else None
+        return writer.queue.qsize() if writer and writer.queue is not None else 0
+
+    def update_metrics(self):
+        snapshot = self.metrics.snapshot()
+        if self.serial_thread:
+            self.metrics_label.setText(summary_line(snapshot))
+            self.update_loss(snapshot)
+        window = self.diagnostics_window
+        if window:
+            if window.isVisible():
+                window.show_snapshot(snapshot)
+            path = window.export_path()
+            if path:
+                try:
+                    write_metrics(path, snapshot)
+                except OSError as e:
+                    window.export_checkbox.setChecked(False)
+                    self.output_box.append(f"❌ Metrics export to {path} failed: {e}")
+
+    def show_multi_device(self):
+        if self.multi_device_window is None:
+            from multimonitor import MultiDeviceMonitor
+            self.multi_device_window = MultiDeviceMonitor()
+        self.multi_device_window.show()
+        self.multi_device_window.raise_()
+
     def refresh_ports(self):
+        # comports() can take seconds on Windows, so it runs off the GUI thread
+        if self.port_scanner and self.port_scanner.isRunning():
+            return
+        self.refresh_btn.setEnabled(False)
+        self.status_bar.showMessage("Scanning ports...")
+        self.port_scanner = PortScanner()
+        self.port_scanner.ports_found.connect(self.populate_ports)
+        self.port_scanner.start()
+
+    def populate_ports(self, ports):
+        self.refresh_btn.setEnabled(True)
         self.port_combo.clear()
-        ports = serial.tools.list_ports.comports()
-        ch340_ports = [p for p in ports if "CH340" in p.description]
-        other_ports = [p for p in ports if "CH340" not in p.description]
+        ch340_ports = [p for p in ports if "CH340" in p[1]]
+        other_ports = [p for p in ports if "CH340" not in p[1]]
         sorted_ports = ch340_ports + other_ports
         
         if not sorted_ports:
@@ -446,8 +971,8 @@ class SerialMonitor(QMainWindow):
             self.status_bar.showMessage("No serial ports found")
             return
             
-        for port in sorted_ports:
-            self.port_combo.addItem(f"{port.device} - {port.description}", port.device)
+        for device, description in sorted_ports:
+            self.port_combo.addItem(f"{device} - {description}", device)
         
         if ch340_ports:
             self.port_combo.setCurrentIndex(0)
@@ -456,20 +981,50 @@ class SerialMonitor(QMainWindow):
 
     def start_reading(self):
         selected_port = self.port_combo.currentData()
+        typed_port = self.port_combo.currentText().strip()
+        if typed_port and typed_port != self.port_combo.itemText(self.port_combo.currentIndex()):
+            selected_port = typed_port
         if not selected_port:
             self.output_box.append("Please select a port.")
             self.status_bar.showMessage("No port selected")
             return
 
         baudrate = int(self.baudrate_combo.currentText())
-        self.serial_thread = SerialReader(selected_port, baudrate)
+        batch_text = self.batch_rate_combo.currentText()
+        batch_rate = 0 if batch_text == "Off" else int(batch_text.split()[0])
+        raw_log_path = None
+        if self.raw_log_checkbox.isChecked() and not selected_port.startswith(REPLAY_SCHEME):
+            raw_log_dir = os.path.join(os.path.expanduser("~"), "SerialMonitor_RawLogs")
+            os.makedirs(raw_log_dir, exist_ok=True)
+            import datetime
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            raw_log_path = os.path.join(raw_log_dir, f"raw_{timestamp}.rawlog")
+        self.display_policy = DISPLAY_POLICIES[self.queue_policy_combo.currentText()]
+        self.serial_thread = SerialReader(selected_port, baudrate, batch_rate=batch_rate, raw_log_path=raw_log_path,
+                                          metrics=self.metrics)
         self.serial_thread.data_received.connect(self.handle_data)
+        self.serial_thread.items_ready.connect(self.drain_serial_queue)
+        self.gap_detector.reset()
+        self.reported_loss = (0, 0)
         self.serial_thread.start()
         
-        self.data_manager = DataManager()
+        self.data_manager = DataManager(self.write_policy(), metrics=self.metrics)
+        self.update_stats(force=True)
+        if self.archive_checkbox.isChecked():
+            try:
+                # Compressed on its own thread, off the GUI thread
+                self.archive_writer = ThreadedSink(ArchiveWriter(os.path.join(os.path.expanduser("~"),
+                                                                              "SerialMonitor_Archive")))
+                self.output_box.append(f"✅ Compressed archive: {self.archive_writer.sink.manifest_path}")
+            except (OSError, ValueError) as e:
+                self.output_box.append(f"❌ Could not start the archive: {e}")
+        self.attach_sinks()
         
         self.output_box.append(f"✅ Connected to {selected_port} at {baudrate} baud.")
         self.output_box.append(f"✅ Temporary file created: {self.data_manager.filename}")
+        self.output_box.append(f"✅ Binary session store: {self.data_manager.store.path}")
+        if raw_log_path:
+            self.output_box.append(f"✅ Raw capture log: {raw_log_path}")
         self.status_bar.showMessage(f"Connected to {selected_port}")
         
         if self.auto_save_checkbox.isChecked():
@@ -478,13 +1033,34 @@ class SerialMonitor(QMainWindow):
         self.start_btn.setEnabled(False)
         self.port_combo.setEnabled(False)
         self.baudrate_combo.setEnabled(False)
+        self.batch_rate_combo.setEnabled(False)
+        self.queue_policy_combo.setEnabled(False)
         self.stop_btn.setEnabled(True)
-        self.plot_canvas.clear_plot()
+        if self.plot_canvas:
+            self.plot_canvas.clear_plot()
+
+    def replay_raw_log(self):
+        if self.serial_thread:
+            self.output_box.append("Disconnect before starting a replay.")
+            return
+        path, _ = QFileDialog.getOpenFileName(self, "Replay Raw Capture Log",
+                                              os.path.join(os.path.expanduser("~"), "SerialMonitor_RawLogs"),
+                                              "Raw Capture Logs (*.rawlog);;All Files (*)")
+        if not path:
+            return
+        speed, ok = QInputDialog.getItem(self, "Replay Speed", "Speed:", list(REPLAY_SPEEDS), 0, False)
+        if not ok:
+            return
+        self.port_combo.setEditText(replay_url(path, REPLAY_SPEEDS[speed]))
+        self.start_reading()
 
     def stop_reading(self):
         if self.serial_thread:
             self.serial_thread.stop()
+            self.drain_serial_queue(limit=None)
+            self.update_loss(self.metrics.snapshot())
             self.serial_thread = None
+            self.close_archive()
             self.output_box.append("⏹ Connection closed.")
             self.status_bar.showMessage("Disconnected")
             
@@ -493,80 +1069,340 @@ class SerialMonitor(QMainWindow):
             self.start_btn.setEnabled(True)
             self.port_combo.setEnabled(True)
             self.baudrate_combo.setEnabled(True)
+            self.batch_rate_combo.setEnabled(True)
+            self.queue_policy_combo.setEnabled(True)
             self.stop_btn.setEnabled(False)
 
+    def drain_serial_queue(self, limit=DRAIN_LIMIT):
+        # At most `limit` items per call, so a backlog is worked off in
+        # slices with repaints and input handled in between
+        reader = self.serial_thread
+        if not reader:
+            return
+        backlog = len(reader.queue)
+        items = reader.queue.get_all(limit)
+        hidden = 0
+        if self.display_policy == SHOW_NEWEST:
+            hidden = min(len(items), max(0, backlog - DISPLAY_BACKLOG))
+            self.metrics.counters["display_hidden"] += hidden
+        if items:
+            self.handle_lines(items, hidden)
+        if len(reader.queue):
+            QTimer.singleShot(0, self.drain_serial_queue)
+
+    def update_loss(self, snapshot):
+        # Live loss figures, plus a console line once a second while the
+        # firmware Index keeps showing new gaps
+        counters = snapshot["counters"]
+        overruns = self.serial_thread.overruns if self.serial_thread else None
+        self.loss_label.setText(f"Lost: {self.gap_detector.lost}  "
+                                f"Not shown: {counters['display_hidden']['total']}  "
+                                f"Overruns: {'n/a' if overruns is None else overruns}")
+        lost, gaps = self.gap_detector.lost, self.gap_detector.gaps
+        reported_lost, reported_gaps = self.reported_loss
+        if gaps > reported_gaps:
+            self.output_box.append(f"⚠️ Lost {lost - reported_lost} samples in {gaps - reported_gaps} gaps "
+                                   f"(firmware Index), {lost} in total")
+            self.reported_loss = (lost, gaps)
+
+    def attach_sinks(self):
+        # The plot and the archive take their samples from the data
+        # manager's pipeline, next to its CSV, store and statistics
+        if self.data_manager:
+            self.data_manager.pipeline.attach("plot", self.plot_canvas, display=True)
+            self.data_manager.pipeline.attach("archive", self.archive_writer)
+
+    def close_archive(self):
+        if self.archive_writer:
+            archive_sink = self.archive_writer
+            writer = archive_sink.sink
+            self.archive_writer = None
+            self.attach_sinks()
+            try:
+                archive_sink.close()
+                segments = writer.segments
+                self.output_box.append(f"✅ Archived {writer.data_count} samples in {len(segments)} "
+                                       f"segments, {sum(segment['bytes'] for segment in segments) / 1e6:.2f} MB")
+            except OSError as e:
+                self.output_box.append(f"❌ Error closing the archive: {e}")
+
     def handle_data(self, line):
-        if self.output_box.document().lineCount() > self.max_display_lines:
-            cursor = self.output_box.textCursor()
-            cursor.movePosition(QTextCursor.Start)
-            cursor.movePosition(QTextCursor.Down, QTextCursor.KeepAnchor, 100)
-            cursor.removeSelectedText()
+        self.handle_lines([line])
+
+    def handle_lines(self, lines, hidden=0):
+        # The first `hidden` items are stored and acted on but not shown
+        start = time.perf_counter()
+        console = []
+        last_sample = None
+        samples = 0
+        text_lines = 0
+        for position, line in enumerate(lines):
+            if line.__class__ is str:
+                text_lines += 1
+            sample = self.process_line(line, console, position >= hidden)
+            if sample:
+                last_sample = sample
+                samples += 1
+        counters = self.metrics.counters
+        counters["items_handled"] += len(lines)
+        counters["lines"] += text_lines
+        counters["samples"] += samples
+        self.metrics.stages["handle"].observe(time.perf_counter() - start)
+
+        if console:
+            self.output_box.append_lines(console)
+
+        if last_sample and self.plot_canvas:
+            self.plot_canvas.redraw()
+            self.status_bar.showMessage(f"Last values: BusVoltage={last_sample.bus_voltage:.2f} V, ShuntVoltage={last_sample.shunt_voltage:.2f} mV")
+        if last_sample:
+            self.update_stats()
+
+    def update_stats(self, force=False, stats=None):
+        # The figures are kept per sample by DataManager; the labels only
+        # need refreshing a few times a second
+        now = time.monotonic()
+        if not force and now - self.last_stats_update < STATS_REFRESH_INTERVAL:
+            return
+        self.last_stats_update = now
+        if stats is None and self.data_manager:
+            stats = self.data_manager.stats
+        for key, _ in STATS_ROWS:
+            running = getattr(stats, key) if stats else None
+            values = {"mean": running.mean, "min": running.min, "max": running.max,
+                      "rms": running.rms(), "std": running.std()} if running and running.count else {}
+            for heading in STATS_COLUMNS:
+                value = values.get(heading.lower())
+                self.stats_labels[key, heading.lower()].setText("-" if value is None else f"{value:.3f}")
+        if stats and stats.current.count:
+            self.energy_label.setText(f"Energy: {stats.energy_mwh:.4f} mWh   Charge: {stats.charge_mah:.4f} mAh   "
+                                      f"Duration: {stats.duration:.1f} s")
+        else:
+            self.energy_label.setText("Energy: - mWh   Charge: - mAh   Duration: - s")
+
+    def process_line(self, line, console, display=True):
+        if isinstance(line, Sample):
+            # Decoded binary frame: already a complete sample
+            if display:
+                console.append(f"Data -> {','.join(sample_row(line))}")
+            self.record_sample(line, console, display)
+            return line
+
+        if not isinstance(line, str):
+            self.handle_file_item(line, console)
+            return None
 
         if self.waiting_for_new_file:
             if "New file:" in line:
                 self.new_file_received = True
                 self.waiting_for_new_file = False
-                self.output_box.append(f"✅ {line}")
-                if self.auto_scroll_checkbox.isChecked():
-                    self.output_box.moveCursor(QTextCursor.End)
-            return 
+                console.append(f"✅ {line}")
+            return None
             
         if self.is_receiving_file_data:
-            import time
             self.last_data_time = time.time()
-            
-            if self.temp_file_manager:
-                self.temp_file_manager.add_data(line)
+
+            queue = self.download_queue
+            if line == "File not found." and queue and queue.current():
+                download = queue.fail()
+                console.append(f"❌ data{download.file_number}.txt: {line}")
+                self.send_download_requests()
+                if queue.is_finished():
+                    self.finish_download_queue(console)
+                return None
+
+            if queue and queue.total > 1:
+                self.end_file_download()
+                console.append("❌ The board does not send framed files (old firmware); download one file at a time")
+                return None
+
+            # Firmware without the framed download: plain lines, the end is
+            # only detected by the idle timeout
+            if not self.temp_file_manager:
+                self.temp_file_manager = TempCsvFile(self.write_policy())
+            self.temp_file_manager.add_data(line)
             
             if self.temp_file_manager.data_count % 10 == 0:  
-                self.output_box.append(f"📊 Receiving data... ({self.temp_file_manager.data_count} points)")
-                if self.auto_scroll_checkbox.isChecked():
-                    self.output_box.moveCursor(QTextCursor.End)
+                console.append(f"📊 Receiving data... ({self.temp_file_manager.data_count} points)")
             
-            return
+            return None
             
         elif self.is_waiting_for_files:
             if "Available data files:" in line:
-                self.output_box.append("\n📁 --- AVAILABLE DATA FILES --- 📁")
-                self.output_box.append(f"{line}")
+                console.append("\n📁 --- AVAILABLE DATA FILES --- 📁")
+                console.append(f"{line}")
                 self.file_list_received = True
+                self.sd_file_numbers = []
                 
-                self.output_box.append("\n👉 Please enter the file number you want to select.")
-                self.output_box.append("👉 Send 'q' to return to normal mode when finished.\n")
-                
-                if self.auto_scroll_checkbox.isChecked():
-                    self.output_box.moveCursor(QTextCursor.End)
-                return
+                console.append("\n👉 Please enter the file number you want to select.")
+                console.append("👉 Send 'q' to return to normal mode when finished.\n")
+                return None
             
             elif self.file_list_received and any(f"[{i}]" in line for i in range(10)):
-                self.output_box.append(f"{line}")
-                if self.auto_scroll_checkbox.isChecked():
-                    self.output_box.moveCursor(QTextCursor.End)
-                return
+                console.append(f"{line}")
+                return None
+
+            elif self.file_list_received and SD_FILE_NAME.match(line):
+                self.sd_file_numbers.append(int(SD_FILE_NAME.match(line).group(1)))
+                self.download_btn.setEnabled(True)
+                console.append(f"{line}")
+                return None
             
             elif not self.file_list_received:
+                return None
+
+        if display:
+            console.append(f"{line}")
+
+        sample = self.sample_parser.feed(line)
+        if sample:
+            self.record_sample(sample, console, display)
+        return sample
+
+    def handle_file_item(self, item, console):
+        queue = self.download_queue
+        if not self.is_receiving_file_data or not queue or not queue.current():
+            return
+        self.last_data_time = time.time()
+        download = queue.current()
+
+        if isinstance(item, FileHeader):
+            began = queue.begin(item)
+            # The header proves the framed protocol: fill the request window
+            # now, so the next file follows this one without a round trip
+            self.send_download_requests()
+            if not began:
+                console.append(f"❌ {item.name}: board resumed at byte {item.offset}, local copy is shorter; skipped")
                 return
+            resume = f" (resuming at byte {item.offset})" if item.offset else ""
+            console.append(f"📥 {item.name}: {item.size} bytes{resume}")
+            self.next_progress_report = 0.1
 
-        self.output_box.append(f"{line}")
-        if self.auto_scroll_checkbox.isChecked():
-            self.output_box.moveCursor(QTextCursor.End)
+        elif isinstance(item, FileTrailer):
+            name = download.header.name if download.header else f"data{download.file_number}.txt"
+            received = download.file is not None
+            queue.finish(item)
+            if download.verified and download.target:
+                console.append(f"✅ {name} verified: {download.header.size} bytes, "
+                               f"{download.records} records -> {download.target}")
+            elif download.verified:
+                elapsed = download.finished - download.started
+                console.append(f"✅ {name} received and verified: {download.header.size} bytes, "
+                               f"{download.records} records in {elapsed:.2f} s "
+                               f"({download.throughput() / 1024:.1f} KB/s)")
+                self.file_download = download
+                self.file_data_received = True
+                QTimer.singleShot(500, self.prompt_save_file_data)
+            elif received:
+                console.append(f"❌ {name}: checksum mismatch, download it again")
+            self.send_download_requests()
+            if queue.is_finished():
+                self.finish_download_queue(console)
+            else:
+                self.update_download_progress()
 
-        if "Data ->" in line:
-            try:
-                parts = line.split("Data ->")[-1].strip()
-                values = parts.split(",")
-                
-                if self.data_manager:
-                    self.data_manager.add_data(values)
-                    
-                    if self.auto_save_checkbox.isChecked():
-                        self.auto_save_counter = self.data_manager.data_count
+        else:
+            queue.write(item)
+            self.update_download_progress()
+            progress = download.progress()
+            if queue.total == 1 and progress >= self.next_progress_report:
+                self.next_progress_report = int(progress * 10 + 1) / 10
+                console.append(f"📊 Receiving data... {progress * 100:.0f}% "
+                               f"({download.throughput() / 1024:.1f} KB/s)")
 
-                if len(values) >= 5:
-                    self.plot_canvas.update_plot(values[0], values[1])  
-                    self.status_bar.showMessage(f"Last values: BusVoltage={values[0]}, ShuntVoltage={values[1]}")
-            except Exception as e:
-                self.output_box.append(f"Error processing data: {e}")
+    def update_download_progress(self):
+        queue = self.download_queue
+        self.download_progress.setValue(int(queue.progress() * 100))
+        self.status_bar.showMessage(f"Downloading file {len(queue.done) + len(queue.failed) + 1} of {queue.total}: "
+                                    f"{queue.bytes_received / 1024:.1f} KB at {queue.throughput() / 1024:.1f} KB/s")
+
+    def send_download_requests(self):
+        for command in self.download_queue.requests():
+            self.serial_thread.write_data(command)
+
+    def finish_download_queue(self, console):
+        queue = self.download_queue
+        self.end_file_download()
+        if queue.total > 1:
+            elapsed = time.monotonic() - queue.started
+            console.append(f"✅ Downloaded {len(queue.done)} of {queue.total} files: "
+                           f"{queue.bytes_received / 1024:.1f} KB in {elapsed:.1f} s "
+                           f"({queue.throughput() / 1024:.1f} KB/s)")
+        if queue.failed:
+            names = ", ".join(f"data{download.file_number}.txt" for download in queue.failed)
+            console.append(f"⚠️ Not downloaded: {names}; download them again (stalled files resume)")
+
+    def end_file_download(self):
+        self.file_data_timer.stop()
+        self.is_receiving_file_data = False
+        self.download_progress.hide()
+        if self.download_queue and not self.download_queue.is_finished():
+            self.download_queue.abort()
+            # The decoder may still expect file bytes that will never come
+            if self.serial_thread:
+                self.serial_thread.cancel_file()
+
+    def start_download_queue(self, queue):
+        self.download_queue = queue
+        self.temp_file_manager = None
+        self.is_receiving_file_data = True
+        self.file_data_received = False
+        self.download_progress.setValue(0)
+        self.download_progress.show()
+        self.send_download_requests()
+        self.last_data_time = time.time()
+        self.file_data_timer.start(500)
+
+    def request_file(self, file_number):
+        download = self.file_downloads.get(file_number)
+        if not download:
+            fd, part_path = tempfile.mkstemp(suffix='.part', prefix=f'data{file_number}_')
+            os.close(fd)
+            download = self.file_downloads[file_number] = FileDownload(file_number, part_path)
+        self.selected_file_number = file_number
+        offset = download.offset()
+        self.start_download_queue(DownloadQueue([download], window=1))
+        if offset:
+            self.output_box.append(f"🔄 Sent file number: {file_number} (resuming from byte {offset})")
+        else:
+            self.output_box.append(f"🔄 Sent file number: {file_number}")
+        self.output_box.append("⏳ Waiting for file data...")
+
+    def download_files(self):
+        if not self.serial_thread or self.is_receiving_file_data or not self.sd_file_numbers:
+            return
+        dialog = DownloadDialog(self.sd_file_numbers, self.download_directory, self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        try:
+            numbers, self.download_directory = dialog.selection()
+        except OSError as e:
+            QMessageBox.critical(self, "Download Error", f"Cannot use the download folder: {e}")
+            return
+        if not numbers:
+            return
+        downloads = []
+        for number in numbers:
+            target = os.path.join(self.download_directory, f"data{number}.csv")
+            # Next to the target, so an interrupted batch resumes next time
+            downloads.append(FileDownload(number, target + ".part", target))
+        self.selected_file_number = None
+        self.start_download_queue(DownloadQueue(downloads))
+        self.output_box.append(f"🔄 Downloading {len(downloads)} files to {self.download_directory}")
+
+    def record_sample(self, sample, console, display=True):
+        lost = self.gap_detector.check(sample.index)
+        if lost:
+            self.metrics.counters["samples_lost"] += lost
+            self.metrics.counters["index_gaps"] += 1
+        plot_canvas = self.ensure_plot_canvas()
+        try:
+            if self.data_manager:
+                self.data_manager.add_sample(sample, display)
+            elif display:
+                plot_canvas.add_sample(sample)
+        except Exception as e:
+            console.append(f"Error processing data: {e}")
 
     def clear_console(self):
         self.output_box.clear()
@@ -574,39 +1410,92 @@ class SerialMonitor(QMainWindow):
     def clear_data(self):
         if self.data_manager:
             old_manager = self.data_manager
-            self.data_manager = DataManager()
+            self.data_manager = DataManager(self.write_policy(), metrics=self.metrics)
+            self.attach_sinks()
             del old_manager 
+            self.sample_parser.reset()
+            self.gap_detector.reset()
+            self.reported_loss = (0, 0)
             
-            self.plot_canvas.clear_plot()
+            if self.plot_canvas:
+                self.plot_canvas.clear_plot()
+            self.update_stats(force=True)
             self.output_box.append("✅ Data cleared and plot reset.")
-            
-            self.auto_save_counter = 0
+
+    def open_session(self):
+        if self.serial_thread:
+            self.output_box.append("Disconnect before opening a session.")
+            return
+        if self.session_loader and self.session_loader.isRunning():
+            return
+        dialog = OpenSessionDialog(os.path.join(os.path.expanduser("~"), "SerialMonitor_AutoSave"), self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        path, start_time, end_time = dialog.selection()
+        if not os.path.isfile(path):
+            self.output_box.append(f"❌ No such file: {path}")
+            return
+
+        self.output_box.append(f"📂 Opening {path}...")
+        self.session_loader = SessionLoader(path, start_time, end_time)
+        self.session_loader.progress.connect(self.download_progress.setValue)
+        self.session_loader.loaded.connect(lambda records: self.show_session(path, records))
+        self.session_loader.failed.connect(lambda error: self.output_box.append(f"❌ Error opening {path}: {error}"))
+        self.session_loader.finished.connect(self.download_progress.hide)
+        self.download_progress.setValue(0)
+        self.download_progress.show()
+        self.session_loader.start()
+
+    def show_session(self, path, records):
+        if not len(records):
+            self.output_box.append(f"❌ No samples in {path} for that time range.")
+            return
+        # The whole session is shown decimated; scroll to zoom in down to
+        # single samples, drag to pan
+        plot_canvas = self.ensure_plot_canvas()
+        self.plot_points_combo.setCurrentText("All")
+        plot_canvas.load_records(records)
+        stats = SessionStats.from_arrays(records["time"], records["current"], records["power"])
+        self.update_stats(force=True, stats=stats)
+        times = records["time"]
+        self.output_box.append(f"✅ Opened {path}: {len(records)} samples, "
+                               f"{times.min():.2f} s to {times.max():.2f} s")
+        self.status_bar.showMessage(f"Session: {os.path.basename(path)}")
+
+    def write_policy(self):
+        return WRITE_POLICIES[self.write_policy_combo.currentText()]
 
     def change_plot_size(self, value):
         try:
-            max_points = int(value)
-            self.plot_canvas.max_points = max_points
-            self.output_box.append(f"✅ Plot size changed to {max_points} points.")
+            max_points = None if value == "All" else int(value)
         except ValueError:
-            pass
+            return
+        if self.plot_canvas:
+            self.plot_canvas.set_max_points(max_points)
+        if max_points is None:
+            self.output_box.append("✅ Plot shows the whole session (scroll to zoom, drag to pan, double-click to follow).")
+        else:
+            self.output_box.append(f"✅ Plot size changed to {max_points} points.")
 
     def auto_save_data(self):
         if self.data_manager and self.auto_save_checkbox.isChecked():
-            data_diff = self.data_manager.data_count - self.auto_save_counter
+            data_diff = self.data_manager.data_count - self.data_manager.checkpoint_count
             if data_diff >= 100:
                 try:
-                    auto_save_dir = os.path.join(os.path.expanduser("~"), "SerialMonitor_AutoSave")
-                    if not os.path.exists(auto_save_dir):
-                        os.makedirs(auto_save_dir)
-                        
-                    import datetime
-                    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                    filename = os.path.join(auto_save_dir, f"auto_save_{timestamp}.csv")
+                    if self.data_manager.session is None:
+                        auto_save_dir = os.path.join(os.path.expanduser("~"), "SerialMonitor_AutoSave")
+                        if not os.path.exists(auto_save_dir):
+                            os.makedirs(auto_save_dir)
+                            
+                        import datetime
+                        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                        filename = os.path.join(auto_save_dir, f"auto_save_{timestamp}.csv")
+                    else:
+                        filename = self.data_manager.session.path
                     
-                    self.data_manager.save_to_file(filename)
+                    new_rows = self.data_manager.checkpoint(filename)
                     
-                    self.output_box.append(f"🔄 Auto-saved data to {filename}")
-                    self.auto_save_counter = self.data_manager.data_count
+                    self.output_box.append(f"🔄 Auto-saved {new_rows} new rows to {filename}")
                 except Exception as e:
                     self.output_box.append(f"Auto-save failed: {e}")
 
@@ -621,67 +1510,30 @@ class SerialMonitor(QMainWindow):
             try:
                 if self.data_manager.save_to_file(filename):
                     self.output_box.append(f"✅ File saved: {filename}")
+                    self.output_box.append(f"✅ Statistics saved: {stats_path(filename)}")
                     QMessageBox.information(self, "Save Successful", f"Data successfully saved to {filename}")
             except Exception as e:
                 self.output_box.append(f"❌ Error saving file: {e}")
                 QMessageBox.critical(self, "Save Error", f"Error saving file: {e}")
 
-    def create_temp_file_manager(self, file_number):
-        class TempFileManager:
-            def __init__(self, file_number):
-                self.file_number = file_number
-                self.temp_file = tempfile.NamedTemporaryFile(mode='w+', delete=False, suffix='.csv', encoding='utf-8', newline='')
-                self.filename = self.temp_file.name
-                self.writer = csv.writer(self.temp_file)
-                self.writer.writerow(["Index", "Relative time", "Bus Voltage(V)", "Shunt Voltage(mV)", "Load Voltage(V)", "Current(mA)", "Power(mW)"])
-                self.data_count = 0
-                
-            def add_data(self, data):
-                try:
-                    if ',' in data:
-                        values = data.strip().split(',')
-                        if len(values) >= 7:
-                            self.writer.writerow(values[:7]) 
-                        else:
-                            while len(values) < 7:
-                                values.append("")
-                            self.writer.writerow(values)
-                    else:
-                        self.writer.writerow([data])
-                    
-                    self.temp_file.flush()
-                    self.data_count += 1
-                except Exception as e:
-                    print(f"Error processing data: {e}")
-                    self.writer.writerow([data])
-                    self.temp_file.flush()
-                    self.data_count += 1
-                
-            def save_to_file(self, target_filename):
-                self.temp_file.close()
-                
-                with open(self.filename, 'r', newline='') as src_file:
-                    with open(target_filename, 'w', newline='') as dst_file:
-                        dst_file.write(src_file.read())
-                
-                return True
-                
-            def __del__(self):
-                if hasattr(self, 'temp_file') and self.temp_file:
-                    self.temp_file.close()
-                    try:
-                        os.unlink(self.filename)
-                    except:
-                        pass
-        
-        return TempFileManager(file_number)
-    
     def check_file_data_completion(self):
-        import time
-        current_time = time.time()
-        
-        if self.is_receiving_file_data and (current_time - self.last_data_time > 3):
-            self.file_data_timer.stop()
+        queue = self.download_queue
+        download = queue.current() if queue else None
+        timeout = FILE_START_TIMEOUT if download and download.waiting_for_data() else FILE_IDLE_TIMEOUT
+        if self.is_receiving_file_data and (time.time() - self.last_data_time > timeout):
+            if queue and queue.framed:
+                # Framed transfer without its trailer: stalled, not finished
+                self.end_file_download()
+                if download and download.header:
+                    self.output_box.append(f"⚠️ Transfer stalled at {download.header.offset + download.received} "
+                                           f"of {download.header.size} bytes")
+                self.finish_download_queue(self.output_box)
+                return
+            self.end_file_download()
+            if not self.temp_file_manager:
+                self.output_box.append("❌ No file data received")
+                return
+
             self.output_box.append("\n✅ File data reception complete")
             self.output_box.append(f"📊 Received {self.temp_file_manager.data_count} data points")
             
@@ -691,7 +1543,15 @@ class SerialMonitor(QMainWindow):
             self.file_data_received = True
     
     def prompt_save_file_data(self):
-        if self.temp_file_manager and self.temp_file_manager.data_count > 0:
+        download = self.file_download
+        if download and download.verified:
+            source, count = download, download.records
+        elif self.temp_file_manager:
+            source, count = self.temp_file_manager, self.temp_file_manager.data_count
+        else:
+            return
+
+        if count > 0:
             filename, _ = QFileDialog.getSaveFileName(
                 self, 
                 f"Save File {self.selected_file_number} Data", 
@@ -701,7 +1561,7 @@ class SerialMonitor(QMainWindow):
             
             if filename:
                 try:
-                    if self.temp_file_manager.save_to_file(filename):
+                    if source.save_to_file(filename):
                         self.output_box.append(f"✅ File data saved to: {filename}")
                         QMessageBox.information(self, "Save Successful", f"File {self.selected_file_number} data successfully saved to {filename}")
                 except Exception as e:
@@ -709,22 +1569,36 @@ class SerialMonitor(QMainWindow):
                     QMessageBox.critical(self, "Save Error", f"Error saving file data: {e}")
             else:
                 self.output_box.append("❌ Save cancelled by user")
+
+        if source is download:
+            download.discard()
+            del self.file_downloads[download.file_number]
+            self.file_download = None
         
     def send_value(self):
         text = self.send_input.text().strip()
         if self.serial_thread and text:
-            self.serial_thread.write_data(text)
+            file_request = (self.file_list_received and self.is_waiting_for_files
+                            and not self.is_receiving_file_data and text.isdigit())
+            if not file_request:
+                self.serial_thread.write_data(text)
             
             if text in ("U", "u") :
                 self.clear_data()
                 self.clear_console()
                 self.output_box.append("✅ Command 'U' sent: Data and console cleared.")
                 self.output_box.append("⏳ Waiting for available data files list...")
+                self.end_file_download()
                 self.is_waiting_for_files = True
                 self.file_list_received = False
                 self.is_receiving_file_data = False
                 self.file_data_received = False
                 self.selected_file_number = None
+                self.file_download = None
+                self.temp_file_manager = None
+                self.download_queue = None
+                self.sd_file_numbers = []
+                self.download_btn.setEnabled(False)
                 
             elif text == "N":
                 self.waiting_for_new_file = True
@@ -736,10 +1610,12 @@ class SerialMonitor(QMainWindow):
                 if self.is_receiving_file_data and self.temp_file_manager and self.temp_file_manager.data_count > 0:
                     self.file_data_timer.stop()
                     self.prompt_save_file_data()
+                self.end_file_download()
                 
                 self.clear_data()
                 self.clear_console()
                 self.output_box.append("✅ Command 'q' sent: Returning to normal mode.")
+                self.download_btn.setEnabled(False)
                 self.is_waiting_for_files = False
                 self.file_list_received = False
                 self.is_receiving_file_data = False
@@ -748,23 +1624,8 @@ class SerialMonitor(QMainWindow):
                 self.file_data_timer.stop()
                 
             else:
-                if self.file_list_received and self.is_waiting_for_files and not self.is_receiving_file_data:
-                    try:
-                        file_number = int(text)
-                        self.output_box.append(f"🔄 Sent file number: {file_number}")
-                        self.selected_file_number = file_number
-                        self.is_receiving_file_data = True
-                        self.file_data_received = False
-                        
-                        self.temp_file_manager = self.create_temp_file_manager(file_number)
-                        
-                        import time
-                        self.last_data_time = time.time()
-                        self.file_data_timer.start(500)  
-                        
-                        self.output_box.append("⏳ Waiting for file data...")
-                    except ValueError:
-                        self.output_box.append(f"🔄 Sent: {text}")
+                if file_request:
+                    self.request_file(int(text))
                 else:
                     self.output_box.append(f"🔄 Sent: {text}")
                 
@@ -0,0 +1,190 @@
+import io
+import json
+import os
+import warnings
+import zlib
+
+import numpy as np
+
+from storage import COPY_CHUNK_SIZE, SAMPLE_DTYPE, write_json
+
+
+INDEX_VERSION = 1
+
+# Bytes before the end of the indexed part that must still match for a
+# cached index to be reused (catches a file replaced by a longer one)
+INDEX_CHECK_SIZE = 4096
+
+
+def index_path(session_path):
+    # data.csv -> data.index.json
+    return os.path.splitext(session_path)[0] + ".index.json"
+
+
+def records_from_rows(rows):
+    records = np.empty(len(rows), dtype=SAMPLE_DTYPE)
+    for column, name in enumerate(SAMPLE_DTYPE.names):
+        records[name] = rows[:, column]
+    return records
+
+
+def parse_block(data):
+    # A block of whole CSV lines -> SAMPLE_DTYPE records. The whole block is
+    # parsed by np.loadtxt in one call; only a block holding other lines
+    # (the header, firmware messages, short rows of old downloads) takes the
+    # slower path that picks the seven-column rows out first.
+    columns = len(SAMPLE_DTYPE)
+    if not data.strip():
+        return np.empty(0, dtype=SAMPLE_DTYPE)
+    try:
+        rows = np.loadtxt(io.BytesIO(data), delimiter=",", dtype=np.float64, ndmin=2)
+        if rows.shape[1] == columns:
+            return records_from_rows(rows)
+    except ValueError:
+        pass
+
+    lines = [line for line in data.splitlines()
+             if line.count(b",") == columns - 1 and line.lstrip()[:1].isdigit()]
+    try:
+        with warnings.catch_warnings():
+            # An empty selection is not worth a warning
+            warnings.simplefilter("ignore", UserWarning)
+            rows = np.loadtxt(io.BytesIO(b"\n".join(lines)), delimiter=",", dtype=np.float64, ndmin=2)
+    except ValueError:
+        rows = []
+        for line in lines:
+            try:
+                rows.append([float(value) for value in line.split(b",")])
+            except ValueError:
+                pass
+        rows = np.array(rows, dtype=np.float64)
+    return records_from_rows(rows.reshape(-1, columns))
+
+
+class CsvSession:
+    # A recorded session CSV (auto-save, saved data, downloaded SD file) read
+    # in blocks of whole lines. The byte offset, row count and time span of
+    # each block go into a sparse index cached next to the file, so a later
+    # open only reads the blocks that overlap the requested time range. An
+    # auto-save file that has grown since is not re-indexed: only its new
+    # tail is scanned. An unterminated last line (still being written) is
+    # left for the next open.
+    def __init__(self, path, block_size=COPY_CHUNK_SIZE):
+        self.path = path
+        self.index_path = index_path(path)
+        self.block_size = block_size
+        self.load_index()
+
+    def reset_index(self):
+        # Blocks: [offset, length, first row, rows, min time, max time]
+        self.blocks = []
+        self.scanned = 0
+        self.rows = 0
+        self.check = 0
+
+    def load_index(self):
+        self.reset_index()
+        try:
+            with open(self.index_path) as index_file:
+                index = json.load(index_file)
+            if index["version"] != INDEX_VERSION or index["block_size"] != self.block_size:
+                return
+            with open(self.path, 'rb') as file:
+                if os.fstat(file.fileno()).st_size < index["scanned"]:
+                    return
+                if self.checksum(file, index["scanned"]) != index["check"]:
+                    return
+            self.blocks = index["blocks"]
+            self.scanned = index["scanned"]
+            self.rows = index["rows"]
+            self.check = index["check"]
+        except (OSError, ValueError, KeyError, TypeError):
+            self.reset_index()
+
+    def save_index(self):
+        try:
+            write_json(self.index_path, {"version": INDEX_VERSION, "block_size": self.block_size,
+                                         "scanned": self.scanned, "rows": self.rows,
+                                         "check": self.check, "blocks": self.blocks})
+        except OSError as e:
+            # Read-only directory: the index is only a cache
+            print(f"Could not write session index {self.index_path}: {e}")
+
+    @staticmethod
+    def checksum(file, end):
+        start = max(0, end - INDEX_CHECK_SIZE)
+        file.seek(start)
+        return zlib.crc32(file.read(end - start))
+
+    def time_span(self):
+        if not self.blocks:
+            return None
+        return (min(block[4] for block in self.blocks), max(block[5] for block in self.blocks))
+
+    def read_block(self, file, offset, length):
+        file.seek(offset)
+        return parse_block(file.read(length))
+
+    def scan(self, file, progress=None):
+        # Parses and indexes everything after the indexed part; yields the
+        # records of each new block. progress() gets the bytes indexed so far.
+        file.seek(self.scanned)
+        rest = b""
+        while True:
+            data = file.read(self.block_size)
+            if not data:
+                break
+            data = rest + data
+            end = data.rfind(b"\n") + 1
+            if not end:
+                rest = data
+                continue
+            block, rest = data[:end], data[end:]
+            records = parse_block(block)
+            times = records["time"]
+            self.blocks.append([self.scanned, len(block), self.rows, len(records),
+                                float(times.min()) if len(times) else 0.0,
+                                float(times.max()) if len(times) else 0.0])
+            self.scanned += len(block)
+            self.rows += len(records)
+            if progress:
+                progress(self.scanned)
+            yield records
+        self.check = self.checksum(file, self.scanned)
+
+    def load(self, start_time=None, end_time=None, progress=None):
+        # Records with start_time <= time <= end_time (None: open-ended), in
+        # file order. Time may step back where the board was reset, so
+        # blocks are picked by their time span rather than by bisection.
+        low = -np.inf if start_time is None else start_time
+        high = np.inf if end_time is None else end_time
+        parts = []
+
+        def keep(records):
+            if start_time is not None or end_time is not None:
+                times = records["time"]
+                records = records[(times >= low) & (times <= high)]
+            if len(records):
+                parts.append(records)
+
+        with open(self.path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            selected = [block for block in self.blocks if block[3] and block[5] >= low and block[4] <= high]
+            total = sum(block[1] for block in selected) + size - self.scanned
+            done = 0
+            for offset, length, *_ in selected:
+                keep(self.read_block(file, offset, length))
+                done += length
+                if progress:
+                    progress(done / total if total else 1.0)
+
+            scanned = self.scanned
+            for records in self.scan(file, progress and (
+                    lambda position: progress((done + position - scanned) / total))):
+                keep(records)
+            if self.scanned != scanned:
+                self.save_index()
+
+        if not parts:
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+        return np.concatenate(parts)
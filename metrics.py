@@ -0,0 +1,131 @@
+import json
+import os
+import time
+
+
+# Counters bumped along the pipeline, in pipeline order:
+#   reader thread: bytes_read, chunks_read, frame_errors, overruns,
+#                  items_emitted
+#   GUI thread: display_hidden (items stored but not shown by the display
+#               policy), items_handled, lines, samples, samples_lost,
+#               index_gaps, console_dropped, frames_rendered
+COUNTERS = ["bytes_read", "chunks_read", "frame_errors", "overruns", "items_emitted", "display_hidden",
+            "items_handled", "lines", "samples", "samples_lost", "index_gaps", "console_dropped",
+            "frames_rendered"]
+
+# Timed stages: decode (reader thread, per chunk), handle (GUI thread, per
+# batch: line parsing and routing, storage and plot update included), write
+# (per sample, the sample pipeline's storage sinks; the plot is not
+# included), render (per plot frame), console (per flush)
+STAGES = ["decode", "handle", "write", "render", "console"]
+
+PROMETHEUS_PREFIX = "ina219_"
+
+
+class StageTimer:
+    # Count, total and worst time of one pipeline stage. perf_counter pairs
+    # around the stage cost well under a microsecond.
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds, count=1):
+        self.count += count
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+
+class PipelineMetrics:
+    # Every counter and stage is written by one thread only, as plain
+    # integer and float updates, so nothing is locked; snapshot() reads them
+    # from the GUI thread. Gauges are callables sampled at snapshot time.
+    def __init__(self):
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.stages = {name: StageTimer() for name in STAGES}
+        self.gauges = {}
+        self.started = time.monotonic()
+        self.last_time = self.started
+        self.last_counters = dict(self.counters)
+        self.last_stages = {name: (0, 0.0) for name in STAGES}
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def gauge(self, name, source):
+        self.gauges[name] = source
+
+    def snapshot(self):
+        # Totals since start; rates, means and worst times since the
+        # previous snapshot
+        now = time.monotonic()
+        elapsed = max(now - self.last_time, 1e-9)
+        counters = {}
+        for name, value in list(self.counters.items()):
+            counters[name] = {"total": value, "rate": (value - self.last_counters.get(name, 0)) / elapsed}
+            self.last_counters[name] = value
+        stages = {}
+        for name, stage in self.stages.items():
+            count, total = stage.count, stage.total
+            last_count, last_total = self.last_stages[name]
+            calls = count - last_count
+            stages[name] = {"count": count, "seconds": total,
+                            "mean_ms": (total - last_total) / calls * 1000 if calls else 0.0,
+                            "max_ms": stage.max * 1000,
+                            "busy": (total - last_total) / elapsed}
+            self.last_stages[name] = (count, total)
+            stage.max = 0.0
+        gauges = {}
+        for name, source in list(self.gauges.items()):
+            try:
+                gauges[name] = source()
+            except Exception:
+                gauges[name] = None
+        self.last_time = now
+        return {"time": time.time(), "uptime_s": now - self.started, "interval_s": elapsed,
+                "counters": counters, "stages": stages, "gauges": gauges}
+
+
+def summary_line(snapshot):
+    counters = snapshot["counters"]
+    stages = snapshot["stages"]
+    queue_depth = snapshot["gauges"].get("queue_depth")
+    return (f"{counters['bytes_read']['rate'] / 1024:.1f} KB/s, "
+            f"{counters['samples']['rate']:.0f} samples/s, "
+            f"render {stages['render']['mean_ms']:.1f} ms, "
+            f"queue {queue_depth if queue_depth is not None else '-'}")
+
+
+def prometheus_text(snapshot):
+    # Text exposition format: counters as *_total, stage time and calls per
+    # stage label, worst time since the last dump and gauges as gauges
+    lines = []
+    for name, counter in snapshot["counters"].items():
+        metric = f"{PROMETHEUS_PREFIX}{name}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {counter['total']}"]
+    for suffix, key, kind in (("stage_seconds_total", "seconds", "counter"),
+                              ("stage_calls_total", "count", "counter"),
+                              ("stage_max_seconds", "max_ms", "gauge")):
+        metric = f"{PROMETHEUS_PREFIX}{suffix}"
+        lines.append(f"# TYPE {metric} {kind}")
+        for stage, values in snapshot["stages"].items():
+            value = values[key] / 1000 if key == "max_ms" else values[key]
+            lines.append(f'{metric}{{stage="{stage}"}} {value}')
+    for name, value in snapshot["gauges"].items():
+        if value is not None:
+            metric = f"{PROMETHEUS_PREFIX}{name}"
+            lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path, snapshot):
+    # .prom (node_exporter textfile collector) or JSON, replaced atomically
+    if path.endswith((".prom", ".txt")):
+        text = prometheus_text(snapshot)
+    else:
+        text = json.dumps(snapshot, indent=1)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w') as metrics_file:
+        metrics_file.write(text)
+    os.replace(temp_path, path)
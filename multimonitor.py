@@ -0,0 +1,389 @@
+import os
+import sys
+import time
+
+from PyQt5.QtWidgets import (
+    QApplication, QWidget, QVBoxLayout, QHBoxLayout, QGridLayout, QGroupBox, QComboBox,
+    QPushButton, QLabel, QLineEdit, QListWidget, QListWidgetItem, QScrollArea, QFileDialog,
+    QMainWindow, QStatusBar, QMessageBox
+)
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal, Qt
+from PyQt5.QtGui import QFont
+
+from gui import ConsoleView, PortScanner
+from plotpainter import StackedPlotCanvas
+from rawlog import open_port
+from samples import GapDetector, Sample, SampleParser
+from serial_io import PortMultiplexer
+from storage import DEFAULT_WRITE_POLICY, WRITE_POLICIES, DataManager, safe_file_name
+
+
+# Every board's plot is rendered from one tick: at most PLOT_FRAME_BUDGET
+# frames per second for all boards together, BOARD_MAX_FPS for any one
+PLOT_TICK_RATE = 60
+PLOT_FRAME_BUDGET = 120
+BOARD_MAX_FPS = 30
+
+
+class MultiSerialReader(QThread):
+    # One thread for all ports: PortMultiplexer waits on every port at once
+    # and what arrived is emitted as one list of (port, host time, items) per
+    # batch interval. Host time is time.monotonic() at the read, the same
+    # clock for every board.
+    batches_received = pyqtSignal(list)
+
+    def __init__(self, ports, baudrate=115200, batch_rate=30, read_timeout=0.1):
+        super().__init__()
+        self.ports = ports
+        self.baudrate = baudrate
+        self.batch_rate = batch_rate
+        self.read_timeout = read_timeout
+        self.serials = {}
+        self.running = False
+
+    def run(self):
+        self.running = True
+        batch_interval = 1.0 / self.batch_rate
+        multiplexer = PortMultiplexer()
+        pending = []
+        for port in self.ports:
+            try:
+                self.serials[port] = open_port(port, self.baudrate, timeout=0)
+                multiplexer.add(port, self.serials[port])
+            except Exception as e:
+                pending.append((port, time.monotonic(), [f"❌ Connection failed: {e}"]))
+
+        last_emit = time.monotonic()
+        while self.running and multiplexer.readers:
+            results = multiplexer.read(min(self.read_timeout, batch_interval))
+            now = time.monotonic()
+            for port, items in results.items():
+                pending.append((port, now, items))
+            if pending and now - last_emit >= batch_interval:
+                self.batches_received.emit(pending)
+                pending = []
+                last_emit = now
+        multiplexer.close()
+        if pending:
+            self.batches_received.emit(pending)
+
+    def stop(self):
+        self.running = False
+        self.wait()
+
+    def write_data(self, text):
+        for port, serial_port in self.serials.items():
+            if serial_port.is_open:
+                try:
+                    serial_port.write(f"{text}\n".encode('utf-8'))
+                except Exception as e:
+                    print(f"Error sending to {port}: {e}")
+
+
+class DeviceChannel:
+    # Everything one board owns: its parser, session store and plot (a sink
+    # of the session's sample pipeline, rendered by the window's plot tick)
+    def __init__(self, port, policy, max_points=500):
+        self.port = port
+        self.parser = SampleParser()
+        self.gap_detector = GapDetector()
+        self.data_manager = DataManager(policy)
+        self.plot_canvas = StackedPlotCanvas(max_points=max_points, max_fps=None, title=port)
+        self.data_manager.pipeline.attach("plot", self.plot_canvas, display=True)
+        self.status_label = QLabel(f"{port}: waiting for data")
+        self.last_sample = None
+        # Board time + clock_offset = session time; board_time is the last
+        # time the board itself reported
+        self.clock_offset = None
+        self.board_time = None
+
+    def session_time(self, sample, host_time):
+        # Samples keep the board's own spacing; the offset is taken from the
+        # host clock at the first sample and again after a board reset
+        # (its clock steps back), never moving a sample before the last one
+        if self.clock_offset is None:
+            self.clock_offset = host_time - sample.time
+        elif sample.time < self.board_time:
+            last_time = self.board_time + self.clock_offset
+            self.clock_offset = max(host_time, last_time) - sample.time
+        self.board_time = sample.time
+        return sample._replace(time=sample.time + self.clock_offset)
+
+    def add_sample(self, sample):
+        self.gap_detector.check(sample.index)
+        self.data_manager.add_sample(sample)
+        self.last_sample = sample
+
+    def update_status(self):
+        sample = self.last_sample
+        if sample:
+            self.status_label.setText(f"{self.port}: {self.data_manager.data_count} samples, "
+                                      f"BusVoltage={sample.bus_voltage:.2f} V, "
+                                      f"ShuntVoltage={sample.shunt_voltage:.2f} mV, t={sample.time:.2f} s, "
+                                      f"{self.data_manager.stats.energy_mwh:.3f} mWh, "
+                                      f"{self.data_manager.stats.charge_mah:.3f} mAh, "
+                                      f"lost {self.gap_detector.lost}")
+
+
+class MultiDeviceMonitor(QMainWindow):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Serial Monitor - Multiple Devices")
+        self.resize(900, 800)
+        self.serial_thread = None
+        self.port_scanner = None
+        self.devices = {}
+        self.start_time = None
+        # Fractional frames owed by the plot tick, and the next board in turn
+        self.render_credit = 0.0
+        self.render_cursor = 0
+
+        self.central_widget = QWidget()
+        self.setCentralWidget(self.central_widget)
+        self.status_bar = QStatusBar()
+        self.setStatusBar(self.status_bar)
+        self.status_bar.showMessage("Disconnected")
+        self.init_ui()
+
+        self.render_timer = QTimer(self)
+        self.render_timer.timeout.connect(self.render_plots)
+        self.render_timer.start(int(1000 / PLOT_TICK_RATE))
+
+    def init_ui(self):
+        main_layout = QVBoxLayout(self.central_widget)
+
+        ports_group = QGroupBox("Devices")
+        ports_layout = QGridLayout()
+        ports_group.setLayout(ports_layout)
+
+        self.port_list = QListWidget()
+        self.port_list.setMaximumHeight(110)
+        ports_layout.addWidget(self.port_list, 0, 0, 3, 1)
+
+        self.refresh_btn = QPushButton("Refresh")
+        self.refresh_btn.clicked.connect(self.refresh_ports)
+        ports_layout.addWidget(self.refresh_btn, 0, 1)
+
+        add_layout = QHBoxLayout()
+        self.add_input = QLineEdit()
+        self.add_input.setPlaceholderText("Port or URL (socket://host:port, replay://path?speed=N)")
+        self.add_btn = QPushButton("Add")
+        self.add_btn.clicked.connect(self.add_port)
+        add_layout.addWidget(self.add_input)
+        add_layout.addWidget(self.add_btn)
+        ports_layout.addLayout(add_layout, 0, 2)
+
+        settings_layout = QHBoxLayout()
+        settings_layout.addWidget(QLabel("Baudrate:"))
+        self.baudrate_combo = QComboBox()
+        self.baudrate_combo.addItems(["9600", "19200", "38400", "57600", "115200"])
+        self.baudrate_combo.setCurrentText("115200")
+        settings_layout.addWidget(self.baudrate_combo)
+        settings_layout.addWidget(QLabel("Write policy:"))
+        self.write_policy_combo = QComboBox()
+        self.write_policy_combo.addItems(list(WRITE_POLICIES))
+        self.write_policy_combo.setCurrentText(DEFAULT_WRITE_POLICY)
+        settings_layout.addWidget(self.write_policy_combo)
+        ports_layout.addLayout(settings_layout, 1, 2)
+
+        connection_layout = QHBoxLayout()
+        self.start_btn = QPushButton("Connect")
+        self.start_btn.clicked.connect(self.start_reading)
+        self.stop_btn = QPushButton("Disconnect")
+        self.stop_btn.clicked.connect(self.stop_reading)
+        self.stop_btn.setEnabled(False)
+        self.save_btn = QPushButton("Save All...")
+        self.save_btn.clicked.connect(self.save_all)
+        connection_layout.addWidget(self.start_btn)
+        connection_layout.addWidget(self.stop_btn)
+        connection_layout.addWidget(self.save_btn)
+        ports_layout.addLayout(connection_layout, 1, 1)
+
+        send_layout = QHBoxLayout()
+        self.send_input = QLineEdit()
+        self.send_input.setPlaceholderText("Command for every board (e.g. a delay in ms)")
+        self.send_input.returnPressed.connect(self.send_to_all)
+        self.send_btn = QPushButton("Send to All")
+        self.send_btn.clicked.connect(self.send_to_all)
+        send_layout.addWidget(self.send_input)
+        send_layout.addWidget(self.send_btn)
+        ports_layout.addLayout(send_layout, 2, 2)
+
+        main_layout.addWidget(ports_group)
+
+        self.log_box = ConsoleView(200)
+        self.log_box.setFont(QFont("Consolas", 9))
+        self.log_box.setMaximumHeight(100)
+        main_layout.addWidget(self.log_box)
+
+        # One plot per board, stacked
+        self.plot_area = QWidget()
+        self.plot_layout = QVBoxLayout(self.plot_area)
+        self.plot_layout.addStretch()
+        scroll_area = QScrollArea()
+        scroll_area.setWidgetResizable(True)
+        scroll_area.setWidget(self.plot_area)
+        main_layout.addWidget(scroll_area, 1)
+
+        self.refresh_ports()
+
+    def refresh_ports(self):
+        if self.port_scanner and self.port_scanner.isRunning():
+            return
+        self.port_scanner = PortScanner()
+        self.port_scanner.ports_found.connect(self.populate_ports)
+        self.port_scanner.start()
+
+    def populate_ports(self, ports):
+        known = {self.port_list.item(row).data(Qt.UserRole) for row in range(self.port_list.count())}
+        for device, description in ports:
+            if device not in known:
+                self.add_port_item(device, f"{device} - {description}", checked=False)
+
+    def add_port(self):
+        port = self.add_input.text().strip()
+        if port:
+            self.add_port_item(port, port, checked=True)
+            self.add_input.clear()
+
+    def add_port_item(self, port, text, checked):
+        item = QListWidgetItem(text)
+        item.setData(Qt.UserRole, port)
+        item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+        item.setCheckState(Qt.Checked if checked else Qt.Unchecked)
+        self.port_list.addItem(item)
+
+    def selected_ports(self):
+        ports = []
+        for row in range(self.port_list.count()):
+            item = self.port_list.item(row)
+            if item.checkState() == Qt.Checked:
+                ports.append(item.data(Qt.UserRole))
+        return ports
+
+    def start_reading(self):
+        ports = self.selected_ports()
+        if not ports:
+            self.log_box.append("Select at least one port.")
+            return
+
+        for device in self.devices.values():
+            device.plot_canvas.setParent(None)
+            device.status_label.setParent(None)
+        policy = WRITE_POLICIES[self.write_policy_combo.currentText()]
+        self.devices = {port: DeviceChannel(port, policy) for port in ports}
+        for device in self.devices.values():
+            self.plot_layout.insertWidget(self.plot_layout.count() - 1, device.status_label)
+            self.plot_layout.insertWidget(self.plot_layout.count() - 1, device.plot_canvas)
+
+        self.start_time = time.monotonic()
+        self.serial_thread = MultiSerialReader(ports, int(self.baudrate_combo.currentText()))
+        self.serial_thread.batches_received.connect(self.handle_batches)
+        self.serial_thread.start()
+
+        self.log_box.append(f"✅ Connected to {len(ports)} devices")
+        self.status_bar.showMessage(f"Connected: {len(ports)} devices")
+        self.start_btn.setEnabled(False)
+        self.stop_btn.setEnabled(True)
+        self.port_list.setEnabled(False)
+
+    def stop_reading(self):
+        if self.serial_thread:
+            self.serial_thread.stop()
+            self.serial_thread = None
+            self.log_box.append("❌ Disconnected")
+            self.status_bar.showMessage("Disconnected")
+        self.start_btn.setEnabled(True)
+        self.stop_btn.setEnabled(False)
+        self.port_list.setEnabled(True)
+
+    def handle_batches(self, batches):
+        touched = set()
+        # The last error per board in this batch
+        errors = {}
+        for port, host_time, items in batches:
+            device = self.devices.get(port)
+            if not device:
+                continue
+            for item in items:
+                if isinstance(item, Sample):
+                    sample = item
+                elif isinstance(item, str):
+                    if item.startswith(("❌", "Error")):
+                        self.log_box.append(f"{port}: {item}")
+                        continue
+                    sample = device.parser.feed(item)
+                    if not sample:
+                        continue
+                else:
+                    continue
+                # Each board counts time from its own reset; the host clock
+                # puts all of them on one time axis.
+                try:
+                    device.add_sample(device.session_time(sample, host_time - self.start_time))
+                except Exception as e:
+                    # One board's failing disk must not stop the others
+                    errors[port] = e
+            touched.add(device)
+
+        for port, error in errors.items():
+            self.log_box.append(f"❌ {port}: Error processing data: {error}")
+
+        for device in touched:
+            device.plot_canvas.redraw()
+            device.update_status()
+        total = sum(device.data_manager.data_count for device in self.devices.values())
+        self.status_bar.showMessage(f"Connected: {len(self.devices)} devices, {total} samples")
+
+    def render_plots(self):
+        # A few plots per tick, in turn, so the frames of all boards spread
+        # over the ticks; a plot with nothing new returns at once
+        devices = list(self.devices.values())
+        if not devices:
+            return
+        board_fps = min(BOARD_MAX_FPS, PLOT_FRAME_BUDGET / len(devices))
+        self.render_credit = min(self.render_credit + board_fps * len(devices) / PLOT_TICK_RATE, len(devices))
+        while self.render_credit >= 1:
+            self.render_credit -= 1
+            self.render_cursor = (self.render_cursor + 1) % len(devices)
+            devices[self.render_cursor].plot_canvas.render_frame()
+
+    def send_to_all(self):
+        text = self.send_input.text().strip()
+        if not self.serial_thread:
+            self.log_box.append("Not connected.")
+        elif text:
+            self.serial_thread.write_data(text)
+            self.log_box.append(f"🔄 Sent to all: {text}")
+            self.send_input.clear()
+
+    def save_all(self):
+        if not self.devices:
+            self.log_box.append("No data to save.")
+            return
+        directory = QFileDialog.getExistingDirectory(self, "Save Sessions To")
+        if not directory:
+            return
+        for port, device in self.devices.items():
+            filename = os.path.join(directory, f"{safe_file_name(port)}.csv")
+            try:
+                device.data_manager.save_to_file(filename)
+                self.log_box.append(f"✅ {port}: {device.data_manager.data_count} rows saved to {filename}")
+            except Exception as e:
+                QMessageBox.critical(self, "Save Error", f"Error saving {port}: {e}")
+
+    def closeEvent(self, event):
+        self.stop_reading()
+        event.accept()
+
+
+def main():
+    app = QApplication(sys.argv)
+    app.setStyle("Fusion")
+    window = MultiDeviceMonitor()
+    window.show()
+    sys.exit(app.exec_())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import queue
+import threading
+import time
+
+
+class SinkError(Exception):
+    pass
+
+
+class SamplePipeline:
+    # A parsed sample is pushed once and handed to every attached sink, in
+    # attach order. A sink is anything with add_sample(sample) (and
+    # optionally flush()): RowWriter, SessionStore, SessionStats, the plot
+    # canvases, ArchiveWriter, RotatingSessionWriter, ThreadedSink. Each sink
+    # keeps its own batching and threading: the CSV RowWriter its write
+    # policy, the store its memory map, the plot its render timer, a
+    # ThreadedSink its own thread. A failing sink does not keep the sample
+    # from the others; its error is raised once they all had it. Display
+    # sinks (the plot) may be skipped for a sample when the display is
+    # behind; the others always get it, first. The "write" stage times the
+    # storage sinks only, not the display.
+    def __init__(self, metrics=None):
+        self.sinks = {}
+        self.display_sinks = set()
+        self.storage_targets = []
+        self.display_targets = []
+        self.metrics = metrics
+
+    def attach(self, name, sink, display=False):
+        # Replaces the sink of that name; None detaches it
+        self.sinks.pop(name, None)
+        self.display_sinks.discard(name)
+        if sink is not None:
+            self.sinks[name] = sink
+            if display:
+                self.display_sinks.add(name)
+        self.storage_targets = [(name, sink) for name, sink in self.sinks.items() if name not in self.display_sinks]
+        self.display_targets = [(name, sink) for name, sink in self.sinks.items() if name in self.display_sinks]
+
+    def push(self, sample, display=True):
+        start = time.perf_counter()
+        errors = []
+        for name, sink in self.storage_targets:
+            try:
+                sink.add_sample(sample)
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+        if self.metrics:
+            self.metrics.stages["write"].observe(time.perf_counter() - start)
+        if display:
+            for name, sink in self.display_targets:
+                try:
+                    sink.add_sample(sample)
+                except Exception as e:
+                    errors.append(f"{name}: {e}")
+        if errors:
+            raise SinkError("; ".join(errors))
+
+    def flush(self):
+        for sink in self.sinks.values():
+            flush = getattr(sink, "flush", None)
+            if flush:
+                flush()
+
+
+class ThreadedSink:
+    # Moves a sink onto its own thread. Samples are collected in a list and
+    # handed over batch_size at a time (or after interval seconds), so the
+    # producer's cost per sample is one list append. The queue between the
+    # two is bounded and blocks the producer when full: nothing is dropped.
+    # When the producer goes quiet, the thread takes what is left pending
+    # after interval seconds and lets a sink that flushes on a clock
+    # (flush_if_due()) do so, so a crash loses no more than the sink's own
+    # flush interval whether or not samples keep coming. Only the thread
+    # touches the sink until close().
+    _stop = object()
+    _flush = object()
+
+    def __init__(self, sink, batch_size=256, interval=0.5, queue_size=64):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pending = []
+        self.pending_since = time.monotonic()
+        # Held while the producer hands a batch over, so the thread never
+        # takes newer pending samples ahead of a batch on its way in
+        self.lock = threading.Lock()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def add_sample(self, sample):
+        with self.lock:
+            pending = self.pending
+            if not pending:
+                self.pending_since = time.monotonic()
+            pending.append(sample)
+            if len(pending) >= self.batch_size or time.monotonic() - self.pending_since >= self.interval:
+                self.put_pending()
+
+    def put_pending(self):
+        # Called with the lock held
+        if self.pending:
+            self.queue.put(self.pending)
+            self.pending = []
+
+    def run(self):
+        while True:
+            try:
+                batch = self.queue.get(timeout=self.interval)
+            except queue.Empty:
+                with self.lock:
+                    if not self.queue.empty():
+                        continue
+                    batch, self.pending = self.pending, []
+                self.write(batch)
+                flush_if_due = getattr(self.sink, "flush_if_due", None)
+                if flush_if_due:
+                    self.call(flush_if_due)
+                continue
+            try:
+                if batch is self._stop:
+                    break
+                if batch is self._flush:
+                    flush = getattr(self.sink, "flush", None)
+                    if flush:
+                        self.call(flush)
+                else:
+                    self.write(batch)
+            finally:
+                self.queue.task_done()
+
+    def write(self, batch):
+        try:
+            for sample in batch:
+                self.sink.add_sample(sample)
+        except Exception as e:
+            print(f"Error in background sink {type(self.sink).__name__}: {e}")
+
+    def call(self, method):
+        try:
+            method()
+        except Exception as e:
+            print(f"Error in background sink {type(self.sink).__name__}: {e}")
+
+    def flush(self):
+        # Blocks until every sample handed over so far reached the sink and
+        # the sink was flushed
+        if not self.thread.is_alive():
+            return
+        with self.lock:
+            self.put_pending()
+            self.queue.put(self._flush)
+        self.queue.join()
+
+    def close(self):
+        if self.thread.is_alive():
+            with self.lock:
+                self.put_pending()
+                self.queue.put(self._stop)
+            self.thread.join()
+        self.sink.close()
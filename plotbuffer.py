@@ -0,0 +1,360 @@
+import time
+from collections import deque
+
+import numpy as np
+from PyQt5.QtCore import QTimer
+
+
+class RingBuffer:
+    # Every row is written twice, at pos and pos + capacity, so the live
+    # window is always one contiguous slice and view() never has to copy or
+    # re-order. Per-channel window extrema are kept in monotonic deques,
+    # which makes min()/max() O(1) and append amortized O(1).
+    def __init__(self, capacity, channels=1):
+        self.capacity = max(1, int(capacity))
+        self.channels = channels
+        self.data = np.zeros((channels, 2 * self.capacity))
+        self.start = 0
+        self.size = 0
+        self.count = 0
+        self.min_queues = [deque() for _ in range(channels)]
+        self.max_queues = [deque() for _ in range(channels)]
+
+    def __len__(self):
+        return self.size
+
+    def append(self, values):
+        pos = (self.start + self.size) % self.capacity
+        if self.size == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+        else:
+            self.size += 1
+        self.data[:, pos] = values
+        self.data[:, pos + self.capacity] = values
+
+        seq = self.count
+        oldest = seq + 1 - self.size
+        for channel, value in enumerate(values):
+            min_queue = self.min_queues[channel]
+            while min_queue and min_queue[-1][1] >= value:
+                min_queue.pop()
+            min_queue.append((seq, value))
+            if min_queue[0][0] < oldest:
+                min_queue.popleft()
+
+            max_queue = self.max_queues[channel]
+            while max_queue and max_queue[-1][1] <= value:
+                max_queue.pop()
+            max_queue.append((seq, value))
+            if max_queue[0][0] < oldest:
+                max_queue.popleft()
+        self.count += 1
+
+    def view(self, channel=None):
+        window = self.data[:, self.start:self.start + self.size]
+        return window if channel is None else window[channel]
+
+    def min(self, channel):
+        return self.min_queues[channel][0][1] if self.size else None
+
+    def max(self, channel):
+        return self.max_queues[channel][0][1] if self.size else None
+
+    def resize(self, capacity):
+        kept = self.view()[:, -int(capacity):].copy() if self.size else None
+        count = self.count
+        self.__init__(capacity, self.channels)
+        if kept is None:
+            self.count = count
+            return
+        # Replaying the kept tail rebuilds the extrema queues; their sequence
+        # numbers are then shifted back onto the original count.
+        for column in kept.T:
+            self.append(column)
+        offset = count - self.count
+        for queues in (self.min_queues, self.max_queues):
+            for channel, queue in enumerate(queues):
+                queues[channel] = deque((seq + offset, value) for seq, value in queue)
+        self.count = count
+
+    def clear(self):
+        self.__init__(self.capacity, self.channels)
+
+
+class MinMaxPyramid:
+    # Whole-session store for plotting. Level 0 holds every sample; level k
+    # holds the min and max of each complete block of factor**k samples.
+    # Levels are extended as blocks complete, so appends stay amortized
+    # O(1), and decimate() touches only about one coarse entry per pixel.
+    def __init__(self, channels=1, factor=8, dtype=np.float32):
+        self.channels = channels
+        self.factor = factor
+        self.dtype = dtype
+        self.size = 0
+        self.values = np.empty((1024, channels), dtype=dtype)
+        self.mins = []
+        self.maxs = []
+        self.level_sizes = []
+
+    def __len__(self):
+        return self.size
+
+    def append(self, values):
+        if self.size == len(self.values):
+            self.values = self.grow(self.values, self.size + 1)
+        self.values[self.size] = values
+        self.size += 1
+        if self.size % self.factor == 0:
+            self.update_levels(self.size - 1)
+
+    def extend(self, rows):
+        rows = np.asarray(rows, dtype=self.dtype).reshape(-1, self.channels)
+        old_size = self.size
+        self.values = self.grow(self.values, self.size + len(rows))
+        self.values[self.size:self.size + len(rows)] = rows
+        self.size += len(rows)
+        self.update_levels(old_size)
+
+    def update_levels(self, old_size):
+        below_min, below_max = self.values, self.values
+        below_old, below_new = old_size, self.size
+        level = 0
+        while below_new // self.factor > below_old // self.factor:
+            if level == len(self.level_sizes):
+                self.mins.append(np.empty((64, self.channels), dtype=self.dtype))
+                self.maxs.append(np.empty((64, self.channels), dtype=self.dtype))
+                self.level_sizes.append(0)
+            first = self.level_sizes[level]
+            last = below_new // self.factor
+            span = slice(first * self.factor, last * self.factor)
+            shape = (last - first, self.factor, self.channels)
+            self.mins[level] = self.grow(self.mins[level], last)
+            self.maxs[level] = self.grow(self.maxs[level], last)
+            self.mins[level][first:last] = below_min[span].reshape(shape).min(axis=1)
+            self.maxs[level][first:last] = below_max[span].reshape(shape).max(axis=1)
+            self.level_sizes[level] = last
+
+            below_min, below_max = self.mins[level], self.maxs[level]
+            below_old, below_new = first, last
+            level += 1
+
+    @staticmethod
+    def grow(array, needed):
+        if needed <= len(array):
+            return array
+        capacity = len(array)
+        while capacity < needed:
+            capacity *= 2
+        grown = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    def decimate(self, start, stop, pixels):
+        # Returns sample indices and per-channel values for [start, stop) with
+        # at most two vertices (min, max) per pixel column.
+        start = max(0, int(start))
+        stop = min(self.size, int(stop))
+        pixels = max(1, int(pixels))
+        count = stop - start
+        if count <= 0:
+            return np.empty(0), np.empty((self.channels, 0), dtype=self.dtype)
+        if count <= 2 * pixels:
+            return np.arange(start, stop, dtype=float), self.values[start:stop].T
+
+        level = 0
+        while level < len(self.level_sizes) and count // self.factor ** (level + 1) >= pixels:
+            level += 1
+        if level == 0:
+            block = 1
+            mins = maxs = self.values[start:stop]
+            head, tail = start, stop
+        else:
+            block = self.factor ** level
+            first = start // block
+            last = min(stop // block, self.level_sizes[level - 1])
+            mins = self.mins[level - 1][first:last]
+            maxs = self.maxs[level - 1][first:last]
+            head, tail = first * block, last * block
+
+        edges = np.unique(np.linspace(0, len(mins), pixels + 1).astype(int)[:-1])
+        bucket_min = np.minimum.reduceat(mins, edges, axis=0)
+        bucket_max = np.maximum.reduceat(maxs, edges, axis=0)
+        bucket_x = head + (edges + np.diff(np.append(edges, len(mins))) / 2) * block
+        if tail < stop:
+            rest = self.values[tail:stop]
+            bucket_min = np.vstack([bucket_min, rest.min(axis=0)])
+            bucket_max = np.vstack([bucket_max, rest.max(axis=0)])
+            bucket_x = np.append(bucket_x, (tail + stop) / 2)
+
+        x = np.repeat(bucket_x, 2)
+        y = np.empty((len(bucket_x) * 2, self.channels), dtype=self.dtype)
+        y[0::2] = bucket_min
+        y[1::2] = bucket_max
+        return x, y.T
+
+    def clear(self):
+        self.__init__(self.channels, self.factor, self.dtype)
+
+
+def autoscale_limits(limits, low, high):
+    # Grows at once to fit the data, shrinks only once the data spans less
+    # than half the range, so the axes are not re-laid out on every frame
+    if (limits is None or low < limits[0] or high > limits[1]
+            or (high - low) * 2 < limits[1] - limits[0]):
+        pad = (high - low) * 0.1
+        if pad <= abs(high) * 1e-6:
+            # Flat (or float32 rounding only): a tenth of the value around it
+            pad = abs(high) * 0.1 or 1.0
+        return (low - pad, high + pad)
+    return limits
+
+
+class LiveView:
+    # What the plot canvases share; they only draw. The x range follows the
+    # newest samples (max_points of them, or all with None), or a fixed view
+    # set by zooming and panning until double-click returns to following.
+    # Windows up to raw_points_limit points are drawn raw from the ring
+    # buffer; larger windows, the whole-session view and zoomed views are
+    # min/max decimated from the session pyramid. render_frame() runs at most
+    # max_fps times a second and draws only when the plot is dirty; with
+    # max_fps None the owner calls it, one tick for many plots.
+    raw_points_limit = 2000
+
+    def init_live_view(self, max_points, max_fps, channels):
+        self.max_points = max_points
+        # Rows: sample number, then one per channel
+        self.buffer = RingBuffer(self.ring_capacity(), channels=channels + 1)
+        self.session = MinMaxPyramid(channels=channels)
+        self.data_count = 0
+        self.view = None
+        self.x_limits = None
+        self.pan_start = None
+        self.dirty = False
+        self.frame_count = 0
+        self.fps = 0.0
+        # PipelineMetrics, set by the owner to time frames
+        self.metrics = None
+
+        self.render_timer = QTimer(self)
+        self.render_timer.timeout.connect(self.render_frame)
+        self.set_max_fps(max_fps)
+
+        self.fps_timer = QTimer(self)
+        self.fps_timer.timeout.connect(self.update_fps)
+        self.fps_timer.start(1000)
+
+    def set_max_fps(self, max_fps):
+        self.max_fps = max_fps
+        if max_fps:
+            self.render_timer.start(max(1, int(1000 / max_fps)))
+        else:
+            self.render_timer.stop()
+
+    def update_fps(self):
+        fps = float(self.frame_count)
+        self.frame_count = 0
+        if fps != self.fps:
+            self.fps = fps
+            self.fps_changed.emit(fps)
+
+    def frame_rendered(self, start):
+        self.frame_count += 1
+        if self.metrics:
+            self.metrics.counters["frames_rendered"] += 1
+            self.metrics.stages["render"].observe(time.perf_counter() - start)
+
+    def append_values(self, values):
+        self.data_count += 1
+        self.buffer.append((self.data_count,) + tuple(values))
+        self.session.append(values)
+
+    def load_rows(self, rows):
+        # A recorded session goes into the pyramid in one extend(); the ring
+        # buffer only needs the tail
+        self.clear_plot()
+        self.session.extend(rows)
+        self.data_count = len(rows)
+        tail = rows[-self.buffer.capacity:]
+        for number, values in enumerate(tail.tolist(), self.data_count - len(tail) + 1):
+            self.buffer.append([number] + values)
+        self.redraw()
+
+    def redraw(self):
+        self.dirty = True
+
+    def clear_live_view(self):
+        self.buffer.clear()
+        self.session.clear()
+        self.data_count = 0
+        self.view = None
+        self.x_limits = None
+        self.pan_start = None
+        self.dirty = False
+
+    def set_max_points(self, max_points):
+        self.max_points = max_points
+        self.buffer.resize(self.ring_capacity())
+        self.view = None
+        self.x_limits = None
+        self.redraw()
+
+    def ring_capacity(self):
+        if self.max_points is None:
+            return self.raw_points_limit
+        return min(self.max_points, self.raw_points_limit)
+
+    def is_decimated(self):
+        return self.view is not None or self.max_points is None or self.max_points > self.raw_points_limit
+
+    def update_x_limits(self):
+        # True if the limits changed
+        if self.view is not None:
+            x_limits = self.view
+        elif self.x_limits is None or self.data_count > self.x_limits[1]:
+            # The x window jumps ahead in steps of a tenth of its span so the
+            # axes are re-rendered every few samples, not on every one.
+            span = self.max_points or max(self.data_count, 10)
+            step = max(1, span // 10)
+            x_max = max(span, self.data_count + step)
+            if self.max_points is None:
+                x_limits = (0, x_max)
+            else:
+                x_limits = (max(0, x_max - span - step), x_max)
+        else:
+            return False
+        if x_limits == self.x_limits:
+            return False
+        self.x_limits = x_limits
+        return True
+
+    def zoom(self, center, scale):
+        x_low, x_high = self.view or self.x_limits
+        self.set_view(center - (center - x_low) * scale, center + (x_high - center) * scale)
+
+    def start_pan(self, pixel):
+        if self.x_limits is not None:
+            self.pan_start = (pixel, self.view or self.x_limits)
+
+    def pan(self, pixel, width):
+        # Drag by pixels on a plot `width` pixels wide
+        if self.pan_start is None:
+            return
+        start_pixel, (x_low, x_high) = self.pan_start
+        shift = (start_pixel - pixel) * (x_high - x_low) / (width or 1)
+        self.set_view(x_low + shift, x_high + shift)
+
+    def end_pan(self):
+        self.pan_start = None
+
+    def set_view(self, x_low, x_high):
+        span = max(10.0, x_high - x_low)
+        x_low = min(max(0.0, x_low), max(0.0, self.data_count - span))
+        self.view = (x_low, x_low + span)
+        self.redraw()
+
+    def follow(self):
+        # Double click: back to following the live data
+        self.pan_start = None
+        self.view = None
+        self.x_limits = None
+        self.redraw()
@@ -0,0 +1,156 @@
+import math
+import time
+
+import numpy as np
+from PyQt5.QtCore import pyqtSignal
+
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+
+from plotbuffer import LiveView, autoscale_limits
+
+
+class LivePlotCanvas(LiveView, FigureCanvas):
+    # BusVoltage and ShuntVoltage on one matplotlib axes
+    fps_changed = pyqtSignal(float)
+
+    def __init__(self, parent=None, max_points=100, max_fps=30, title="BusVoltage and ShuntVoltage Plot"):
+        fig = Figure(figsize=(5, 3), dpi=100)
+        self.ax = fig.add_subplot(111)
+        super().__init__(fig)
+        self.setParent(parent)
+        
+        fig.set_facecolor('#f0f0f0')
+        self.ax.set_facecolor('#f8f8f8')
+        self.ax.grid(True, linestyle='--', alpha=0.7)
+        
+        title_font = {'fontsize': 6}
+        label_font = {'fontsize': 6}
+        tick_font = {'labelsize': 5}
+        
+        self.ax.set_title(title, **title_font)
+        self.ax.set_ylabel("Value", **label_font)
+        self.ax.tick_params(**tick_font)
+
+        # The lines are animated: a full draw renders only the static
+        # background (axes, ticks, legend), which is cached and blitted under
+        # the lines on every frame until the limits change.
+        self.line1, = self.ax.plot([], [], label="BusVoltage", color='#1f77b4', linewidth=1.5, animated=True)
+        self.line2, = self.ax.plot([], [], label="ShuntVoltage", color='#d62728', linewidth=1.5, animated=True)
+        self.ax.legend(prop={'size': 6})
+        
+        fig.tight_layout()
+
+        self.background = None
+        self.y_limits = None
+        # Channels: BusVoltage, ShuntVoltage
+        self.init_live_view(max_points, max_fps, channels=2)
+        self.mpl_connect('draw_event', self.on_draw)
+        self.mpl_connect('scroll_event', self.on_scroll)
+        self.mpl_connect('button_press_event', self.on_press)
+        self.mpl_connect('motion_notify_event', self.on_motion)
+        self.mpl_connect('button_release_event', self.on_release)
+
+    def update_plot(self, new_y1, new_y2, redraw=True):
+        try:
+            new_y1 = float(new_y1)
+            new_y2 = float(new_y2)
+        except ValueError:
+            return 
+
+        self.append_values((new_y1, new_y2))
+        if redraw:
+            self.redraw()
+
+    def add_sample(self, sample):
+        self.update_plot(sample.bus_voltage, sample.shunt_voltage, redraw=False)
+
+    def load_records(self, records):
+        self.load_session(records["bus_voltage"], records["shunt_voltage"])
+
+    def load_session(self, y1, y2):
+        self.load_rows(np.column_stack((y1, y2)))
+
+    def render_frame(self):
+        if not self.dirty or not len(self.buffer):
+            return
+        self.dirty = False
+        start = time.perf_counter()
+
+        changed = self.update_x_limits()
+        if self.is_decimated():
+            # Sample n has index n - 1 in the session pyramid
+            x_low, x_high = self.x_limits
+            pixels = self.ax.bbox.width or 500
+            x, y = self.session.decimate(math.ceil(x_low) - 1, math.floor(x_high), pixels)
+            x = x + 1
+            y1, y2 = y
+            if not len(x):
+                return
+            y_low = min(y1.min(), y2.min())
+            y_high = max(y1.max(), y2.max())
+        else:
+            window = self.buffer.view()
+            x, y1, y2 = window
+            y_low = min(self.buffer.min(1), self.buffer.min(2))
+            y_high = max(self.buffer.max(1), self.buffer.max(2))
+        self.line1.set_data(x, y1)
+        self.line2.set_data(x, y2)
+
+        if self.update_y_limits(y_low, y_high) or changed or self.background is None:
+            self.draw()
+        else:
+            self.restore_region(self.background)
+            self.draw_lines()
+            self.blit(self.figure.bbox)
+        self.frame_rendered(start)
+
+    def update_x_limits(self):
+        changed = super().update_x_limits()
+        if changed:
+            self.ax.set_xlim(*self.x_limits)
+        return changed
+
+    def update_y_limits(self, y_low, y_high):
+        y_limits = autoscale_limits(self.y_limits, y_low, y_high)
+        if y_limits != self.y_limits:
+            self.y_limits = y_limits
+            self.ax.set_ylim(*self.y_limits)
+            return True
+        return False
+
+    def on_scroll(self, event):
+        if event.xdata is None or not self.data_count:
+            return
+        self.zoom(event.xdata, 0.8 if event.button == 'up' else 1.25)
+
+    def on_press(self, event):
+        if event.button != 1 or event.xdata is None:
+            return
+        if event.dblclick:
+            self.follow()
+        else:
+            self.start_pan(event.x)
+
+    def on_motion(self, event):
+        self.pan(event.x, self.ax.bbox.width)
+
+    def on_release(self, event):
+        self.end_pan()
+
+    def on_draw(self, event):
+        self.background = self.copy_from_bbox(self.figure.bbox)
+        self.draw_lines()
+
+    def draw_lines(self):
+        self.ax.draw_artist(self.line1)
+        self.ax.draw_artist(self.line2)
+
+    def clear_plot(self):
+        self.clear_live_view()
+        self.y_limits = None
+        self.line1.set_data([], [])
+        self.line2.set_data([], [])
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.draw()
@@ -0,0 +1,221 @@
+import math
+import time
+
+import numpy as np
+from PyQt5.QtCore import QPointF, QRectF, Qt, pyqtSignal
+from PyQt5.QtGui import QColor, QFont, QFontMetrics, QPainter, QPen, QPixmap, QPolygonF
+from PyQt5.QtWidgets import QSizePolicy, QWidget
+
+from plotbuffer import LiveView, autoscale_limits
+
+
+# (Sample field, title, unit, colour), top to bottom
+CHANNELS = [
+    ("bus_voltage", "Bus Voltage", "V", "#1f77b4"),
+    ("shunt_voltage", "Shunt Voltage", "mV", "#d62728"),
+    ("load_voltage", "Load Voltage", "V", "#2ca02c"),
+    ("current", "Current", "mA", "#ff7f0e"),
+    ("power", "Power", "mW", "#9467bd"),
+]
+
+# Pixels around and between the subplots
+MARGIN_LEFT = 52
+MARGIN_RIGHT = 8
+MARGIN_TOP = 4
+MARGIN_BOTTOM = 16
+SUBPLOT_GAP = 6
+
+
+def nice_ticks(low, high, count):
+    # About `count` round values (1, 2 or 5 times a power of ten) in [low, high]
+    span = high - low
+    if span <= 0 or not math.isfinite(span):
+        return []
+    raw_step = span / max(1, count)
+    magnitude = 10 ** math.floor(math.log10(raw_step))
+    step = next(factor * magnitude for factor in (1, 2, 5, 10) if factor * magnitude >= raw_step)
+    first = math.ceil(low / step)
+    return [tick * step for tick in range(first, int(math.floor(high / step)) + 1)]
+
+
+def polyline(x, y):
+    # QPolygonF filled through its buffer in two vectorised assignments,
+    # rather than one QPointF per vertex
+    polygon = QPolygonF(len(x))
+    buffer = polygon.data()
+    buffer.setsize(len(x) * 16)
+    points = np.frombuffer(buffer, dtype=np.float64).reshape(-1, 2)
+    points[:, 0] = x
+    points[:, 1] = y
+    return polygon
+
+
+class StackedPlotCanvas(LiveView, QWidget):
+    # All five INA219 channels as stacked subplots sharing the x axis (sample
+    # number), each autoscaled on its own, drawn with QPainter. The frame
+    # (axes, grid, tick labels) is cached in a pixmap until the limits or the
+    # size change; a frame then only converts the visible points to pixel
+    # polylines (at most two vertices per pixel column) and draws those.
+    # Fed like LivePlotCanvas, through add_sample() and load_records().
+    fps_changed = pyqtSignal(float)
+
+    def __init__(self, parent=None, max_points=100, max_fps=60, title=None):
+        super().__init__(parent)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.setMinimumHeight(250)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self.title = title
+        self.label_font = QFont()
+        self.label_font.setPointSize(7)
+        self.font_metrics = QFontMetrics(self.label_font)
+        self.pens = [QPen(QColor(colour), 1.0) for _, _, _, colour in CHANNELS]
+
+        self.background = None
+        self.background_key = None
+        self.polylines = []
+        self.y_limits = [None] * len(CHANNELS)
+        self.init_live_view(max_points, max_fps, channels=len(CHANNELS))
+
+    def add_sample(self, sample):
+        self.append_values((sample.bus_voltage, sample.shunt_voltage, sample.load_voltage, sample.current, sample.power))
+
+    def load_records(self, records):
+        self.load_rows(np.column_stack([records[name] for name, _, _, _ in CHANNELS]))
+
+    def plot_area(self):
+        return QRectF(MARGIN_LEFT, MARGIN_TOP, max(1, self.width() - MARGIN_LEFT - MARGIN_RIGHT),
+                      max(1, self.height() - MARGIN_TOP - MARGIN_BOTTOM))
+
+    def subplot_rects(self):
+        area = self.plot_area()
+        height = (area.height() - SUBPLOT_GAP * (len(CHANNELS) - 1)) / len(CHANNELS)
+        return [QRectF(area.left(), area.top() + row * (height + SUBPLOT_GAP), area.width(), max(1.0, height))
+                for row in range(len(CHANNELS))]
+
+    def render_frame(self):
+        if not self.dirty or not len(self.buffer):
+            return
+        self.dirty = False
+        start = time.perf_counter()
+
+        self.update_x_limits()
+        x_low, x_high = self.x_limits
+        rects = self.subplot_rects()
+        width = rects[0].width()
+        if self.is_decimated():
+            # Sample n has index n - 1 in the session pyramid
+            x, y = self.session.decimate(math.ceil(x_low) - 1, math.floor(x_high), width)
+            x = x + 1
+            if not len(x):
+                return
+            lows, highs = y.min(axis=1), y.max(axis=1)
+        else:
+            window = self.buffer.view()
+            x, y = window[0], window[1:]
+            lows = [self.buffer.min(channel) for channel in range(1, len(CHANNELS) + 1)]
+            highs = [self.buffer.max(channel) for channel in range(1, len(CHANNELS) + 1)]
+
+        pixel_x = rects[0].left() + (x - x_low) * (width / (x_high - x_low))
+        self.polylines = []
+        for channel, rect in enumerate(rects):
+            low, high = autoscale_limits(self.y_limits[channel], float(lows[channel]), float(highs[channel]))
+            self.y_limits[channel] = (low, high)
+            pixel_y = rect.bottom() - (y[channel] - low) * (rect.height() / (high - low))
+            self.polylines.append(polyline(pixel_x, pixel_y))
+        self.repaint()
+        self.frame_rendered(start)
+
+    def paintEvent(self, event):
+        key = (self.width(), self.height(), self.x_limits, tuple(self.y_limits))
+        if self.background is None or key != self.background_key:
+            self.background = self.draw_background()
+            self.background_key = key
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self.background)
+        for rect, pen, polygon in zip(self.subplot_rects(), self.pens, self.polylines):
+            painter.save()
+            painter.setClipRect(rect)
+            painter.setPen(pen)
+            painter.drawPolyline(polygon)
+            painter.restore()
+        painter.end()
+
+    def draw_background(self):
+        pixmap = QPixmap(self.size())
+        pixmap.fill(QColor("#f0f0f0"))
+        painter = QPainter(pixmap)
+        painter.setFont(self.label_font)
+        text_height = self.font_metrics.height()
+        grid_pen = QPen(QColor("#d0d0d0"), 1, Qt.DashLine)
+        rects = self.subplot_rects()
+        x_ticks = []
+        if self.x_limits:
+            x_low, x_high = self.x_limits
+            scale = rects[0].width() / (x_high - x_low)
+            x_ticks = [(rects[0].left() + (tick - x_low) * scale, tick)
+                       for tick in nice_ticks(x_low, x_high, max(2, int(rects[0].width() / 80)))]
+
+        for (_, title, unit, colour), rect, y_limits in zip(CHANNELS, rects, self.y_limits):
+            painter.fillRect(rect, QColor("#f8f8f8"))
+            painter.setPen(grid_pen)
+            for pixel, _ in x_ticks:
+                painter.drawLine(QPointF(pixel, rect.top()), QPointF(pixel, rect.bottom()))
+            if y_limits:
+                low, high = y_limits
+                scale = rect.height() / (high - low)
+                ticks = nice_ticks(low, high, max(1, int(rect.height() / (text_height * 2))))
+                decimals = max(0, min(4, -int(math.floor(math.log10(ticks[1] - ticks[0]))))) if len(ticks) > 1 else 2
+                for tick in ticks:
+                    pixel = rect.bottom() - (tick - low) * scale
+                    painter.setPen(grid_pen)
+                    painter.drawLine(QPointF(rect.left(), pixel), QPointF(rect.right(), pixel))
+                    painter.setPen(Qt.black)
+                    painter.drawText(QRectF(0, pixel - text_height / 2, MARGIN_LEFT - 4, text_height),
+                                     Qt.AlignRight | Qt.AlignVCenter, f"{tick:.{decimals}f}")
+            painter.setPen(QColor("#808080"))
+            painter.drawRect(rect)
+            painter.setPen(QColor(colour))
+            painter.drawText(rect.adjusted(4, 1, -4, 0), Qt.AlignLeft | Qt.AlignTop, f"{title} ({unit})")
+
+        painter.setPen(Qt.black)
+        bottom = rects[-1].bottom()
+        for pixel, tick in x_ticks:
+            painter.drawText(QRectF(pixel - 40, bottom + 1, 80, text_height), Qt.AlignCenter, f"{tick:g}")
+        if self.title:
+            painter.drawText(rects[0].adjusted(4, 1, -4, 0), Qt.AlignRight | Qt.AlignTop, self.title)
+        painter.end()
+        return pixmap
+
+    def resizeEvent(self, event):
+        self.redraw()
+        super().resizeEvent(event)
+
+    def sample_at(self, pixel):
+        area = self.plot_area()
+        x_low, x_high = self.view or self.x_limits
+        return x_low + (pixel - area.left()) * (x_high - x_low) / area.width()
+
+    def wheelEvent(self, event):
+        if not self.data_count or self.x_limits is None:
+            return
+        self.zoom(self.sample_at(event.pos().x()), 0.8 if event.angleDelta().y() > 0 else 1.25)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.start_pan(event.pos().x())
+
+    def mouseDoubleClickEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.follow()
+
+    def mouseMoveEvent(self, event):
+        self.pan(event.pos().x(), self.plot_area().width())
+
+    def mouseReleaseEvent(self, event):
+        self.end_pan()
+
+    def clear_plot(self):
+        self.clear_live_view()
+        self.y_limits = [None] * len(CHANNELS)
+        self.polylines = []
+        self.update()
@@ -0,0 +1,172 @@
+import struct
+import threading
+import time
+from urllib.parse import parse_qs
+
+import serial
+
+
+RAW_LOG_MAGIC = b"INA219R1"
+# Magic, wall-clock start time (epoch seconds)
+RAW_LOG_HEADER = struct.Struct("<8sd")
+# Seconds since the start, chunk length; the chunk's bytes follow
+RAW_LOG_RECORD = struct.Struct("<dI")
+
+REPLAY_SCHEME = "replay://"
+
+FLUSH_INTERVAL = 1.0
+
+# Chunks arriving within this many seconds of the first one are stored as
+# one record (some transports hand over a byte per read)
+MERGE_WINDOW = 0.001
+
+
+class RawLogWriter:
+    # Every chunk read from the port, as it arrived, with its arrival time.
+    # Flushed once a second so a crash loses at most the last second.
+    def __init__(self, path, merge_window=MERGE_WINDOW):
+        self.path = path
+        self.merge_window = merge_window
+        self.file = open(path, 'wb')
+        self.started = time.monotonic()
+        self.last_flush = self.started
+        self.bytes_written = 0
+        self.pending_arrival = None
+        self.pending = bytearray()
+        self.file.write(RAW_LOG_HEADER.pack(RAW_LOG_MAGIC, time.time()))
+
+    def write(self, chunk, arrival=None):
+        # arrival: seconds since the start, when not now (converted traffic)
+        now = time.monotonic()
+        if arrival is None:
+            arrival = now - self.started
+        if self.pending_arrival is None or arrival - self.pending_arrival > self.merge_window:
+            self.write_pending()
+            self.pending_arrival = arrival
+        self.pending += chunk
+        self.bytes_written += len(chunk)
+        if now - self.last_flush >= FLUSH_INTERVAL:
+            self.write_pending()
+            self.file.flush()
+            self.last_flush = now
+
+    def write_pending(self):
+        if self.pending:
+            self.file.write(RAW_LOG_RECORD.pack(self.pending_arrival, len(self.pending)))
+            self.file.write(self.pending)
+            self.pending = bytearray()
+        self.pending_arrival = None
+
+    def close(self):
+        if not self.file.closed:
+            self.write_pending()
+            self.file.close()
+
+
+def read_raw_log(path):
+    # Yields (seconds since the start, chunk); a torn last record is dropped
+    with open(path, 'rb') as file:
+        magic, _ = RAW_LOG_HEADER.unpack(file.read(RAW_LOG_HEADER.size))
+        if magic != RAW_LOG_MAGIC:
+            raise ValueError(f"{path} is not a raw capture log")
+        while True:
+            header = file.read(RAW_LOG_RECORD.size)
+            if len(header) < RAW_LOG_RECORD.size:
+                return
+            arrival, length = RAW_LOG_RECORD.unpack(header)
+            chunk = file.read(length)
+            if len(chunk) < length:
+                return
+            yield arrival, chunk
+
+
+class ReplayFinished(serial.SerialException):
+    pass
+
+
+class ReplayPort:
+    # Plays a raw capture log back as a serial port: recorded chunks become
+    # readable when due, at the recorded pace divided by `speed` (None: all
+    # at once), and read() returns whatever is due up to `size`, as the OS
+    # buffer of a real port would. Writes are accepted and dropped. The end
+    # of the log raises ReplayFinished, like a board being unplugged.
+    def __init__(self, path, speed=1.0, timeout=None):
+        self.path = path
+        self.speed = speed
+        self.timeout = timeout
+        self.chunks = read_raw_log(path)
+        self.pending = None
+        self.offset = 0
+        self.started = None
+        self.is_open = True
+        self.cancelled = threading.Event()
+        self.next_chunk()
+
+    def next_chunk(self):
+        self.pending = next(self.chunks, None)
+        self.offset = 0
+
+    def due_in(self):
+        if self.speed is None:
+            return 0.0
+        if self.started is None:
+            # The first chunk is due at once; the pace counts from there
+            self.started = time.monotonic() - self.pending[0] / self.speed
+        return self.started + self.pending[0] / self.speed - time.monotonic()
+
+    @property
+    def in_waiting(self):
+        if not self.pending:
+            raise ReplayFinished("end of raw capture log")
+        if self.due_in() > 0:
+            return 0
+        return len(self.pending[1]) - self.offset
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise serial.PortNotOpenError()
+        if not self.pending:
+            raise ReplayFinished("end of raw capture log")
+        delay = self.due_in()
+        if delay > 0:
+            wait = delay if self.timeout is None else min(delay, self.timeout)
+            if self.cancelled.wait(wait) or delay > wait:
+                self.cancelled.clear()
+                return b""
+        data = bytearray()
+        while self.pending and len(data) < size and (not data or self.due_in() <= 0):
+            chunk = self.pending[1][self.offset:self.offset + size - len(data)]
+            data += chunk
+            self.offset += len(chunk)
+            if self.offset >= len(self.pending[1]):
+                self.next_chunk()
+        return bytes(data)
+
+    def write(self, data):
+        return len(data)
+
+    def cancel_read(self):
+        self.cancelled.set()
+
+    def close(self):
+        self.is_open = False
+        self.chunks.close()
+
+
+def parse_replay_url(url):
+    # replay://<path>[?speed=<factor>|max] -> (path, speed)
+    path, _, query = url[len(REPLAY_SCHEME):].partition("?")
+    speed = parse_qs(query).get("speed", ["1"])[0]
+    return path, None if speed in ("max", "0") else float(speed)
+
+
+def replay_url(path, speed=1.0):
+    return f"{REPLAY_SCHEME}{path}?speed={'max' if speed is None else f'{speed:g}'}"
+
+
+def open_port(url, baudrate=115200, timeout=None):
+    # serial.serial_for_url() plus replay:// for raw capture logs
+    if url.startswith(REPLAY_SCHEME):
+        path, speed = parse_replay_url(url)
+        return ReplayPort(path, speed, timeout)
+    return serial.serial_for_url(url, baudrate, timeout=timeout)
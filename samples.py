@@ -0,0 +1,94 @@
+from collections import namedtuple
+
+
+Sample = namedtuple("Sample", ["index", "time", "bus_voltage", "shunt_voltage", "load_voltage", "current", "power"])
+
+# Labels of the per-sample block printed by codeArdiunoUNo.ino
+LABELS = {
+    "Index": "index",
+    "Relative time": "time",
+    "Bus Voltage": "bus_voltage",
+    "Shunt Voltage": "shunt_voltage",
+    "Load Voltage": "load_voltage",
+    "Current": "current",
+    "Power": "power",
+}
+
+DATA_PREFIX = "Data ->"
+
+
+def sample_row(sample):
+    # The firmware's "Data ->" column layout
+    return [f"{sample.index:.0f}"] + [f"{value:.2f}" for value in sample[1:]]
+
+
+class GapDetector:
+    # The firmware's Index counts up by one per sample: a jump forward means
+    # samples were lost on the way (serial overrun, dropped queue items), a
+    # step back means the board was reset and counts from the start again.
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.last = None
+        self.lost = 0
+        self.gaps = 0
+        self.restarts = 0
+
+    def check(self, index):
+        # Samples missing right before this one
+        last = self.last
+        self.last = index
+        if last is None:
+            return 0
+        missing = int(index - last) - 1
+        if missing > 0:
+            self.lost += missing
+            self.gaps += 1
+            return missing
+        if missing < -1:
+            self.restarts += 1
+        return 0
+
+
+class SampleParser:
+    # Collects the labelled lines of one block and returns a Sample when the
+    # block's "Data ->" line arrives. The labelled values are used when the
+    # block is complete (the firmware leaves the Data line empty without an
+    # SD card); otherwise the Data line's seven CSV values are the fallback.
+    def __init__(self):
+        self.fields = {}
+
+    def feed(self, line):
+        if line.startswith(DATA_PREFIX):
+            return self.finish(line[len(DATA_PREFIX):])
+
+        label, separator, rest = line.partition(":")
+        if not separator:
+            return None
+        name = LABELS.get(label)
+        if name is None:
+            return None
+        if name == "index":
+            self.fields = {}
+        try:
+            self.fields[name] = float(rest.split()[0])
+        except (ValueError, IndexError):
+            pass
+        return None
+
+    def finish(self, data):
+        fields = self.fields
+        self.fields = {}
+        if len(fields) == len(Sample._fields):
+            return Sample(**fields)
+        values = data.split(",")
+        if len(values) >= len(Sample._fields):
+            try:
+                return Sample(*(float(value) for value in values[:len(Sample._fields)]))
+            except ValueError:
+                pass
+        return None
+
+    def reset(self):
+        self.fields = {}
@@ -0,0 +1,358 @@
+import binascii
+import io
+import selectors
+import struct
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+
+from samples import Sample
+
+
+# Binary frames sent by the firmware after the "B" command:
+#   A5 5A | length | payload | CRC-16/CCITT-FALSE of payload, little endian
+FRAME_SYNC = b"\xa5\x5a"
+FRAME_SAMPLE = 0x01
+SAMPLE_PAYLOAD = struct.Struct("<BII5f")
+MAX_PAYLOAD_SIZE = 64
+
+# SD file download after "U" and "<number>[@<offset>]":
+#   File begin: <name> <size> <offset>\r\n
+#   <size - offset raw bytes of the file>
+#   File end: <CRC-16/CCITT-FALSE of the whole file, hex> <bytes sent> <records>\r\n
+# Earlier firmware counted the records before the header, as
+# "File begin: <name> <size> <records> <offset>" and "File end: <crc> <bytes
+# sent>"; both layouts are read (records None where a layout lacks them).
+FILE_BEGIN = "File begin:"
+FILE_END = "File end:"
+
+FileHeader = namedtuple("FileHeader", ["name", "size", "offset", "records"])
+FileTrailer = namedtuple("FileTrailer", ["crc", "length", "records"])
+
+
+def parse_file_header(line):
+    fields = line[len(FILE_BEGIN):].split()
+    if len(fields) not in (3, 4):
+        return None
+    try:
+        return FileHeader(fields[0], int(fields[1]), int(fields[-1]), int(fields[2]) if len(fields) == 4 else None)
+    except ValueError:
+        return None
+
+
+def parse_file_trailer(line):
+    fields = line[len(FILE_END):].split()
+    if len(fields) not in (2, 3):
+        return None
+    try:
+        return FileTrailer(int(fields[0], 16), int(fields[1]), int(fields[2]) if len(fields) == 3 else None)
+    except ValueError:
+        return None
+
+
+class LineSplitter:
+    def __init__(self, max_line_length=65536):
+        self.buffer = bytearray()
+        self.max_line_length = max_line_length
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        if b"\n" not in chunk:
+            if len(self.buffer) <= self.max_line_length:
+                return []
+            # No newline for far too long: hand the garbage over as a line
+            # instead of letting the buffer grow without bound.
+            self.buffer += b"\n"
+
+        *lines, rest = self.buffer.split(b"\n")
+        self.buffer = bytearray(rest)
+        return [line.decode('utf-8', errors='ignore').strip() for line in lines]
+
+    def clear(self):
+        self.buffer.clear()
+
+
+class FrameDecoder:
+    # Splits a byte stream that mixes text lines with binary sample frames.
+    # Text lines come out as str, frames as Sample; frames with a bad length
+    # or CRC are counted in errors and the decoder resyncs one byte later.
+    # A plain text stream passes through exactly as with LineSplitter.
+    # A file download comes out as FileHeader, the file's bytes (bytes
+    # chunks, passed through untouched) and FileTrailer.
+    def __init__(self, max_line_length=65536):
+        self.buffer = bytearray()
+        self.max_line_length = max_line_length
+        self.errors = 0
+        self.frames = 0
+        self.file_remaining = 0
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        buffer = self.buffer
+        items = []
+        pos = 0
+        sync = buffer.find(FRAME_SYNC)
+        while pos < len(buffer):
+            if self.file_remaining:
+                end = min(len(buffer), pos + self.file_remaining)
+                items.append(bytes(buffer[pos:end]))
+                self.file_remaining -= end - pos
+                pos = end
+                continue
+            if sync != -1 and sync < pos:
+                sync = buffer.find(FRAME_SYNC, pos)
+            newline = buffer.find(b"\n", pos, sync if sync != -1 else len(buffer))
+            if newline != -1:
+                items.append(self.text_line(buffer[pos:newline].decode('utf-8', errors='ignore').strip()))
+                pos = newline + 1
+                continue
+            if sync == -1:
+                if len(buffer) - pos > self.max_line_length:
+                    items.append(buffer[pos:].decode('utf-8', errors='ignore').strip())
+                    pos = len(buffer)
+                break
+            if sync > pos:
+                # Unterminated text right before a frame
+                self.errors += 1
+                pos = sync
+            if len(buffer) - pos < 3:
+                break
+            length = buffer[pos + 2]
+            if length != SAMPLE_PAYLOAD.size or length > MAX_PAYLOAD_SIZE:
+                self.errors += 1
+                pos += 1
+                continue
+            end = pos + 3 + length + 2
+            if len(buffer) < end:
+                break
+            payload = bytes(buffer[pos + 3:end - 2])
+            if binascii.crc_hqx(payload, 0xFFFF) != int.from_bytes(buffer[end - 2:end], 'little'):
+                self.errors += 1
+                pos += 1
+                continue
+            kind, index, time_ms, bus, shunt, load, current, power = SAMPLE_PAYLOAD.unpack(payload)
+            if kind == FRAME_SAMPLE:
+                items.append(Sample(float(index), time_ms / 1000.0, bus, shunt, load, current, power))
+                self.frames += 1
+            pos = end
+        del buffer[:pos]
+        return items
+
+    def text_line(self, line):
+        if line.startswith(FILE_BEGIN):
+            header = parse_file_header(line)
+            if header:
+                self.file_remaining = max(0, header.size - header.offset)
+                return header
+        elif line.startswith(FILE_END):
+            return parse_file_trailer(line) or line
+        return line
+
+    def cancel_file(self):
+        # An abandoned download: what follows is text and frames again
+        self.file_remaining = 0
+
+    def clear(self):
+        self.buffer.clear()
+        self.file_remaining = 0
+
+
+class HandoffQueue:
+    # Bounded queue from a reader thread to the GUI thread. It never loses
+    # an item: when the queue is full the reader waits, so the backlog stays
+    # in the OS serial buffer, where an overflow shows up as overruns. Only
+    # the first put after the consumer emptied the queue asks for a
+    # notification, so at most one wake-up is ever waiting in the GUI event
+    # queue however slow the GUI is.
+    def __init__(self, capacity=100000):
+        self.items = deque()
+        self.capacity = capacity
+        self.condition = threading.Condition()
+        self.high_water = 0
+        self.notified = False
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, items, timeout=None, overflow=False):
+        # Returns the items the queue could not take within timeout.
+        # overflow: take them all regardless (last items of a closing reader).
+        with self.condition:
+            if overflow:
+                self.items.extend(items)
+                rest = []
+            else:
+                space = self.capacity - len(self.items)
+                if space <= 0:
+                    self.condition.wait(timeout)
+                    space = self.capacity - len(self.items)
+                space = max(0, space)
+                self.items.extend(items[:space])
+                rest = items[space:]
+            self.high_water = max(self.high_water, len(self.items))
+        return rest
+
+    def take_notification(self):
+        # True if the consumer has not been told about the queued items yet
+        with self.condition:
+            if self.notified or not self.items:
+                return False
+            self.notified = True
+            return True
+
+    def get_all(self, limit=None):
+        with self.condition:
+            count = len(self.items) if limit is None else min(limit, len(self.items))
+            items = [self.items.popleft() for _ in range(count)]
+            if not self.items:
+                self.notified = False
+            self.condition.notify_all()
+        return items
+
+
+# struct serial_icounter_struct: cts, dsr, rng, dcd, rx, tx, frame,
+# overrun, parity, brk, buf_overrun, reserved[9]
+SERIAL_ICOUNTER = struct.Struct("20i")
+
+
+def read_overruns(serial_port):
+    # Receive overruns so far (UART FIFO plus driver buffer), from the
+    # Linux TIOCGICOUNT counters; None where the port or OS does not report
+    # them (ptys, sockets, Windows, macOS).
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import fcntl
+        import termios
+        counters = fcntl.ioctl(serial_port.fileno(), termios.TIOCGICOUNT, bytes(SERIAL_ICOUNTER.size))
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        return None
+    values = SERIAL_ICOUNTER.unpack(counters)
+    return values[7] + values[10]
+
+
+def encode_sample_frame(sample):
+    payload = SAMPLE_PAYLOAD.pack(FRAME_SAMPLE, int(sample.index), int(round(sample.time * 1000)),
+                                  *sample[2:])
+    return FRAME_SYNC + bytes([len(payload)]) + payload + binascii.crc_hqx(payload, 0xFFFF).to_bytes(2, 'little')
+
+
+class LineReader:
+    # Blocks inside serial.read() until bytes arrive or the port timeout
+    # expires, so an idle link costs one wake-up per timeout instead of a
+    # busy loop on in_waiting. With chunk_size set, a port opened with
+    # timeout=0 is read without asking in_waiting first (socket:// reports
+    # only 0 or 1 there). With raw_log set (a RawLogWriter), every chunk is
+    # also written there before it is decoded. With metrics set
+    # (PipelineMetrics), bytes, chunks, frame errors and decode time are
+    # counted.
+    def __init__(self, serial_port, decoder=None, chunk_size=None, raw_log=None, metrics=None):
+        self.serial = serial_port
+        self.splitter = decoder or LineSplitter()
+        self.chunk_size = chunk_size
+        self.raw_log = raw_log
+        self.metrics = metrics
+
+    def read_lines(self):
+        chunk = self.serial.read(self.chunk_size or self.serial.in_waiting or 1)
+        if not chunk:
+            return []
+        if self.raw_log:
+            self.raw_log.write(chunk)
+        if not self.metrics:
+            return self.splitter.feed(chunk)
+        errors = getattr(self.splitter, "errors", 0)
+        start = time.perf_counter()
+        items = self.splitter.feed(chunk)
+        self.metrics.stages["decode"].observe(time.perf_counter() - start)
+        counters = self.metrics.counters
+        counters["bytes_read"] += len(chunk)
+        counters["chunks_read"] += 1
+        counters["frame_errors"] += getattr(self.splitter, "errors", 0) - errors
+        return items
+
+
+class PortMultiplexer:
+    # Reads any number of ports from one thread. The selector (epoll/kqueue)
+    # waits on all of their descriptors at once, so idle ports cost nothing
+    # and one wake-up serves every port that has data. Ports without a
+    # selectable descriptor (Windows COM handles) are polled with in_waiting.
+    # Once a port is ready, read() waits `coalesce` seconds for the others
+    # before reading, so wake-ups stay at 1 / coalesce per second however
+    # many boards are attached. Open the ports with timeout=0.
+    def __init__(self, coalesce=0.01, poll_interval=0.01):
+        self.selector = selectors.DefaultSelector()
+        self.readers = {}
+        self.polled = []
+        self.coalesce = coalesce
+        self.poll_interval = poll_interval
+
+    def add(self, name, serial_port, decoder=None, raw_log=None, metrics=None):
+        reader = LineReader(serial_port, decoder or FrameDecoder(), chunk_size=65536, raw_log=raw_log,
+                            metrics=metrics)
+        self.readers[name] = reader
+        try:
+            self.selector.register(serial_port.fileno(), selectors.EVENT_READ, name)
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            self.polled.append(name)
+        return reader
+
+    def remove(self, name):
+        reader = self.readers.pop(name, None)
+        if name in self.polled:
+            self.polled.remove(name)
+        elif reader:
+            for key in list(self.selector.get_map().values()):
+                if key.data == name:
+                    self.selector.unregister(key.fileobj)
+        return reader
+
+    def read(self, timeout):
+        # {name: items} for the ports that had data. A port whose read fails
+        # is dropped and reports the error as its last line.
+        if not self.readers:
+            time.sleep(timeout)
+            return {}
+        ready = self.ready(timeout)
+        if ready and self.coalesce:
+            time.sleep(self.coalesce)
+            ready = self.ready(0)
+
+        results = {}
+        for name in ready:
+            try:
+                items = self.readers[name].read_lines()
+            except Exception as e:
+                reader = self.remove(name)
+                try:
+                    reader.serial.close()
+                except Exception:
+                    pass
+                results[name] = [f"Error reading: {e}"]
+                continue
+            if items:
+                results[name] = items
+        return results
+
+    def ready(self, timeout):
+        if not self.polled:
+            return [key.data for key, _ in self.selector.select(timeout)]
+        ready = [key.data for key, _ in self.selector.select(0)] if self.selector.get_map() else []
+        for name in self.polled:
+            try:
+                if self.readers[name].serial.in_waiting:
+                    ready.append(name)
+            except Exception:
+                # Unplugged (or a replay that ended): read() reports it
+                ready.append(name)
+        if not ready and timeout:
+            time.sleep(min(timeout, self.poll_interval))
+        return ready
+
+    def close(self):
+        for reader in self.readers.values():
+            reader.serial.close()
+        self.readers.clear()
+        self.polled.clear()
+        self.selector.close()
@@ -0,0 +1,320 @@
+import argparse
+import binascii
+import os
+import random
+import select
+import socket
+import threading
+import time
+
+from samples import Sample
+from serial_io import encode_sample_frame
+
+
+class VirtualINA219:
+    # Reproduces the serial protocol of codeArdiunoUNo.ino: the start-up
+    # banner, one block (or binary frame) per sample, and the delay, N, B/T
+    # and U / file-number / Q commands against a virtual SD card.
+    def __init__(self, rate=10.0, noise=0.02, sd_card=True, files=3, rows_per_file=50,
+                 binary=False, bus_voltage=5.0, current=12.5, shunt_ohms=0.1, seed=None):
+        self.delay_ms = max(1, int(round(1000.0 / rate)))
+        self.noise = noise
+        self.sd_card = sd_card
+        self.binary = binary
+        self.bus_voltage = bus_voltage
+        self.current = current
+        self.shunt_ohms = shunt_ohms
+        self.random = random.Random(seed)
+        self.index = 1
+        self.start_time = time.monotonic()
+        self.selecting_file = False
+        self.sd_files = {}
+        for number in range(1, files + 1):
+            self.sd_files[number] = [self.data_row(row, row * 2.5, *self.measure()) for row in range(1, rows_per_file + 1)]
+        self.file_number = files + 1
+
+    def measure(self):
+        current = self.current * (1 + self.random.gauss(0, self.noise))
+        bus = self.bus_voltage * (1 + self.random.gauss(0, self.noise / 10))
+        shunt = current * self.shunt_ohms
+        load = bus + shunt / 1000
+        return bus, shunt, load, current, bus * current
+
+    def data_row(self, index, seconds, bus, shunt, load, current, power):
+        # sprintf("%lu") and dtostrf(value, width, 2) as in loop()
+        return f"{index},{seconds:6.2f},{bus:5.2f},{shunt:5.2f},{load:5.2f},{current:5.2f},{power:5.2f}"
+
+    def banner(self):
+        lines = ["Starting up!"]
+        if self.sd_card:
+            lines += ["SD card initialized.", f"File: data{self.file_number}.txt"]
+        else:
+            lines.append("SD initialization failed!")
+        lines.append("INA219 initialized.")
+        return self.encode_lines(lines)
+
+    def sample(self):
+        seconds = (time.monotonic() - self.start_time)
+        bus, shunt, load, current, power = self.measure()
+        index = self.index
+        self.index += 1
+
+        data = ""
+        lines = []
+        if self.sd_card:
+            data = self.data_row(index, seconds, bus, shunt, load, current, power)
+            self.sd_files.setdefault(self.file_number, []).append(data)
+            if not self.binary:
+                lines.append("Write successful")
+        if self.binary:
+            return index, encode_sample_frame(Sample(float(index), seconds, bus, shunt, load, current, power))
+        lines += [
+            f"Index:         {index}",
+            f"Relative time: {seconds:.2f} s",
+            f"Bus Voltage:   {bus:.2f} V",
+            f"Shunt Voltage: {shunt:.2f} mV",
+            f"Load Voltage:  {load:.2f} V",
+            f"Current:       {current:.2f} mA",
+            f"Power:         {power:.2f} mW",
+            f"Data -> {data}",
+            "------------------------------",
+        ]
+        return index, self.encode_lines(lines)
+
+    def command(self, text):
+        text = text.strip().upper()
+        if self.selecting_file:
+            if text == "Q":
+                self.selecting_file = False
+                return b""
+            if not text:
+                return b""
+            number, _, offset = text.partition("@")
+            return self.send_file(to_int(number), to_int(offset))
+
+        delay = to_int(text)
+        if delay > 0:
+            self.delay_ms = delay
+            return self.encode_lines([f"New delay: {delay}"])
+        if text == "B":
+            self.binary = True
+            return self.encode_lines(["Binary mode"])
+        if text == "T":
+            self.binary = False
+            return self.encode_lines(["Text mode"])
+        if text == "N":
+            self.file_number += 1
+            return self.encode_lines([f"New file: data{self.file_number}.txt"])
+        if text == "U":
+            self.selecting_file = True
+            names = [f"data{number}.txt" for number in sorted(self.sd_files)]
+            return self.encode_lines(["Available data files:"] + names)
+        return b""
+
+    def send_file(self, number, offset=0):
+        if number not in self.sd_files:
+            return self.encode_lines(["File not found."])
+        content = self.encode_lines(self.sd_files[number])
+        offset = min(max(offset, 0), len(content))
+        sent = content[offset:]
+        records = len(self.sd_files[number])
+        header = f"File begin: data{number}.txt {len(content)} {offset}"
+        trailer = f"File end: {binascii.crc_hqx(content, 0xFFFF):X} {len(sent)} {records}"
+        return self.encode_lines([header]) + sent + self.encode_lines([trailer])
+
+    @staticmethod
+    def encode_lines(lines):
+        return "".join(f"{line}\r\n" for line in lines).encode()
+
+
+def to_int(text):
+    # String::toInt(): leading sign and digits, 0 if there are none
+    digits = ""
+    for position, char in enumerate(text):
+        if char.isdigit() or (position == 0 and char in "+-"):
+            digits += char
+        else:
+            break
+    try:
+        return int(digits)
+    except ValueError:
+        return 0
+
+
+class PtyTransport:
+    # Linux/macOS pseudo terminal; connect the GUI or SerialReader to .port
+    def __init__(self):
+        import tty
+        self.master, self.slave = os.openpty()
+        # Raw slave side: no echo of our own output back as commands
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+
+    def wait_for_client(self, stop_event):
+        return True
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            _, writable, _ = select.select([], [self.master], [], 1.0)
+            if not writable:
+                # Nobody is reading the port: drop, like the USB serial bridge
+                return
+            try:
+                view = view[os.write(self.master, view):]
+            except BlockingIOError:
+                continue
+
+    def read(self, timeout):
+        readable, _, _ = select.select([self.master], [], [], max(0, timeout))
+        if not readable:
+            return b""
+        return os.read(self.master, 4096)
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class SocketTransport:
+    # TCP server for pyserial's socket:// URLs; works on every platform
+    def __init__(self, host="127.0.0.1", port=0):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(1)
+        self.port = f"socket://{host}:{self.server.getsockname()[1]}"
+        self.client = None
+
+    def wait_for_client(self, stop_event):
+        self.server.settimeout(0.2)
+        while not stop_event.is_set():
+            try:
+                self.client, _ = self.server.accept()
+                self.client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                return True
+            except socket.timeout:
+                continue
+        return False
+
+    def write(self, data):
+        self.client.sendall(data)
+
+    def read(self, timeout):
+        readable, _, _ = select.select([self.client], [], [], max(0, timeout))
+        if not readable:
+            return b""
+        data = self.client.recv(4096)
+        if not data:
+            raise ConnectionError("client disconnected")
+        return data
+
+    def close(self):
+        if self.client:
+            self.client.close()
+        self.server.close()
+
+
+class Simulator:
+    # boot_delay mimics the Uno resetting when the port is opened; it also
+    # keeps the banner from being discarded by the host's open-time flush.
+    def __init__(self, device, transport, boot_delay=0.5):
+        self.device = device
+        self.transport = transport
+        self.boot_delay = boot_delay
+        self.port = transport.port
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.sent_times = {}
+        self.bytes_sent = 0
+        self.input_buffer = b""
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def send(self, data):
+        if data:
+            self.transport.write(data)
+            self.bytes_sent += len(data)
+
+    def run(self):
+        try:
+            if not self.transport.wait_for_client(self.stop_event):
+                return
+            if self.stop_event.wait(self.boot_delay):
+                return
+            self.device.start_time = time.monotonic()
+            self.send(self.device.banner())
+            next_sample = time.perf_counter()
+            while not self.stop_event.is_set():
+                if not self.device.selecting_file:
+                    index, data = self.device.sample()
+                    self.sent_times[index] = time.perf_counter()
+                    self.send(data)
+                    # checkSerialCommand() reads at most one line per loop
+                    line = self.read_line(0)
+                    if line is not None:
+                        self.send(self.device.command(line))
+                    next_sample += self.device.delay_ms / 1000.0
+                    self.wait(next_sample - time.perf_counter())
+                else:
+                    line = self.read_line(1.0)
+                    if line is not None:
+                        self.send(self.device.command(line))
+                    next_sample = time.perf_counter()
+        except (OSError, ConnectionError):
+            pass
+
+    def wait(self, delay):
+        # Input keeps arriving while the firmware sits in delay(); it is
+        # only buffered here, as in the Uno's serial RX buffer.
+        end = time.perf_counter() + delay
+        while not self.stop_event.is_set():
+            remaining = end - time.perf_counter()
+            if remaining <= 0:
+                return
+            self.input_buffer += self.transport.read(min(remaining, 0.1))
+
+    def read_line(self, timeout):
+        if b"\n" not in self.input_buffer:
+            self.input_buffer += self.transport.read(timeout)
+        if b"\n" not in self.input_buffer:
+            return None
+        line, self.input_buffer = self.input_buffer.split(b"\n", 1)
+        return line.decode('utf-8', errors='ignore')
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        self.transport.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Virtual INA219 / Arduino Uno for the Serial Monitor")
+    parser.add_argument("--transport", choices=["pty", "socket"], default="pty" if os.name == "posix" else "socket")
+    parser.add_argument("--tcp-port", type=int, default=0)
+    parser.add_argument("--rate", type=float, default=0.4, help="samples per second (firmware default: 2500 ms delay)")
+    parser.add_argument("--noise", type=float, default=0.02)
+    parser.add_argument("--binary", action="store_true", help="start in binary frame mode")
+    parser.add_argument("--no-sd", action="store_true", help="simulate a missing SD card")
+    args = parser.parse_args()
+
+    transport = PtyTransport() if args.transport == "pty" else SocketTransport(port=args.tcp_port)
+    device = VirtualINA219(rate=args.rate, noise=args.noise, sd_card=not args.no_sd, binary=args.binary)
+    simulator = Simulator(device, transport).start()
+    print(f"Virtual INA219 on {simulator.port} (Ctrl+C to stop)")
+    try:
+        while simulator.thread.is_alive():
+            simulator.thread.join(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import math
+from collections import deque
+
+import numpy as np
+
+
+class RunningStats:
+    # Welford's online mean and variance, plus min, max and RMS
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.sum_squares = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.sum_squares += value * value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def std(self):
+        return math.sqrt(max(self.m2, 0.0) / self.count) if self.count else 0.0
+
+    def rms(self):
+        return math.sqrt(self.sum_squares / self.count) if self.count else 0.0
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        return {"count": self.count, "mean": self.mean, "min": self.min, "max": self.max,
+                "rms": self.rms(), "std": self.std()}
+
+    @classmethod
+    def from_array(cls, values):
+        stats = cls()
+        if len(values):
+            values = np.asarray(values, dtype=np.float64)
+            stats.count = len(values)
+            stats.mean = float(values.mean())
+            stats.m2 = float(np.square(values - stats.mean).sum())
+            stats.sum_squares = float(np.square(values).sum())
+            stats.min = float(values.min())
+            stats.max = float(values.max())
+        return stats
+
+
+class WindowStats(RunningStats):
+    # The same figures over the last `seconds` of sample time. Welford runs
+    # forwards on add and backwards when a sample leaves the window; min and
+    # max come from monotonic deques, so each sample is O(1) amortised.
+    def __init__(self, seconds=10.0):
+        self.seconds = seconds
+        super().__init__()
+
+    def reset(self):
+        super().reset()
+        self.values = deque()
+        self.minima = deque()
+        self.maxima = deque()
+        self.sequence = 0
+
+    def add(self, time, value):
+        if self.values and time < self.values[-1][1]:
+            # Board reset: its clock started again
+            self.reset()
+        sequence = self.sequence
+        self.sequence += 1
+        self.values.append((sequence, time, value))
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.sum_squares += value * value
+
+        while self.minima and self.minima[-1][1] >= value:
+            self.minima.pop()
+        self.minima.append((sequence, value))
+        while self.maxima and self.maxima[-1][1] <= value:
+            self.maxima.pop()
+        self.maxima.append((sequence, value))
+
+        oldest = time - self.seconds
+        while self.values[0][1] < oldest:
+            _, _, old = self.values.popleft()
+            self.count -= 1
+            delta = old - self.mean
+            self.mean -= delta / self.count
+            self.m2 -= delta * (old - self.mean)
+            self.sum_squares -= old * old
+        first = self.values[0][0]
+        while self.minima[0][0] < first:
+            self.minima.popleft()
+        while self.maxima[0][0] < first:
+            self.maxima.popleft()
+        self.min = self.minima[0][1]
+        self.max = self.maxima[0][1]
+
+    def rms(self):
+        return math.sqrt(max(self.sum_squares, 0.0) / self.count) if self.count else 0.0
+
+
+class SessionStats:
+    # Energy (mWh), charge (mAh) and current/power statistics for the whole
+    # session and for a sliding window, updated per sample. Energy and
+    # charge are trapezoids between consecutive samples; a step back in
+    # time (board reset) is not integrated.
+    def __init__(self, window_seconds=10.0):
+        self.window_seconds = window_seconds
+        self.reset()
+
+    def reset(self):
+        self.current = RunningStats()
+        self.power = RunningStats()
+        self.window_current = WindowStats(self.window_seconds)
+        self.window_power = WindowStats(self.window_seconds)
+        self.energy_mwh = 0.0
+        self.charge_mah = 0.0
+        self.duration = 0.0
+        self.last = None
+
+    def add(self, sample):
+        if self.last is not None:
+            last_time, last_current, last_power = self.last
+            dt = sample.time - last_time
+            if dt > 0:
+                self.energy_mwh += (last_power + sample.power) * dt / 7200.0
+                self.charge_mah += (last_current + sample.current) * dt / 7200.0
+                self.duration += dt
+        self.last = (sample.time, sample.current, sample.power)
+        self.current.add(sample.current)
+        self.power.add(sample.power)
+        self.window_current.add(sample.time, sample.current)
+        self.window_power.add(sample.time, sample.power)
+
+    # SamplePipeline sink
+    add_sample = add
+
+    def summary(self):
+        return {
+            "samples": self.current.count,
+            "duration_s": self.duration,
+            "energy_mwh": self.energy_mwh,
+            "charge_mah": self.charge_mah,
+            "current_ma": self.current.summary(),
+            "power_mw": self.power.summary(),
+            "window_s": self.window_seconds,
+            "window_current_ma": self.window_current.summary(),
+            "window_power_mw": self.window_power.summary(),
+        }
+
+    @classmethod
+    def from_arrays(cls, time, current, power, window_seconds=10.0):
+        # Stats of a stored session in a few vectorised passes instead of
+        # replaying it sample by sample; only the last window is replayed.
+        stats = cls(window_seconds)
+        time = np.asarray(time, dtype=np.float64)
+        current = np.asarray(current, dtype=np.float64)
+        power = np.asarray(power, dtype=np.float64)
+        if not len(time):
+            return stats
+        stats.current = RunningStats.from_array(current)
+        stats.power = RunningStats.from_array(power)
+        dt = np.diff(time)
+        forward = dt > 0
+        stats.duration = float(dt[forward].sum())
+        stats.energy_mwh = float(((power[:-1] + power[1:]) * dt)[forward].sum() / 7200.0)
+        stats.charge_mah = float(((current[:-1] + current[1:]) * dt)[forward].sum() / 7200.0)
+        stats.last = (float(time[-1]), float(current[-1]), float(power[-1]))
+
+        # The window starts after the last step back in time, if any
+        start = np.flatnonzero(dt < 0)[-1] + 1 if (dt < 0).any() else 0
+        start = max(start, int(np.searchsorted(time[start:], time[-1] - window_seconds)) + start)
+        for sample_time, sample_current, sample_power in zip(
+                time[start:].tolist(), current[start:].tolist(), power[start:].tolist()):
+            stats.window_current.add(sample_time, sample_current)
+            stats.window_power.add(sample_time, sample_power)
+        return stats
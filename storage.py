@@ -0,0 +1,587 @@
+import bisect
+import csv
+import datetime
+import json
+import os
+import queue
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from pipeline import SamplePipeline
+from samples import Sample, sample_row
+from stats import SessionStats
+
+
+CSV_HEADER = ["Index", "Relative time", "Bus Voltage(V)", "Shunt Voltage(mV)", "Load Voltage(V)", "Current(mA)", "Power(mW)"]
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# One 32-byte record per sample, in the firmware's "Data ->" column order
+SAMPLE_DTYPE = np.dtype([
+    ("index", "<u4"),
+    ("time", "<f8"),
+    ("bus_voltage", "<f4"),
+    ("shunt_voltage", "<f4"),
+    ("load_voltage", "<f4"),
+    ("current", "<f4"),
+    ("power", "<f4"),
+])
+
+
+class WritePolicy:
+    # When buffered rows are committed to disk: after flush_rows rows, after
+    # flush_interval seconds, or both (whichever comes first). fsync makes
+    # each commit durable; background moves the writes onto a writer thread
+    # fed by a bounded queue (a full queue blocks the producer).
+    def __init__(self, flush_rows=1, flush_interval=None, fsync=False, background=False, queue_size=10000):
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.background = background
+        self.queue_size = queue_size
+
+    def __repr__(self):
+        parts = [f"rows={self.flush_rows}"]
+        if self.flush_interval:
+            parts.append(f"interval={self.flush_interval * 1000:.0f}ms")
+        if self.fsync:
+            parts.append("fsync")
+        if self.background:
+            parts.append(f"background(queue={self.queue_size})")
+        return f"WritePolicy({', '.join(parts)})"
+
+
+WRITE_POLICIES = {
+    "Every row": WritePolicy(flush_rows=1),
+    "Group commit": WritePolicy(flush_rows=100, flush_interval=1.0),
+    "Background": WritePolicy(flush_rows=100, flush_interval=1.0, background=True),
+    "Durable (fsync)": WritePolicy(flush_rows=100, flush_interval=1.0, fsync=True, background=True),
+}
+
+DEFAULT_WRITE_POLICY = "Group commit"
+
+
+class RowWriter:
+    _stop = object()
+
+    def __init__(self, file, policy=None):
+        self.file = file
+        self.writer = csv.writer(file)
+        self.policy = policy or WRITE_POLICIES[DEFAULT_WRITE_POLICY]
+        self.pending = 0
+        self.last_commit = time.monotonic()
+        self.lock = threading.Lock()
+        self.queue = None
+        self.thread = None
+        self.stopped = threading.Event()
+        if self.policy.background:
+            self.queue = queue.Queue(maxsize=self.policy.queue_size)
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        elif self.policy.flush_interval:
+            # Rows are written on the caller's thread, but the time-based
+            # commit must not wait for the next row: the board may go quiet
+            self.thread = threading.Thread(target=self.commit_when_due, daemon=True)
+            self.thread.start()
+
+    def add_sample(self, sample):
+        self.writerow(sample_row(sample))
+
+    def writerow(self, row):
+        if self.queue is not None:
+            self.queue.put(row)
+        else:
+            with self.lock:
+                self.write(row)
+
+    def write(self, row):
+        self.writer.writerow(row)
+        self.pending += 1
+        interval = self.policy.flush_interval
+        if self.pending >= self.policy.flush_rows or (interval and time.monotonic() - self.last_commit >= interval):
+            self.commit()
+
+    def commit(self):
+        if self.pending:
+            self.file.flush()
+            if self.policy.fsync:
+                os.fsync(self.file.fileno())
+            self.pending = 0
+        self.last_commit = time.monotonic()
+
+    def run(self):
+        while True:
+            try:
+                row = self.queue.get(timeout=self.policy.flush_interval)
+            except queue.Empty:
+                with self.lock:
+                    self.commit()
+                continue
+            try:
+                if row is self._stop:
+                    break
+                with self.lock:
+                    self.write(row)
+            except Exception as e:
+                print(f"Error writing row: {e}")
+            finally:
+                self.queue.task_done()
+
+    def commit_when_due(self):
+        interval = self.policy.flush_interval
+        due = interval
+        while not self.stopped.wait(due):
+            with self.lock:
+                due = self.last_commit + interval - time.monotonic()
+                if due <= 0:
+                    self.commit()
+                    due = interval
+
+    def flush(self):
+        # Blocks until every queued row is written, then commits them
+        if self.queue is not None:
+            self.queue.join()
+        with self.lock:
+            self.commit()
+
+    def close(self):
+        if self.thread is not None and self.thread.is_alive():
+            if self.queue is not None:
+                self.queue.put(self._stop)
+            else:
+                self.stopped.set()
+            self.thread.join()
+        with self.lock:
+            self.commit()
+
+
+class SessionCheckpoint:
+    # Appends new bytes of a growing source file to a durable session file.
+    # After each append the session file is fsynced and the committed length
+    # is recorded in a marker file (written to a temp name, then renamed),
+    # so after a crash the session file is cut back to the last complete
+    # checkpoint and copying resumes from the matching source offset.
+    def __init__(self, path):
+        self.path = path
+        self.marker_path = path + ".offset"
+        self.committed = 0
+        self.source_offset = 0
+        self.recover()
+
+    def recover(self):
+        if not os.path.exists(self.marker_path):
+            return
+        try:
+            with open(self.marker_path, 'r') as marker:
+                state = json.load(marker)
+            self.committed = int(state["committed"])
+            self.source_offset = int(state["source_offset"])
+        except (ValueError, KeyError, OSError) as e:
+            print(f"Ignoring unreadable checkpoint marker {self.marker_path}: {e}")
+            self.committed = 0
+            self.source_offset = 0
+        if os.path.exists(self.path) and os.path.getsize(self.path) > self.committed:
+            with open(self.path, 'r+b') as session_file:
+                session_file.truncate(self.committed)
+
+    def append_from(self, source_path):
+        end = os.path.getsize(source_path)
+        if end <= self.source_offset:
+            return 0
+        with open(source_path, 'rb') as src_file, open(self.path, 'ab') as dst_file:
+            src_file.seek(self.source_offset)
+            copied = copy_range(src_file, dst_file, end - self.source_offset)
+            dst_file.flush()
+            os.fsync(dst_file.fileno())
+        self.committed += copied
+        self.source_offset += copied
+        self.write_marker()
+        return copied
+
+    def write_marker(self):
+        write_json(self.marker_path, {"committed": self.committed, "source_offset": self.source_offset})
+
+
+def write_json(path, data):
+    # Temp name, fsync, rename: readers never see a half-written file
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w') as json_file:
+        json.dump(data, json_file, indent=1)
+        json_file.flush()
+        os.fsync(json_file.fileno())
+    os.replace(temp_path, path)
+
+
+def stats_path(session_path):
+    # data.csv -> data.stats.json
+    return os.path.splitext(session_path)[0] + ".stats.json"
+
+
+def copy_range(src_file, dst_file, length):
+    copied = 0
+    while copied < length:
+        chunk = src_file.read(min(COPY_CHUNK_SIZE, length - copied))
+        if not chunk:
+            break
+        dst_file.write(chunk)
+        copied += len(chunk)
+    return copied
+
+
+class SessionStore:
+    # Fixed-size binary records in a growable memory-mapped file. The header
+    # holds the committed record count; records past it that carry a
+    # non-zero index (the firmware counts from 1) are recovered on reopen,
+    # so a crash loses at most a torn final record. Board resets (time
+    # stepping back) are noted as records are written and saved next to the
+    # store (session.ina -> session.runs.json) on flush, so a reopen only
+    # looks at the records written after the last flush. Slices returned by
+    # records() and __getitem__ are views into the map; so is time_range()
+    # unless the range is found on both sides of a board reset.
+    magic = b"INA219S1"
+    header_format = "<8sIIQ"
+    header_size = 64
+    recover_chunk = 4096
+    scan_chunk = 1 << 20
+
+    def __init__(self, path, mode="w+", initial_capacity=65536):
+        self.path = path
+        self.runs_path = os.path.splitext(path)[0] + ".runs.json"
+        self.readonly = mode == "r"
+        self.count = 0
+        # Positions where time steps back (board reset)
+        self.resets = []
+        self.last_time = None
+        if mode == "w+" or not os.path.exists(path):
+            with open(path, "wb") as file:
+                file.truncate(self.header_size + initial_capacity * SAMPLE_DTYPE.itemsize)
+            self.file = open(path, "r+b")
+            self.write_header()
+            self.write_runs()
+        else:
+            self.file = open(path, "rb" if self.readonly else "r+b")
+            magic, version, record_size, self.count = struct.unpack_from(
+                self.header_format, self.file.read(self.header_size))
+            if magic != self.magic or record_size != SAMPLE_DTYPE.itemsize:
+                self.file.close()
+                raise ValueError(f"{path} is not a session store")
+        self.map()
+        if mode != "w+":
+            self.recover()
+
+    def map(self):
+        capacity = (os.path.getsize(self.path) - self.header_size) // SAMPLE_DTYPE.itemsize
+        self.capacity = capacity
+        self.mmap = np.memmap(self.path, dtype=SAMPLE_DTYPE, mode="r" if self.readonly else "r+",
+                              offset=self.header_size, shape=(capacity,))
+
+    def recover(self):
+        # Resets up to the last flush from the runs file (all of them for a
+        # store without one), then records written after it, a chunk at a
+        # time up to the first one never written
+        scanned = 0
+        try:
+            with open(self.runs_path) as runs_file:
+                runs = json.load(runs_file)
+            if runs["count"] <= self.count:
+                self.resets = [position for position in runs["resets"] if position < runs["count"]]
+                scanned = runs["count"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        index = self.mmap["index"]
+        while self.count < self.capacity:
+            empty = np.flatnonzero(index[self.count:self.count + self.recover_chunk] == 0)
+            if len(empty):
+                self.count += int(empty[0])
+                break
+            self.count = min(self.capacity, self.count + self.recover_chunk)
+        self.scan_resets(scanned)
+
+    def scan_resets(self, first):
+        # Resets among the records from `first` on, read a chunk at a time
+        times = self.mmap["time"]
+        for start in range(max(1, first), self.count, self.scan_chunk):
+            stop = min(self.count, start + self.scan_chunk)
+            steps = times[start:stop] - times[start - 1:stop - 1]
+            self.resets.extend((np.flatnonzero(steps < 0) + start).tolist())
+        self.last_time = float(times[self.count - 1]) if self.count else None
+
+    def write_header(self):
+        self.file.seek(0)
+        self.file.write(struct.pack(self.header_format, self.magic, 1, SAMPLE_DTYPE.itemsize, self.count))
+
+    def write_runs(self):
+        write_json(self.runs_path, {"count": self.count, "resets": self.resets})
+
+    def grow(self, needed):
+        capacity = max(1, self.capacity)
+        while capacity < needed:
+            capacity *= 2
+        self.mmap.flush()
+        # The old map has to be released before the file can be resized on
+        # Windows; views handed out earlier stay valid on POSIX only.
+        self.mmap = None
+        self.file.truncate(self.header_size + capacity * SAMPLE_DTYPE.itemsize)
+        self.map()
+
+    def append(self, values):
+        if self.count == self.capacity:
+            self.grow(self.count + 1)
+        self.mmap[self.count] = values
+        time_value = values[1]
+        if self.last_time is not None and time_value < self.last_time:
+            self.resets.append(self.count)
+        self.last_time = time_value
+        self.count += 1
+
+    # SamplePipeline sink: a Sample is a record in SAMPLE_DTYPE order
+    add_sample = append
+
+    def extend(self, rows):
+        rows = np.asarray(rows, dtype=SAMPLE_DTYPE)
+        if self.count + len(rows) > self.capacity:
+            self.grow(self.count + len(rows))
+        self.mmap[self.count:self.count + len(rows)] = rows
+        first = self.count
+        self.count += len(rows)
+        self.scan_resets(first)
+
+    def __len__(self):
+        return self.count
+
+    def records(self):
+        return self.mmap[:self.count]
+
+    def __getitem__(self, key):
+        return self.records()[key]
+
+    def stats(self, window_seconds=10.0):
+        records = self.records()
+        return SessionStats.from_arrays(records["time"], records["current"], records["power"], window_seconds)
+
+    def runs(self):
+        # Start positions of the runs of non-decreasing time; the board's
+        # clock starts again from zero after a reset
+        return [0] + self.resets
+
+    def time_range(self, start_time, end_time):
+        # Records with start_time <= time <= end_time, bisected within each
+        # run of time and kept in record order. bisect reads only the ~log n
+        # records it probes; np.searchsorted would copy the strided column.
+        records = self.records()
+        times = records["time"]
+        bounds = self.runs() + [self.count]
+        parts = []
+        for first, stop in zip(bounds, bounds[1:]):
+            low = bisect.bisect_left(times, start_time, first, stop)
+            high = bisect.bisect_right(times, end_time, low, stop)
+            if high > low:
+                parts.append(records[low:high])
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return records[:0]
+        return np.concatenate(parts)
+
+    def export_csv(self, target_filename, start=0, stop=None, chunk_size=100000):
+        stop = self.count if stop is None else min(stop, self.count)
+        with open(target_filename, "w", newline="", encoding="utf-8") as dst_file:
+            csv.writer(dst_file).writerow(CSV_HEADER)
+            for first in range(start, stop, chunk_size):
+                chunk = self.mmap[first:min(first + chunk_size, stop)]
+                np.savetxt(dst_file, np.column_stack([chunk[name] for name in SAMPLE_DTYPE.names]),
+                           fmt=["%d"] + ["%.2f"] * 6, delimiter=",")
+
+    def flush(self):
+        if self.readonly:
+            return
+        self.mmap.flush()
+        self.write_header()
+        self.file.flush()
+        self.write_runs()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.mmap = None
+        self.file.close()
+
+    def delete(self):
+        # A scratch store: nothing to flush, the store and its runs file go
+        # (also called from __del__ at exit, when builtins may be gone)
+        if not self.file.closed:
+            self.mmap = None
+            self.file.close()
+        for path in (self.path, self.runs_path):
+            try:
+                os.unlink(path)
+            except:
+                pass
+
+
+def csv_row(values):
+    # A line or list of values -> one row of CSV_HEADER's width: short rows
+    # padded, long ones cut; text without commas stays a one-field row
+    if isinstance(values, str):
+        if ',' not in values:
+            return [values]
+        values = values.strip().split(',')
+    elif not isinstance(values, (list, tuple)):
+        return [str(values)]
+    values = [str(value) for value in values[:len(CSV_HEADER)]]
+    return values + [""] * (len(CSV_HEADER) - len(values))
+
+
+class TempCsvFile:
+    # A CSV under CSV_HEADER in a temp file, written through a RowWriter,
+    # until it is saved somewhere; removed when dropped
+    def __init__(self, policy=None):
+        self.temp_file = tempfile.NamedTemporaryFile(mode='w+', delete=False, suffix='.csv', encoding='utf-8', newline='')
+        self.filename = self.temp_file.name
+        self.writer = RowWriter(self.temp_file, policy)
+        self.writer.writerow(CSV_HEADER)
+        self.data_count = 0
+
+    def add_data(self, values):
+        self.writer.writerow(csv_row(values))
+        self.data_count += 1
+
+    def save_to_file(self, target_filename):
+        self.writer.flush()
+        shutil.copyfile(self.filename, target_filename)
+        return True
+
+    def __del__(self):
+        if getattr(self, 'temp_file', None):
+            self.writer.close()
+            self.temp_file.close()
+            try:
+                os.unlink(self.filename)
+            except:
+                pass
+
+
+class DataManager(TempCsvFile):
+    # The live session. Each sample goes once through self.pipeline to the
+    # temp CSV, the binary store and the statistics; the GUI attaches the
+    # plot and the archive to the same pipeline.
+    def __init__(self, policy=None, binary_store=True, metrics=None):
+        super().__init__(policy)
+        self.store = SessionStore(os.path.splitext(self.filename)[0] + ".ina") if binary_store else None
+        self.checkpoint_count = 0
+        self.session = None
+        self.stats = SessionStats()
+        self.metrics = metrics
+        self.pipeline = SamplePipeline(metrics)
+        self.pipeline.attach("csv", self.writer)
+        self.pipeline.attach("store", self.store)
+        self.pipeline.attach("stats", self.stats)
+
+    def add_data(self, values):
+        # A row (list or CSV line) that makes a full sample goes through the
+        # pipeline like any other; anything else is kept in the CSV only,
+        # padded like TempCsvFile does, since it has no sample to give
+        row = csv_row(values)
+        try:
+            sample = Sample(*(float(value) for value in row))
+        except (ValueError, TypeError):
+            super().add_data(values)
+            return
+        self.add_sample(sample)
+
+    def add_sample(self, sample, display=True):
+        # Counted even when a sink failed: the others have the sample
+        self.data_count += 1
+        self.pipeline.push(sample, display)
+
+    def checkpoint(self, session_path):
+        # Appends only the rows written since the previous checkpoint
+        self.writer.flush()
+        if self.store is not None:
+            self.store.flush()
+        if self.session is None or self.session.path != session_path:
+            self.session = SessionCheckpoint(session_path)
+        self.session.append_from(self.filename)
+        write_json(stats_path(session_path), self.stats.summary())
+        new_rows = self.data_count - self.checkpoint_count
+        self.checkpoint_count = self.data_count
+        return new_rows
+
+    def save_to_file(self, target_filename):
+        super().save_to_file(target_filename)
+        if self.stats.current.count:
+            write_json(stats_path(target_filename), self.stats.summary())
+        return True
+
+    def __del__(self):
+        super().__del__()
+        if getattr(self, 'store', None) is not None:
+            self.store.delete()
+
+
+def safe_file_name(text):
+    # COM3, /dev/ttyUSB0, socket://127.0.0.1:7000 -> usable file name parts
+    return re.sub(r"[^\w.-]+", "_", text).strip("_.") or "device"
+
+
+class RotatingSessionWriter:
+    # Streams samples into <prefix>_<timestamp>_<part>.csv files, starting a
+    # new part once the current one exceeds max_bytes or max_seconds.
+    def __init__(self, directory, prefix="capture", max_bytes=None, max_seconds=None, policy=None, metrics=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.policy = policy
+        self.metrics = metrics
+        self.part = 0
+        self.file = None
+        self.filename = None
+        self.data_count = 0
+        self.open_next()
+
+    def open_next(self):
+        self.close()
+        self.part += 1
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.filename = os.path.join(self.directory, f"{self.prefix}_{timestamp}_{self.part:03d}.csv")
+        self.file = open(self.filename, 'w', newline='', encoding='utf-8')
+        self.writer = RowWriter(self.file, self.policy)
+        self.writer.writerow(CSV_HEADER)
+        self.bytes_written = len(",".join(CSV_HEADER)) + 2
+        self.opened_at = time.monotonic()
+
+    def should_rotate(self):
+        if self.max_bytes and self.bytes_written >= self.max_bytes:
+            return True
+        return bool(self.max_seconds) and time.monotonic() - self.opened_at >= self.max_seconds
+
+    def add_sample(self, sample):
+        if self.should_rotate():
+            self.open_next()
+        row = sample_row(sample)
+        start = time.perf_counter()
+        self.writer.writerow(row)
+        if self.metrics:
+            self.metrics.stages["write"].observe(time.perf_counter() - start)
+        # Estimated from the row text; csv adds a separator per field and \r\n
+        self.bytes_written += sum(len(value) for value in row) + len(row) + 1
+        self.data_count += 1
+
+    def flush(self):
+        if self.file:
+            self.writer.flush()
+
+    def close(self):
+        if self.file:
+            self.writer.close()
+            self.file.close()
+            self.file = None
@@ -0,0 +1,208 @@
+import binascii
+import os
+import shutil
+import time
+from collections import deque
+
+from storage import CSV_HEADER, COPY_CHUNK_SIZE
+
+
+class FileDownload:
+    # Receives one SD file (FileHeader, bytes chunks, FileTrailer from
+    # FrameDecoder) into a .part file. The part file is kept when a transfer
+    # stalls, so the next request can resume from its size; the trailer's
+    # CRC covers the whole file, old and new bytes alike. The part file
+    # starts with the CSV header line, so a finished download is moved into
+    # place rather than copied.
+    def __init__(self, file_number, part_path, target=None):
+        self.file_number = file_number
+        self.part_path = part_path
+        self.target = target
+        self.prefix = (",".join(CSV_HEADER) + "\r\n").encode('utf-8')
+        self.file = None
+        self.header = None
+        self.records = None
+        self.crc = 0xFFFF
+        self.received = 0
+        self.started = None
+        self.finished = None
+        self.verified = False
+
+    def offset(self):
+        try:
+            return max(0, os.path.getsize(self.part_path) - len(self.prefix))
+        except OSError:
+            return 0
+
+    def request(self):
+        # Timed from the request: that is what the user waits for
+        self.started = time.monotonic()
+        self.finished = None
+        self.header = None
+        offset = self.offset()
+        return f"{self.file_number}@{offset}" if offset else f"{self.file_number}"
+
+    def begin(self, header):
+        self.header = header
+        self.verified = False
+        self.file = open(self.part_path, 'a+b')
+        # The board may start earlier than asked (or from 0 on a file that
+        # changed size); drop whatever it is going to send again.
+        keep = min(header.offset, self.offset())
+        if keep:
+            self.file.truncate(len(self.prefix) + keep)
+        else:
+            self.file.truncate(0)
+            self.file.write(self.prefix)
+        self.file.seek(len(self.prefix))
+        self.crc = 0xFFFF
+        while True:
+            chunk = self.file.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            self.crc = binascii.crc_hqx(chunk, self.crc)
+        if self.file.tell() != len(self.prefix) + header.offset:
+            # Local copy is shorter than the offset the board used
+            self.close()
+            return False
+        self.received = 0
+        if self.started is None:
+            self.started = time.monotonic()
+        return True
+
+    def write(self, chunk):
+        self.file.write(chunk)
+        self.crc = binascii.crc_hqx(chunk, self.crc)
+        self.received += len(chunk)
+
+    def finish(self, trailer):
+        self.finished = time.monotonic()
+        self.records = trailer.records if trailer.records is not None else self.header.records
+        self.verified = (trailer.crc == self.crc and trailer.length == self.received
+                         and self.header.offset + self.received == self.header.size)
+        if not self.verified:
+            # No way to tell which bytes are bad: start over next time
+            self.file.truncate(0)
+        self.close()
+        return self.verified
+
+    def waiting_for_data(self):
+        # Header in, none of the file's bytes yet: on a resume the board
+        # reads the part the host already has before it sends the rest
+        return (self.header is not None and not self.received
+                and self.header.offset < self.header.size)
+
+    def progress(self):
+        if not self.header or not self.header.size:
+            return 0.0
+        return (self.header.offset + self.received) / self.header.size
+
+    def throughput(self):
+        if self.started is None:
+            return 0.0
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return self.received / elapsed if elapsed > 0 else 0.0
+
+    def save_to_file(self, target_filename):
+        self.close()
+        shutil.move(self.part_path, target_filename)
+        return True
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def discard(self):
+        self.close()
+        try:
+            os.unlink(self.part_path)
+        except OSError:
+            pass
+
+    def __del__(self):
+        # A part file next to its target is kept for a later resume
+        if self.target:
+            self.close()
+        else:
+            self.discard()
+
+
+class DownloadQueue:
+    # Several SD files over one link. Up to `window` requests are kept
+    # outstanding so the board starts the next file right after the
+    # previous trailer, without a round trip; the firmware handles them in
+    # order, so incoming pieces always belong to the oldest request. Only
+    # one request goes out until the first header proves the board speaks
+    # the framed protocol (old firmware would run the files together). A
+    # file rejected at its header is still sent by the board; its bytes are
+    # dropped until its trailer.
+    def __init__(self, downloads, window=2):
+        self.waiting = deque(downloads)
+        self.in_flight = deque()
+        self.window = window
+        self.framed = False
+        self.total = len(self.waiting)
+        self.done = []
+        self.failed = []
+        self.bytes_received = 0
+        self.started = time.monotonic()
+
+    def requests(self):
+        commands = []
+        limit = self.window if self.framed else 1
+        while self.waiting and len(self.in_flight) < limit:
+            download = self.waiting.popleft()
+            commands.append(download.request())
+            self.in_flight.append(download)
+        return commands
+
+    def current(self):
+        return self.in_flight[0] if self.in_flight else None
+
+    def begin(self, header):
+        self.framed = True
+        return self.current().begin(header)
+
+    def write(self, chunk):
+        download = self.current()
+        if download.file:
+            download.write(chunk)
+            self.bytes_received += len(chunk)
+
+    def finish(self, trailer):
+        download = self.in_flight.popleft()
+        if download.file and download.finish(trailer):
+            if download.target:
+                download.save_to_file(download.target)
+            self.done.append(download)
+        else:
+            self.failed.append(download)
+        return download
+
+    def fail(self):
+        download = self.in_flight.popleft()
+        download.close()
+        self.failed.append(download)
+        return download
+
+    def abort(self):
+        # Stalled link: everything not finished stays resumable
+        for download in self.in_flight:
+            download.close()
+        self.failed.extend(self.in_flight)
+        self.failed.extend(self.waiting)
+        self.in_flight.clear()
+        self.waiting.clear()
+
+    def is_finished(self):
+        return not self.waiting and not self.in_flight
+
+    def progress(self):
+        current = self.current()
+        finished = len(self.done) + len(self.failed)
+        return (finished + (current.progress() if current else 0.0)) / self.total if self.total else 1.0
+
+    def throughput(self):
+        elapsed = time.monotonic() - self.started
+        return self.bytes_received / elapsed if elapsed > 0 else 0.0